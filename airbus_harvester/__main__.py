@@ -1,35 +1,82 @@
 from __future__ import annotations
 
+import contextlib
 import copy
+import datetime
+import functools
 import hashlib
 import json
 import logging
 import os
+import signal
+import sys
+import threading
 import time
 import traceback
 import uuid
+from collections.abc import Container, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from json import JSONDecodeError
+from types import MappingProxyType
 from typing import Any
 
 import click
-import requests
+from botocore.config import Config as BotoConfig
 from eodhp_utils.aws.s3 import get_file_s3, upload_file_s3
 from eodhp_utils.runner import get_boto3_session, get_pulsar_client, setup_logging
-from inflection import underscore
 from pulsar import ConnectError
 from requests.exceptions import ConnectionError, HTTPError, Timeout
 
-from airbus_harvester.airbus_harvester_messager import AirbusHarvesterMessager
+from airbus_harvester.airbus_harvester_messager import AirbusHarvesterMessager, messager_write_workers
+from airbus_harvester.async_engine import AsyncEngine, async_harvest_pages
+from airbus_harvester.auth import token_manager
+from airbus_harvester.batching import MessageBatch
+from airbus_harvester.extent import CollectionExtent, parse_datetime
+from airbus_harvester.geometry import page_geometry
+from airbus_harvester.hashing import (
+    DocumentHasher,
+    FeatureFingerprinter,
+    HashScheme,
+    configured_hash_scheme,
+    hash_scheme_key,
+    join_stored_hash,
+    legacy_format_key,
+    split_stored_hash,
+)
+from airbus_harvester.http_client import http_client, page_retry_delay
+from airbus_harvester.key_index import KeyIndex
+from airbus_harvester.metadata import MetadataStore
+from airbus_harvester.metrics import HarvestMetrics, export_metrics
+from airbus_harvester.pagination import PageCursor, date_format, harvest_pages, page_cursors
+from airbus_harvester.profiling import HarvestProfiler
+from airbus_harvester.serialization import canonical_dumps, loads
+from airbus_harvester.transformer import ItemTransformer
 
 setup_logging(verbosity=2)  # DEBUG level
 
 
 minimum_message_entries = int(os.environ.get("MINIMUM_MESSAGE_ENTRIES", 100))
+# A message is also sent once the harvested documents add up to this many bytes, or the oldest has
+# waited this many seconds. 0 disables either limit
+message_max_bytes = int(os.environ.get("MESSAGE_MAX_BYTES", 4 * 1024 * 1024))
+message_max_age_seconds = float(os.environ.get("MESSAGE_MAX_AGE_SECONDS", 300))
+# A checkpoint is also saved once this many pages have been harvested, or this many seconds have
+# passed, since the last one, even if too few documents have changed to send a message. 0 disables
+# either limit
+checkpoint_interval_pages = int(os.environ.get("CHECKPOINT_INTERVAL_PAGES", 100))
+checkpoint_interval_seconds = float(os.environ.get("CHECKPOINT_INTERVAL_SECONDS", 300))
 proxy_base_url = os.environ.get("PROXY_BASE_URL", "")
-max_api_retries = int(os.environ.get("MAX_API_RETRIES", 5))
 
 commercial_catalogue_root = os.getenv("COMMERCIAL_CATALOGUE_ROOT", "commercial")
 
+# Minimum number of messages between updates to the collection, other than the first and last
+collection_publish_interval = int(os.environ.get("COLLECTION_PUBLISH_INTERVAL", 1))
+
+# Incremental harvests re-request items updated this long before the previous harvest's newest item
+incremental_overlap_hours = float(os.environ.get("INCREMENTAL_OVERLAP_HOURS", 24))
+# Incremental harvests fall back to a full harvest, which detects deletions, at least this often
+full_harvest_interval_days = float(os.environ.get("FULL_HARVEST_INTERVAL_DAYS", 7))
+
 
 def load_config(config_path: str) -> Any:
     with open(config_path) as f:
@@ -50,24 +97,233 @@ def cli() -> None:
 @click.argument("workspace_name", type=str)
 @click.argument("catalog", type=str)  # not currently used but keeping the same structure as the other harvester repos
 @click.argument("s3_bucket", type=str)
-def harvest(workspace_name: str, catalog: str, s3_bucket: str) -> None:
+@click.option(
+    "--incremental/--full",
+    default=False,
+    envvar="HARVEST_INCREMENTAL",
+    help="Only harvest items updated since the previous harvest. Deletions are not detected",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(["sync", "async"]),
+    default="sync",
+    envvar="HARVEST_ENGINE",
+    help="Fetch pages with threads (sync) or an asyncio event loop (async, requires httpx)",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    envvar="HARVEST_RESUME",
+    help="Continue from the checkpoint saved by an interrupted harvest, if there is one",
+)
+@click.option(
+    "--profile",
+    type=click.Choice(["off", "sample", "cprofile"]),
+    default="off",
+    envvar="HARVEST_PROFILE",
+    help="Profile the harvest by sampling stacks (written as collapsed stacks) or with cProfile (written as pstats)",
+)
+@click.option(
+    "--profile-pages",
+    type=int,
+    default=0,
+    envvar="HARVEST_PROFILE_PAGES",
+    help="Stop profiling after this many pages. The whole harvest if 0",
+)
+@click.option(
+    "--profile-seconds",
+    type=float,
+    default=0,
+    envvar="HARVEST_PROFILE_SECONDS",
+    help="Stop profiling after this many seconds. The whole harvest if 0",
+)
+@click.option(
+    "--profile-dir",
+    default="",
+    envvar="HARVEST_PROFILE_DIR",
+    help="Local directory the profile is written to. Uploaded to the S3 bucket under harvest-profiles/ if not given",
+)
+def harvest(
+    workspace_name: str,
+    catalog: str,
+    s3_bucket: str,
+    incremental: bool,
+    engine: str,
+    resume: bool,
+    profile: str,
+    profile_pages: int,
+    profile_seconds: float,
+    profile_dir: str,
+) -> None:
     """Harvest a given Airbus catalog, and all records beneath it. Send a pulsar message
     containing all added, updated, and deleted links since the last time the catalog was
     harvested"""
 
-    s3_client = get_boto3_session().client("s3")
+    s3_client = make_s3_client()
 
     config_key = os.getenv("HARVESTER_CONFIG_KEY", "")
     config = load_config("airbus_harvester/config.json").get(config_key.upper())
+    if config is None:
+        raise click.ClickException(f"Configuration key {config_key!r} not found in config file")
+
+    profiler = None
+    if profile != "off":
+        profiler = HarvestProfiler(profile, profile_pages, profile_seconds, profile_dir)
+        profiler.start()
 
+    with stop_on_sigterm():
+        try:
+            harvest_collection(
+                config_key,
+                config,
+                s3_bucket,
+                s3_client,
+                incremental=incremental,
+                engine=engine,
+                resume=resume,
+                profiler=profiler,
+            )
+        except HarvestInterrupted:
+            sys.exit(128 + signal.SIGTERM)
+        finally:
+            # Failed and interrupted harvests are profiled too. A failure to save the profile is
+            # only logged, so it does not hide the harvest's own result
+            if profiler:
+                try:
+                    profiler.save(config_key.lower() or "harvest", s3_bucket, s3_client)
+                except Exception:
+                    logging.exception("Failed to save harvest profile")
+
+
+@cli.command("harvest-all")
+@click.argument("workspace_name", type=str)
+@click.argument("catalog", type=str)  # not currently used but keeping the same structure as the other harvester repos
+@click.argument("s3_bucket", type=str)
+@click.option(
+    "--config-keys",
+    default="",
+    envvar="HARVESTER_CONFIG_KEYS",
+    help="Comma separated config keys of the collections to harvest. All collections if not given",
+)
+@click.option(
+    "--incremental/--full",
+    default=False,
+    envvar="HARVEST_INCREMENTAL",
+    help="Only harvest items updated since the previous harvest. Deletions are not detected",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(["sync", "async"]),
+    default="sync",
+    envvar="HARVEST_ENGINE",
+    help="Fetch pages with threads (sync) or an asyncio event loop (async, requires httpx)",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    envvar="HARVEST_RESUME",
+    help="Continue from the checkpoint saved by an interrupted harvest, if there is one",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=0,
+    envvar="HARVEST_COLLECTION_WORKERS",
+    help="Number of collections harvested at once. All of them if 0",
+)
+def harvest_all(
+    workspace_name: str,
+    catalog: str,
+    s3_bucket: str,
+    config_keys: str,
+    incremental: bool,
+    engine: str,
+    resume: bool,
+    workers: int,
+) -> None:
+    """Harvest several Airbus collections concurrently in one process. The collections share the
+    S3 client, Pulsar client, HTTP connection pools, access tokens and per-host request budget"""
+    configs = load_config("airbus_harvester/config.json")
+    keys = [key.strip().upper() for key in config_keys.split(",") if key.strip()] or list(configs)
+    if unknown := [key for key in keys if key not in configs]:
+        raise click.BadParameter(f"Configuration keys {unknown} not found in config file", param_hint="--config-keys")
+
+    s3_client = make_s3_client(workers or len(keys))
+    pulsar_client = get_pulsar_client()
+    async_engine = AsyncEngine() if engine == "async" else None
+
+    failed = []
+    interrupted = []
+    try:
+        with (
+            stop_on_sigterm(),
+            ThreadPoolExecutor(max_workers=workers or len(keys), thread_name_prefix="airbus-harvest") as executor,
+        ):
+            futures = {
+                key: executor.submit(
+                    harvest_collection,
+                    key,
+                    configs[key],
+                    s3_bucket,
+                    s3_client,
+                    pulsar_client,
+                    incremental,
+                    engine,
+                    async_engine,
+                    resume,
+                )
+                for key in keys
+            }
+            for key, future in futures.items():
+                try:
+                    future.result()
+                except HarvestInterrupted:
+                    interrupted.append(key)
+                except Exception:
+                    logging.exception(f"Harvest of {key} failed")
+                    failed.append(key)
+    finally:
+        if async_engine:
+            async_engine.close()
+
+    if interrupted:
+        logging.warning(f"Harvests stopped before finishing, to be resumed: {', '.join(interrupted)}")
+        sys.exit(128 + signal.SIGTERM)
+    if failed:
+        raise click.ClickException(f"Harvests failed: {', '.join(failed)}")
+
+
+def make_s3_client(collections: int = 1) -> Any:
+    """An S3 client with enough pooled connections for the concurrent writes of each collection
+    harvested at once, and its metadata uploads"""
+    connections = max(10, (messager_write_workers + 1) * collections)
+    return get_boto3_session().client("s3", config=BotoConfig(max_pool_connections=connections))
+
+
+def harvest_collection(
+    config_key: str,
+    config: dict,
+    s3_bucket: str,
+    s3_client: Any,
+    pulsar_client: Any = None,
+    incremental: bool = False,
+    engine: str = "sync",
+    async_engine: AsyncEngine | None = None,
+    resume: bool = False,
+    profiler: HarvestProfiler | None = None,
+) -> None:
+    """Harvests one Airbus collection. The Pulsar client and async engine are created if not given,
+    or can be shared with other collections harvested at the same time. If resuming, an interrupted
+    harvest of the collection is continued from its checkpoint. A profiler, if given, is told when
+    each page has been harvested so it can stop after a number of pages"""
     topic = os.getenv("TOPIC")
     identifier = f"_{topic}" if topic else ""
 
     def get_pulsar_producer(retry_count: int = 0) -> Any:
         """Initialise pulsar producer. Retry if connection fails"""
         try:
-            pulsar_client = get_pulsar_client()
-            producer = pulsar_client.create_producer(
+            client = pulsar_client or get_pulsar_client()
+            producer = client.create_producer(
                 topic=f"harvested{identifier}",
                 producer_name=f"stac_harvester/airbus/{config['collection_name']}_{uuid.uuid1().hex}",
                 chunking_enabled=True,
@@ -87,175 +343,309 @@ def harvest(workspace_name: str, catalog: str, s3_bucket: str) -> None:
 
     s3_root = "git-harvester/"
 
-    if not config:
-        logging.warning(f"Configuration key {config_key} not found in config file.")
-
     airbus_harvester_messager = AirbusHarvesterMessager(
         s3_client=s3_client,
         output_bucket=s3_bucket,
         cat_output_prefix=s3_root,
         producer=producer,
+        write_workers=messager_write_workers,
     )
 
-    harvested_data = {}
-    current_harvest_keys = set()
+    harvested_data = MessageBatch(minimum_message_entries, message_max_bytes, message_max_age_seconds)
 
     logging.info(f"Harvesting from Airbus {config_key}")
 
     key_root = f"{commercial_catalogue_root}/catalogs/airbus"
 
     metadata_s3_key = f"harvested-metadata/{config['collection_name']}"
-    current_harvest_metadata = get_file_data(s3_bucket, metadata_s3_key, s3_client)
-    previous_harvest_metadata = copy.deepcopy(current_harvest_metadata)
+    item_key_prefix = f"{key_root}/collections/{config['collection_name']}/items/"
+    metrics = HarvestMetrics(config["collection_name"])
+    metadata_store = MetadataStore(s3_client, s3_bucket, metadata_s3_key, item_key_prefix, metrics=metrics)
+    with metrics.time("metadata"):
+        current_harvest_metadata = metadata_store.load()
+    # Only the keys of the previous harvest are needed, to find deleted items
+    previous_harvest_keys = KeyIndex.snapshot(current_harvest_metadata, item_key_prefix)
+    current_harvest_keys = KeyIndex(item_key_prefix)
     logging.info(f"Previously harvested URLs: {current_harvest_metadata}")
     latest_harvested = {}
 
+    harvest_start_time = datetime.datetime.now(datetime.UTC).strftime(date_format)
+    watermark = current_harvest_metadata.get("watermark") or {}
+    latest_update_time = watermark.get("last_update")
+    since = get_incremental_start(watermark, config) if incremental else None
+
+    checkpoint = metadata_store.load_checkpoint() if resume else None
+    if checkpoint:
+        # Continue the interrupted harvest as if it had not stopped, including the keys it had seen
+        # so that they are not treated as deleted
+        harvest_start_time = checkpoint["started"]
+        since = checkpoint["since"]
+        latest_update_time = checkpoint["last_update"]
+        current_harvest_keys.update(checkpoint["seen_keys"])
+        logging.info(f"Resuming harvest started at {harvest_start_time}, {len(checkpoint['seen_keys'])} keys seen")
+    else:
+        if resume:
+            logging.info("No checkpoint found. Running a new harvest")
+        metadata_store.clear_checkpoint()
+    if since:
+        logging.info(f"Incremental harvest of items updated since {since}")
+
+    previous_hash_scheme = HashScheme.from_metadata(current_harvest_metadata)
+    volatile_fields = config.get("volatile_fields", [])
+    hasher = DocumentHasher(previous_hash_scheme, configured_hash_scheme(volatile_fields=volatile_fields))
+    # With a refresh interval, changes to only volatile fields are held back and published together
+    # by a full harvest once the interval has passed, rather than never being published
+    hold_volatile = bool(volatile_fields and config.get("volatile_refresh_days"))
+    refresh_volatile = hold_volatile and not since and is_volatile_refresh_due(watermark, config)
+    if refresh_volatile:
+        logging.info("Publishing items with changes to volatile fields")
+
     catalogue_data = make_catalogue()
     catalogue_key = f"{key_root}.json"
     previous_hash = current_harvest_metadata.get(catalogue_key)
     current_harvest_keys.add(catalogue_key)
-    file_hash = get_file_hash(json.dumps(catalogue_data))
-    if not previous_hash or previous_hash != file_hash:
+    document = canonical_dumps(catalogue_data)
+    file_hash = hasher.hash(catalogue_data, document)
+    if not hasher.is_unchanged(previous_hash, file_hash, catalogue_data, document):
         # URL was not harvested previously
         logging.info(f"Added: {catalogue_key}")
-        harvested_data[catalogue_key] = catalogue_data
-        latest_harvested[catalogue_key] = file_hash
+        harvested_data.add(catalogue_key, document)
+    latest_harvested[catalogue_key] = file_hash
 
     collection_key = f"{key_root}/collections/{config['collection_name']}.json"
     current_harvest_keys.add(collection_key)
 
-    is_first_harvest = True
-    old_catalogue_data_summary: dict = {"start_time": [], "stop_time": [], "coordinates": []}
+    old_collection_extent = None
     old_collection_data = get_file_data(s3_bucket, f"{s3_root}{collection_key}", s3_client)
     logging.info(f"Found previous collection data in {s3_bucket}: {collection_key}, {old_collection_data}")
 
     if old_collection_data:
-        is_first_harvest = False
-        start_time = old_collection_data["extent"]["temporal"]["interval"][0][0].split(".")[0]
-        stop_time = old_collection_data["extent"]["temporal"]["interval"][0][1].split(".")[0]
-
-        bbox = old_collection_data["extent"]["spatial"]["bbox"][0]
-        coordinates = [[bbox[0], bbox[1]], [bbox[2], bbox[3]]]
+        old_collection_extent = CollectionExtent.from_collection(old_collection_data)
+        logging.info(f"Previous harvest data recovered: {old_collection_extent.to_dict()}")
+
+    collection_extent = CollectionExtent.from_dict(current_harvest_metadata.get("summary"))
+    # Use old extent if it exists - likely to be more accurate during harvest
+    summary_extent = old_collection_extent or collection_extent
+    collection_dirty = True
+    batches_since_collection = 0
+
+    def update_collection(force: bool = False) -> None:
+        """Regenerates the collection from the current extent, adding it to the next message if it
+        has changed since it was last sent"""
+        nonlocal collection_dirty
+        collection_dirty = False
+        summary = get_stac_collection_summary(summary_extent)
+        if not summary:
+            return
 
-        old_catalogue_data_summary = {
-            "start_time": [f"{start_time.rstrip('Z')}Z"],
-            "stop_time": [f"{stop_time.rstrip('Z')}Z"],
-            "coordinates": coordinates,
-        }
-        logging.info(f"Previous harvest data recovered: {old_catalogue_data_summary}")
-
-    catalogue_data_summary = current_harvest_metadata.get("summary")
-    if not catalogue_data_summary:
-        catalogue_data_summary = {"start_time": [], "stop_time": [], "coordinates": []}
-
-    next_url = config["url"]
-    url_count = 0
+        collection_data = generate_stac_collection(summary, config)
+        previous_hash = latest_harvested.get(collection_key) or current_harvest_metadata.get(collection_key)
+        document = canonical_dumps(collection_data)
+        file_hash = hasher.hash(collection_data, document)
+        if force or previous_hash != file_hash:
+            logging.info(f"Added: {collection_key}")
+            harvested_data.add(collection_key, document)
+            latest_harvested[collection_key] = file_hash
 
-    while next_url:
-        url_count += 1
+    transformer = ItemTransformer(config, proxy_base_url, commercial_catalogue_root)
+    fingerprinter = FeatureFingerprinter(hasher.scheme, transformer.signature(), config.get("update_time_key"))
 
-        body = get_next_page(next_url, config)
+    if checkpoint:
+        cursors = [PageCursor.from_position(config, position) for position in checkpoint["windows"]]
+        if config["pagination_method"] == "counter":
+            # Items updated while the harvest was stopped have moved ahead of the saved positions
+            now = datetime.datetime.now(datetime.UTC).strftime(date_format)
+            cursors.append(PageCursor(config, (harvest_start_time, now)))
+    else:
+        cursors = page_cursors(config, since)
+    # Where each window has been paged through to, and the keys seen since the last checkpoint
+    window_positions = [cursor.position() for cursor in cursors]
+    checkpoint_seen: list[str] = []
+    pages_since_checkpoint = 0
+    last_checkpoint = time.monotonic()
+
+    def fetch(url: str, config: dict) -> dict:
+        with metrics.time("fetch"):
+            return get_next_page(url, config, metrics=metrics)
+
+    if async_engine:
+        pages = async_engine.pages(config, cursors=cursors, metrics=metrics)
+    elif engine == "async":
+        pages = async_harvest_pages(config, cursors=cursors, metrics=metrics)
+    else:
+        pages = harvest_pages(config, fetch, cursors=cursors)
+
+    def publish(deleted_keys: list[str]) -> None:
+        """Writes the harvested documents and deletes the deleted keys from S3, streaming the
+        documents to the messager when it writes them concurrently, and sends a message listing them"""
+        metrics.count("messages")
+        metrics.count("bytes_out", harvested_data.size)
+        with metrics.time("publish"):
+            airbus_harvester_messager.consume({"harvested_data": harvested_data.drain(), "deleted_keys": deleted_keys})
+
+    def finish(status: str) -> None:
+        """Writes a report of the harvest next to its metadata, and exports its metrics"""
+        metrics.finish(status)
+        report = metrics.report()
+        logging.info(f"Harvest report: {report}")
+        upload_file_s3(canonical_dumps(report), s3_bucket, f"{metadata_s3_key}.report.json", s3_client)
+        export_metrics(metrics)
+
+    def send_batch() -> None:
+        """Sends a message with the documents harvested since the last one, then saves the changed
+        metadata and a checkpoint to resume from"""
+        nonlocal latest_harvested, batches_since_collection, pages_since_checkpoint, last_checkpoint
+        # Collection is regenerated, at most every collection_publish_interval messages, so that
+        # start/stop times and bbox values are the latest ones from the Airbus catalogue
+        if collection_dirty and batches_since_collection + 1 >= collection_publish_interval:
+            update_collection()
+
+        latest_harvested["summary"] = collection_extent.to_dict()
+
+        for key, value in latest_harvested.items():
+            current_harvest_metadata[key] = value
+
+        batches_since_collection = 0 if collection_key in harvested_data else batches_since_collection + 1
+        if harvested_data:
+            # Send message for altered keys
+            logging.info(f"Sending message with {len(harvested_data)} entries ({harvested_data.size} bytes)")
+            publish([])
+        # Only the changed keys are uploaded, in the background
+        logging.info(f"Appending {len(latest_harvested)} keys to metadata in S3")
+        metadata_store.append(latest_harvested)
+        if metadata_store.needs_compaction():
+            metadata_store.compact(current_harvest_metadata, wait=False)
+        metadata_store.save_checkpoint(
+            {
+                "started": harvest_start_time,
+                "since": since,
+                "last_update": latest_update_time,
+                "windows": window_positions,
+            },
+            checkpoint_seen,
+        )
+        checkpoint_seen.clear()
+        latest_harvested = {}
+        pages_since_checkpoint = 0
+        last_checkpoint = time.monotonic()
+
+    def checkpoint_due() -> bool:
+        """Whether enough pages or time have passed since the last checkpoint to save another. Stops
+        a harvest of mostly unchanged items, which rarely fills a batch, from losing all its progress
+        if it is killed"""
+        return (checkpoint_interval_pages > 0 and pages_since_checkpoint >= checkpoint_interval_pages) or (
+            checkpoint_interval_seconds > 0 and time.monotonic() - last_checkpoint >= checkpoint_interval_seconds
+        )
+
+    for url_count, page in enumerate(metrics.timed(pages, "page_wait"), start=1):
+        metrics.count("pages")
+        page_url, body = page.url, page.body
         features = body.get("features", [])
         logging.info(f"Page {url_count} features: {len(features)}")
 
-        entry: dict = {}
-        for entry in features:
-            data = generate_stac_item(entry, config)
+        geometry = page_geometry(features)
+        for entry, bbox in zip(features, geometry.bboxes, strict=True):
+            latest_update_time = get_latest_update_time(latest_update_time, entry, config)
             try:
-                file_name = f"{entry['properties'][config['item_id_key']]}.json"
-                key = f"{key_root}/collections/{config['collection_name']}/items/{file_name}"
-                current_harvest_keys.add(key)
-
-                previous_hash = current_harvest_metadata.get(key)
-                file_hash = get_file_hash(json.dumps(data))
-
-                if not previous_hash or previous_hash != file_hash:
+                key = f"{item_key_prefix}{entry['properties'][config['item_id_key']]}.json"
+            except KeyError:
+                logging.error(f"Invalid entry in {page_url}")
+                continue
+            current_harvest_keys.add(key)
+            checkpoint_seen.append(key)
+
+            stored = current_harvest_metadata.get(key)
+            previous_hash, previous_fingerprint = split_stored_hash(stored)
+            fingerprint = fingerprinter.fingerprint(entry)
+
+            if fingerprinter.should_skip(previous_fingerprint, fingerprint):
+                # The Airbus feature is unchanged, so the item generated from it would be too
+                logging.info(f"Skipping: {key}")
+                metrics.count("items_skipped")
+                data = transformer.item_times(entry)
+            else:
+                with metrics.time("transform"):
+                    data = transformer.transform(entry, bbox)
+                with metrics.time("hash"):
+                    document = canonical_dumps(data)
+                    file_hash = hasher.hash(data, document)
+                    unchanged = hasher.is_unchanged(previous_hash, file_hash, data, document)
+                # The feature changed but the item did not, other than its volatile fields. Fingerprints
+                # are salted with the hash scheme, so while it is being migrated they all differ from
+                # the stored ones and do not show whether the feature changed
+                volatile_change = (
+                    unchanged
+                    and hold_volatile
+                    and not hasher.migrating
+                    and previous_fingerprint not in (None, fingerprint)
+                )
+
+                if not unchanged or (volatile_change and refresh_volatile):
+                    if previous_fingerprint == fingerprint:
+                        fingerprinter.mismatched += 1
+                        logging.warning(f"Item changed despite an unchanged fingerprint: {key}")
                     # Data was not harvested previously
                     logging.info(f"Added: {key}")
-                    harvested_data[key] = data
-                    latest_harvested[key] = file_hash
+                    metrics.count("items_updated" if previous_hash else "items_added")
+                    harvested_data.add(key, document)
                 else:
                     logging.info(f"Skipping: {key}")
-            except KeyError:
-                logging.error(f"Invalid entry in {next_url}")
-
-            # Update both summaries (if an old one does exist)
-            catalogue_data_summary = add_to_catalogue_data_summary(catalogue_data_summary, data)
-            if not is_first_harvest:
-                old_catalogue_data_summary = add_to_catalogue_data_summary(old_catalogue_data_summary, data)
-
-        catalogue_data_summary = simplify_catalogue_data_summary(catalogue_data_summary)
-        if not is_first_harvest:
-            old_catalogue_data_summary = simplify_catalogue_data_summary(old_catalogue_data_summary)
-
-        if config["pagination_method"] == "link":
-            links = body.get("_links")
-            if links is None:
-                msg_text = f"Missing '_links' in response from {next_url}"
-                logging.error(msg_text)
-                raise AttributeError(msg_text)
-            next_url = links.get("next")
-        elif config["pagination_method"] == "counter":
-            if not features:
-                next_url = None
-            else:
-                # The counter can only go up to 50. Limit the search by last update date
-                if (url_count + 1) % 50 == 0:
-                    config["body"]["lastUpdateDate"] = (
-                        f"[2018-10-03T12:00:00Z,{entry['properties']['lastUpdateDate']}]"
-                    )
-                config["body"]["startPage"] = (url_count % 50) + 1
-
-        logging.info(f"Page {url_count} next URL: {next_url}")
-
-        # Use old summary if it exists - likely to be more accurate during harvest
-        if is_first_harvest:
-            summary = get_stac_collection_summary(catalogue_data_summary)
-        else:
-            summary = get_stac_collection_summary(old_catalogue_data_summary)
-
-        # Collection updates every loop so that start/stop times and bbox values are the latest
-        # ones from the Airbus catalogue
-        collection_data = generate_stac_collection(summary, config)
-        last_run_hash = latest_harvested.get(collection_key)
-        previous_hash = last_run_hash or current_harvest_metadata.get(collection_key)
+                    metrics.count("items_skipped")
+                    if volatile_change:
+                        # Keeping the old fingerprint leaves the item to be published by the next refresh
+                        fingerprint = previous_fingerprint
+
+                if (stored_value := join_stored_hash(file_hash, fingerprint)) != stored:
+                    # New or changed, stored with a previous hash scheme, or without a fingerprint
+                    latest_harvested[key] = stored_value
+
+            # Update both extents (if an old one does exist). The collection only needs regenerating
+            # if the one it is generated from changed
+            changed = collection_extent.add_item_times(data)
+            if old_collection_extent:
+                changed = old_collection_extent.add_item_times(data)
+            collection_dirty |= changed
+
+        changed = collection_extent.add_bbox(geometry.page_bbox)
+        if old_collection_extent:
+            changed = old_collection_extent.add_bbox(geometry.page_bbox)
+        collection_dirty |= changed
 
-        file_hash = get_file_hash(json.dumps(collection_data))
         # Make sure collection level is sent during first message. Only send changes after that
-        if url_count == 1 or (not previous_hash or previous_hash != file_hash):
-            # Data was not harvested previously
-            logging.info(f"Added: {collection_key}")
-            harvested_data[collection_key] = collection_data
-            latest_harvested[collection_key] = file_hash
+        if url_count == 1:
+            update_collection(force=True)
 
-        latest_harvested["summary"] = catalogue_data_summary
+        window_positions[page.window] = page.position
+        pages_since_checkpoint += 1
 
-        if len(harvested_data.keys()) >= minimum_message_entries:
-            # Send message for altered keys
-            msg = {
-                "harvested_data": harvested_data,
-                "deleted_keys": [],
-            }
+        if harvested_data.is_full() or checkpoint_due():
+            send_batch()
+
+        if profiler:
+            profiler.page_done()
 
-            for key, value in latest_harvested.items():
-                current_harvest_metadata[key] = value
+        if stop_requested.is_set():
+            # Everything harvested so far is sent and saved, so the harvest can be resumed from here
+            logging.warning(f"Stopping harvest of {config_key} after page {url_count}. Saving a checkpoint")
+            send_batch()
+            metadata_store.close()
+            finish("interrupted")
+            raise HarvestInterrupted(f"Harvest of {config_key} stopped at page {url_count}")
 
-            logging.info(f"Sending message with {len(harvested_data.keys())} entries")
-            airbus_harvester_messager.consume(msg)
-            logging.info(f"Uploading metadata to S3: {len(current_harvest_metadata)} items")
-            upload_file_s3(json.dumps(current_harvest_metadata), s3_bucket, metadata_s3_key, s3_client)
-            logging.info("Uploaded metadata to S3")
-            harvested_data = {}
-            latest_harvested = {}
+    logging.info(f"Fingerprints: {fingerprinter.summary()}")
 
     # Make sure new collection is sent in final message
-    summary = get_stac_collection_summary(catalogue_data_summary)
-    collection_data = generate_stac_collection(summary, config)
-    file_hash = get_file_hash(json.dumps(collection_data))
+    if summary := get_stac_collection_summary(collection_extent):
+        collection_data = generate_stac_collection(summary, config)
+        document = canonical_dumps(collection_data)
+        file_hash = hasher.hash(collection_data, document)
 
-    logging.info(f"Added: {collection_key}")
-    harvested_data[collection_key] = collection_data
-    latest_harvested[collection_key] = file_hash
+        logging.info(f"Added: {collection_key}")
+        harvested_data.add(collection_key, document)
+        latest_harvested[collection_key] = file_hash
+    else:
+        logging.warning(f"No items harvested for {collection_key}. Collection not updated")
+    latest_harvested["summary"] = collection_extent.to_dict()
 
     # Any leftover items not sent during final loop because the minimum wasn't met
     logging.info(f"Adding final keys: {len(current_harvest_metadata)} items")
@@ -263,8 +653,27 @@ def harvest(workspace_name: str, catalog: str, s3_bucket: str) -> None:
         current_harvest_metadata[key] = value
         current_harvest_keys.add(key)
 
-    # Compare items harvested this run to the ones harvested in the previous run to find deletions
-    deleted_keys = find_deleted_keys(current_harvest_keys, previous_harvest_metadata)
+    # Only stored at the end of a run so that an interrupted harvest is not treated as complete
+    current_harvest_metadata["watermark"] = {
+        "last_update": latest_update_time,
+        "last_full_harvest": watermark.get("last_full_harvest") if since else harvest_start_time,
+        "last_volatile_refresh": harvest_start_time if refresh_volatile else watermark.get("last_volatile_refresh"),
+    }
+    current_harvest_keys.add("watermark")
+    # Incremental harvests leave some hashes from the previous scheme in place, so the previous
+    # scheme is kept until a full harvest has rehashed everything
+    hash_scheme = previous_hash_scheme if since else hasher.scheme
+    current_harvest_metadata[hash_scheme_key] = hash_scheme.to_metadata()
+    current_harvest_keys.update((hash_scheme_key, legacy_format_key))
+    current_harvest_metadata.pop(legacy_format_key, None)
+
+    if since:
+        # Items not updated since the watermark were not requested, so deletions can't be detected.
+        # These are handled by the next full harvest
+        deleted_keys = []
+    else:
+        # Compare items harvested this run to the ones harvested in the previous run to find deletions
+        deleted_keys = list(find_deleted_keys(current_harvest_keys, previous_harvest_keys))
 
     logging.info(f"Removing {len(deleted_keys)} deleted keys: {len(current_harvest_metadata)} items")
     for key in deleted_keys:
@@ -272,19 +681,97 @@ def harvest(workspace_name: str, catalog: str, s3_bucket: str) -> None:
     logging.info(f"Deleted keys removed: {len(current_harvest_metadata)} items")
 
     # Send message for altered keys
-    msg = {"harvested_data": harvested_data, "deleted_keys": deleted_keys}
-
-    logging.info(f"Sending message with {len(harvested_data.keys())} entries and {len(deleted_keys)} deleted keys")
-    airbus_harvester_messager.consume(msg)
+    logging.info(f"Sending message with {len(harvested_data)} entries and {len(deleted_keys)} deleted keys")
+    metrics.count("items_deleted", len(deleted_keys))
+    publish(deleted_keys)
 
     logging.info(f"Uploading metadata to S3: {len(current_harvest_metadata)} items")
-    upload_file_s3(json.dumps(current_harvest_metadata), s3_bucket, metadata_s3_key, s3_client)
+    metadata_store.compact(current_harvest_metadata)
+    metadata_store.clear_checkpoint()
+    metadata_store.close()
     logging.info("Uploaded metadata to S3")
+    finish("succeeded")
+
+
+class HarvestInterrupted(Exception):
+    """Raised when a harvest stops early on SIGTERM, after saving a checkpoint to resume from"""
+
+
+# Set on SIGTERM, so that harvests stop at the end of the page they are processing
+stop_requested = threading.Event()
+
+
+@contextlib.contextmanager
+def stop_on_sigterm() -> Iterator[None]:
+    """Makes SIGTERM stop harvests once they have saved a checkpoint, rather than killing the process"""
+
+    def request_stop(signum: int, _frame: Any) -> None:
+        logging.warning(f"Received signal {signum}. Stopping after the current page")
+        stop_requested.set()
+
+    previous = signal.signal(signal.SIGTERM, request_stop)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        stop_requested.clear()
+
+
+def get_latest_update_time(latest: str | None, entry: dict, config: dict) -> str | None:
+    """Returns whichever is newer out of the latest update time seen so far and the entry's update time"""
+    update_time = entry["properties"].get(config.get("update_time_key", ""))
+    if not update_time:
+        return latest
+    try:
+        if not latest or parse_datetime(update_time) > parse_datetime(latest):
+            return update_time
+    except ValueError:
+        logging.warning(f"Invalid update time {update_time}")
+    return latest
+
+
+def get_incremental_start(watermark: dict, config: dict) -> str | None:
+    """Returns the last update date an incremental harvest should start from, allowing an overlap
+    with the previous harvest. Returns None if a full harvest is required instead"""
+    update_time_key = config.get("update_time_key")
+    body = config.get("body") or {}
+    if config["pagination_method"] != "counter" or body.get("sortBy") != f"-{update_time_key}":
+        logging.info(f"Incremental harvest not supported for {config['collection_name']}. Running full harvest")
+        return None
+
+    if not watermark.get("last_update"):
+        logging.info("No watermark found from a previous harvest. Running full harvest")
+        return None
+
+    now = datetime.datetime.now(datetime.UTC)
+    last_full_harvest = watermark.get("last_full_harvest")
+    if full_harvest_interval_days and (
+        not last_full_harvest
+        or now - parse_datetime(last_full_harvest) > datetime.timedelta(days=full_harvest_interval_days)
+    ):
+        logging.info(f"Last full harvest was at {last_full_harvest}. Running full harvest to detect deletions")
+        return None
 
+    start = parse_datetime(watermark["last_update"]) - datetime.timedelta(hours=incremental_overlap_hours)
+    return start.strftime(date_format)
 
-def find_deleted_keys(new: set, old: dict) -> list:
-    """Find differences between two dictionaries"""
-    return list(set(old).difference(new))
+
+def is_volatile_refresh_due(watermark: dict, config: dict) -> bool:
+    """Returns whether volatile_refresh_days have passed since items with changes to only their
+    volatile fields were last published"""
+    last_refresh = watermark.get("last_volatile_refresh")
+    if not last_refresh:
+        return True
+    now = datetime.datetime.now(datetime.UTC)
+    return now - parse_datetime(last_refresh) >= datetime.timedelta(days=config["volatile_refresh_days"])
+
+
+def find_deleted_keys(new: Container[str], old: Iterable[str]) -> Iterator[str]:
+    """Yields the keys in old which are not in new, comparing item IDs directly if both are
+    KeyIndexes"""
+    if isinstance(old, KeyIndex) and isinstance(new, KeyIndex):
+        return old.difference(new)
+    return (key for key in old if key not in new)
 
 
 def compare_to_previous_version(
@@ -313,124 +800,51 @@ def compare_to_previous_version(
     return harvested_keys, file_hash
 
 
-def add_to_catalogue_data_summary(all_data: dict, data: dict) -> dict:
-    """Combines new data with existing data for whole catalogue"""
-    all_data["coordinates"] += data["geometry"]["coordinates"][0]
-    all_data["start_time"].append(data["properties"].get("start_datetime", data["properties"].get("datetime")))
-    all_data["stop_time"].append(data["properties"].get("end_datetime", data["properties"].get("datetime")))
-
-    return all_data
-
-
-def simplify_catalogue_data_summary(all_data: dict) -> dict:
-    """Finds the coordinates containing bbox values, and start and stop time of all data so far"""
-
-    biggest_lat = smallest_lat = biggest_long = smallest_long = all_data["coordinates"][0]
-
-    for coordinates in all_data["coordinates"]:
-        # Clip to -90<lat<90 and <-180<long<180 if outside standard range
-        if coordinates[0] > 180:
-            coordinates[0] = 180
-        elif coordinates[0] < -180:
-            coordinates[0] = -180
-        if coordinates[1] > 90:
-            coordinates[1] = 90
-        elif coordinates[1] < -90:
-            coordinates[1] = -90
-
-        if coordinates[0] > biggest_long[0]:
-            biggest_long = coordinates
-        elif coordinates[0] < smallest_long[0]:
-            smallest_long = coordinates
-        if coordinates[1] > biggest_lat[1]:
-            biggest_lat = coordinates
-        elif coordinates[1] < smallest_lat[1]:
-            smallest_lat = coordinates
-
-    coordinates_summary = [biggest_lat, biggest_long, smallest_lat, smallest_long]
-
-    return {
-        "coordinates": coordinates_summary,
-        "start_time": [min(all_data["start_time"])],
-        "stop_time": [max(all_data["stop_time"])],
-    }
-
-
-def generate_access_token(env: str = "dev", retry_count: int = 0) -> str:
-    """Generate access token for Airbus API"""
-    if env == "prod":
-        url = "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token"
-    else:
-        url = "https://authenticate-int.idp.private.geoapi-airbusds.com/auth/realms/IDP/protocol/openid-connect/token"
-
-    api_key = os.environ["AIRBUS_API_KEY"]
-
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-    }
-
-    data = [
-        ("apikey", api_key),
-        ("grant_type", "api_key"),
-        ("client_id", "IDP"),
-    ]
-
-    try:
-        logging.info(f"Making POST request to {url} for access token")
-        response = requests.post(url, headers=headers, data=data, timeout=10)
-        logging.info(f"Response status code: {response.status_code}")
-        response.raise_for_status()
-        access_token = response.json().get("access_token")
-
-        if access_token:
-            return access_token
-        else:
-            raise ValueError("Access token is None")
-
-    except (ConnectionError, HTTPError, Timeout, ValueError) as e:
-        logging.error(e)
-        logging.error(traceback.format_exc())
-        if retry_count >= max_api_retries:
-            logging.error(f"Failed to generate access token after {retry_count + 1} attempts.")
-            raise
-
-        logging.error(f"Retrying access token generation. Attempt {retry_count + 1}")
-        time.sleep(2**retry_count)
-        return generate_access_token(env, retry_count=retry_count + 1)
-
-
-def get_next_page(url: str, config: dict, retry_count: int = 0) -> dict:
-    """Collects body of next page of Airbus data"""
+def get_next_page(
+    url: str,
+    config: dict,
+    retry_count: int = 0,
+    token_retried: bool = False,
+    metrics: HarvestMetrics | None = None,
+) -> dict:
+    """Collects body of next page of Airbus data, counting the bytes received and any retries in
+    the metrics, if given"""
 
     try:
         headers = {"accept": "application/json"}
+        access_token = None
         if config["auth_env"]:
-            access_token = generate_access_token(config["auth_env"])
+            access_token = token_manager.get_token(config["auth_env"])
             headers["Authorization"] = "Bearer " + access_token
 
         logging.info(f"Making {config['request_method'].upper()} request to {url} with body {config['body']}")
         if config["request_method"].upper() == "POST":
-            response = requests.post(url, json=config["body"], headers=headers, timeout=10)
+            response = http_client.post(url, json=config["body"], headers=headers)
         else:
-            response = requests.get(url, json=config["body"], headers=headers, timeout=10)
+            response = http_client.get(url, json=config["body"], headers=headers)
         logging.info(f"Response status code: {response.status_code}")
+        if response.status_code == 401 and access_token and not token_retried:
+            # Token may have been revoked or expired early. Retry once with a new one
+            logging.warning(f"Access token rejected by {url}. Retrying with a new token")
+            token_manager.invalidate(config["auth_env"], access_token)
+            return get_next_page(url, config, retry_count=retry_count, token_retried=True, metrics=metrics)
         response.raise_for_status()
 
-        return response.json()
+        if metrics:
+            metrics.count("bytes_in", len(response.content))
+        return loads(response.content)
 
     except (JSONDecodeError, ConnectionError, HTTPError, Timeout) as e:
         logging.error(e)
         logging.error(traceback.format_exc())
-        if retry_count > max_api_retries:
-            logging.error(f"Failed to obtain valid response after {retry_count + 1} attempts.")
+        delay = page_retry_delay(url, retry_count, metrics)
+        if delay is None:
             raise
-
-        logging.error(f"Retrying retrieval of {url}. Attempt {retry_count + 1}")
-        time.sleep(5**retry_count)
-        return get_next_page(url, config, retry_count=retry_count + 1)
+        time.sleep(delay)
+        return get_next_page(url, config, retry_count=retry_count + 1, token_retried=token_retried, metrics=metrics)
 
 
-def get_file_hash(data: str) -> str:
+def get_file_hash(data: str | bytes) -> str:
     """Returns hash of data available"""
 
     def _md5_hash(byte_str: bytes) -> str:
@@ -439,166 +853,56 @@ def get_file_hash(data: str) -> str:
         md5.update(byte_str)
         return md5.hexdigest()
 
-    return _md5_hash(data.encode("utf-8"))
+    return _md5_hash(data.encode("utf-8") if isinstance(data, str) else data)
 
 
 def get_file_data(bucket: str, key: str, s3_client: Any) -> dict:
     """Read file at given S3 location and parse as JSON"""
     previously_harvested = get_file_s3(bucket, key, s3_client)
-    try:
-        previously_harvested = json.loads(previously_harvested)
-    except TypeError:
-        previously_harvested = {}
-    return previously_harvested
-
+    if previously_harvested is None:
+        return {}
+    return loads(previously_harvested)
 
-def coordinates_to_bbox(coordinates: list) -> list:
-    """Finds the biggest and smallest x and y coordinates"""
 
-    unzipped = list(zip(*coordinates, strict=False))
+def get_stac_collection_summary(extent: CollectionExtent) -> dict:
+    """Gets the area and start/stop times of all data points. Empty if no data has been seen"""
+    if extent.is_empty():
+        return {}
 
-    max_values = [max(index) for index in unzipped]
-    min_values = [min(index) for index in unzipped]
+    return extent.to_dict()
 
-    return min_values + max_values
 
+@functools.cache
+def load_collection_template(collection_name: str) -> MappingProxyType:
+    """Loads the STAC collection template for a collection, with asset hrefs pointed at the proxy.
+    Cached, so the template is read once per process. The result must not be modified, including
+    its nested assets and links, so callers take a deep copy"""
+    stac_template = load_config(f"airbus_harvester/{collection_name}.json")
 
-def get_stac_collection_summary(all_data: dict) -> dict:
-    """Gets the area and start/stop times of all data points"""
-
-    bbox = coordinates_to_bbox(all_data["coordinates"])
-
-    return {
-        "bbox": bbox,
-        "start_time": min(all_data["start_time"]),
-        "stop_time": max(all_data["stop_time"]),
-    }
+    for _asset_name, asset in stac_template.get("assets", {}).items():
+        if "href" in asset:
+            asset["href"] = asset["href"].replace("{EODHP_BASE_URL}", proxy_base_url)
+    return MappingProxyType(stac_template)
 
 
 def generate_stac_collection(all_data_summary: dict, config: dict) -> dict:
     """Top level collection for Airbus data"""
 
-    stac_template = load_config(f"airbus_harvester/{config['collection_name']}.json")
-
-    stac_template["extent"] = {
-        "spatial": {"bbox": [all_data_summary["bbox"]]},
-        "temporal": {"interval": [[all_data_summary["start_time"], all_data_summary["stop_time"]]]},
-    }
-    for _asset_name, asset in stac_template.get("assets").items():
-        if "href" in asset:
-            asset["href"] = asset["href"].replace("{EODHP_BASE_URL}", proxy_base_url)
-    return stac_template
-
+    stac_template = copy.deepcopy(dict(load_collection_template(config["collection_name"])))
 
-def handle_external_url(
-    data: dict,
-    links: list,
-    assets: dict,
-    mapped_keys: set,
-    name: str,
-    path: str,
-    proxy: str | None = None,
-) -> None:
-    """Convert external URL to link and asset"""
-    mime_types = {
-        ".tiff": "image/tiff; application=geotiff; profile=cloud-optimized",
-        ".tif": "image/tiff; application=geotiff; profile=cloud-optimized",
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".png": "image/png",
+    return {
+        **stac_template,
+        "extent": {
+            "spatial": {"bbox": [all_data_summary["bbox"]]},
+            "temporal": {"interval": [[all_data_summary["start_time"], all_data_summary["stop_time"]]]},
+        },
     }
 
-    path_keys = path.split(".")
-    value = data
-    for path_key in path_keys:
-        value = value.get(path_key)
-        if value is None:
-            break
-    external_url = value if isinstance(value, str) else None
-
-    if external_url:
-        file_extension = os.path.splitext(external_url)[1].lower()
-        mime_type = mime_types.get(file_extension, "application/octet-stream")
-
-        def add_asset(rel_name: str, href: str) -> None:
-            assets[rel_name] = {"href": href, "type": mime_type}
-
-        if proxy:
-            proxy_url = f"{proxy}/{name}"
-            add_asset(f"external_{name}", external_url)
-            add_asset(name, proxy_url)
-        else:
-            add_asset(name, external_url)
-        mapped_keys.add(path_keys[-1])
-
-
-def modify_value(key: str, value: Any) -> Any:
-    """Modify a specific value to STAC format depending on the key"""
-    if key == "lookDirection":
-        # Convert look direction to human readable format
-        return "right" if value.upper() == "R" else "left" if value.upper() == "L" else value
-    elif key == "polarizationChannels":
-        # Split dual polarisation channels into separate values
-        return [value[i : i + 2] for i in range(0, len(value), 2)]
-    elif key == "geometry_centroid":
-        if isinstance(value, dict):
-            return value
-        # Convert list to dict for consistency throughout the catalogue
-        if isinstance(value, list) and len(value) == 2:
-            return {"lat": value[1], "lon": value[0]}
-        # Type not understood - ignore it
-        return None
-
-    return value
-
-
-def generate_stac_item(data: dict, config: dict) -> dict:
-    """Catalogue items for Airbus data"""
-    item_id = data["properties"][config["item_id_key"]]
-    logging.info(f"Processing item {item_id}")
-
-    coordinates = data["geometry"]["coordinates"][0]
-    bbox = coordinates_to_bbox(coordinates)
-
-    mapped_keys = set()
-    properties = config["stac_properties"].copy()
-
-    links = []
-    assets = {}
-
-    for stac_key, airbus_key in config["stac_properties_map"].items():
-        if (value := data["properties"].get(airbus_key)) not in [None, ""]:
-            properties[stac_key] = modify_value(airbus_key, value)
-            mapped_keys.add(airbus_key)
-
-    for url_config in config["external_urls"]:
-        proxy_url = None
-        if url_config.get("proxy", False):
-            proxy_url = (
-                f"{proxy_base_url}/api/catalogue/stac/{commercial_catalogue_root}/catalogs/airbus/"
-                f"collections/{config['collection_name']}/items/{item_id}"
-            )
-        handle_external_url(data, links, assets, mapped_keys, url_config["name"], url_config["path"], proxy_url)
-
-    for key, value in data["properties"].items():
-        if key not in mapped_keys and value not in [None, ""]:
-            property_key = underscore(key)
-            properties[property_key] = modify_value(property_key, value)
-
-    stac_item = {
-        "type": "Feature",
-        "stac_version": "1.0.0",
-        "stac_extensions": config["stac_extensions"],
-        "id": item_id,
-        "collection": config["collection_name"],
-        "geometry": {"type": "Polygon", "coordinates": [coordinates]},
-        "bbox": bbox,
-        "properties": properties,
-        "links": links,
-        "assets": assets,
-    }
 
-    return stac_item
+def generate_stac_item(data: dict, config: dict, bbox: list | None = None) -> dict:
+    """Catalogue items for Airbus data. The bbox is calculated from the geometry if not given.
+    Harvests should create an ItemTransformer once and reuse it for every item instead"""
+    return ItemTransformer(config, proxy_base_url, commercial_catalogue_root).transform(data, bbox)
 
 
 def make_catalogue() -> dict:
@@ -1,11 +1,34 @@
 from __future__ import annotations
 
 import json
-from collections.abc import Sequence
+import logging
+import os
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from typing import Any, cast
 
 from eodhp_utils.messagers import Messager
 
+# Number of S3 writes run at once for each message. 1 writes them one at a time
+messager_write_workers = int(os.environ.get("MESSAGER_WRITE_WORKERS", 1))
+# Number of deleted keys removed from S3 by each DeleteObjects request, which allows up to 1000. 0
+# deletes them one at a time
+messager_delete_batch_size = int(os.environ.get("MESSAGER_DELETE_BATCH_SIZE", 1000))
+max_delete_batch_size = 1000
+
+
+class OutputWriteError(Exception):
+    """Raised when some of the S3 writes for a message failed, so the message was not sent. Holds the
+    error for each failed key"""
+
+    def __init__(self, failures: dict[str, Exception]) -> None:
+        super().__init__(f"Failed to write {len(failures)} files to S3: {', '.join(failures)}")
+        self.failures = failures
+
+
+class DeleteObjectError(Exception):
+    """An error DeleteObjects reported for one of the keys it was asked to delete"""
+
 
 class AirbusHarvesterMessager(Messager[dict]):
     """
@@ -13,29 +36,129 @@ class AirbusHarvesterMessager(Messager[dict]):
     owning catalog combined with the file path in the external catalogue.
     For example: git-harvester/supported-datasets/planet/collection/item
     Then sends a catalogue harvested message via Pulsar to trigger transformer and ingester.
+
+    With more than one write worker, the S3 writes for a message are run concurrently on a thread
+    pool. Deleted keys are removed in batches of up to delete_batch_size keys per DeleteObjects
+    request. Either way, the message is only sent once every write and deletion has succeeded.
+    Otherwise OutputWriteError is raised with the error for each key that failed.
     """
 
+    def __init__(
+        self,
+        *args: Any,
+        write_workers: int = messager_write_workers,
+        delete_batch_size: int = messager_delete_batch_size,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.write_workers = write_workers
+        self.delete_batch_size = min(delete_batch_size, max_delete_batch_size)
+
+    def consume(self, msg: dict) -> Any:
+        if self.write_workers <= 1 and not (self.delete_batch_size > 0 and msg["deleted_keys"]):
+            return super().consume(msg)
+
+        changes: dict[str, list[str]] = {"added_keys": [], "updated_keys": [], "deleted_keys": []}
+        failures: dict[str, Exception] = {}
+        # The actions each write or batch of deletions is for
+        pending: dict[Future, list[Messager.OutputFileAction]] = {}
+        deletions: dict[str, list[Messager.OutputFileAction]] = {}
+
+        def collect(done: Iterable[Future]) -> None:
+            for future in done:
+                actions = pending.pop(future)
+                try:
+                    errors = future.result() or {}
+                except Exception as e:
+                    errors = {action.cat_path: e for action in actions}
+                for action in actions:
+                    if error := errors.get(action.cat_path):
+                        logging.error(f"Failed to write {action.cat_path} to S3: {error}")
+                        failures[action.cat_path] = error
+                    else:
+                        changes["deleted_keys" if action.file_body is None else "added_keys"].append(action.cat_path)
+
+        def submit(function: Callable, arg: Any, actions: list[Messager.OutputFileAction]) -> None:
+            # Only a few writes are queued at a time, so documents are not all held at once
+            if len(pending) >= self.write_workers * 2:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[executor.submit(function, arg)] = actions
+
+        with ThreadPoolExecutor(max(self.write_workers, 1), thread_name_prefix="messager-write") as executor:
+            for action in self.iter_actions(msg):
+                if action.file_body is None and self.delete_batch_size > 0:
+                    bucket = action.bucket or self.output_bucket
+                    batch = deletions.setdefault(bucket, [])
+                    batch.append(action)
+                    if len(batch) >= self.delete_batch_size:
+                        submit(self.delete, deletions.pop(bucket), batch)
+                else:
+                    submit(self.write, action, [action])
+            for batch in deletions.values():
+                submit(self.delete, batch, batch)
+        collect(list(pending))
+
+        if failures:
+            raise OutputWriteError(failures)
+        if self.producer and any(changes.values()):
+            message = self.gen_empty_catalogue_message(msg)
+            message.update(changes)
+            self.producer.send(json.dumps(message).encode("utf-8"))
+
+    def write(self, action: Messager.OutputFileAction) -> None:
+        """Writes a harvested file to S3, or deletes it if it has no body"""
+        bucket = action.bucket or self.output_bucket
+        key = self.cat_output_prefix + action.cat_path
+        if action.file_body is None:
+            self._s3().delete_object(Bucket=bucket, Key=key)
+        else:
+            self._s3().put_object(Bucket=bucket, Key=key, Body=action.file_body)
+
+    def delete(self, actions: list[Messager.OutputFileAction]) -> dict[str, Exception]:
+        """Deletes files in the same bucket from S3 with one DeleteObjects request. Returns the error
+        for each file that could not be deleted"""
+        bucket = actions[0].bucket or self.output_bucket
+        cat_paths = {self.cat_output_prefix + action.cat_path: action.cat_path for action in actions}
+        logging.info(f"Deleting {len(cat_paths)} files from {bucket}")
+        response = self._s3().delete_objects(
+            Bucket=bucket, Delete={"Objects": [{"Key": key} for key in cat_paths], "Quiet": True}
+        )
+        return {
+            cat_paths[error["Key"]]: DeleteObjectError(f"{error.get('Code')}: {error.get('Message')}")
+            for error in response.get("Errors", [])
+        }
+
+    def _s3(self) -> Any:
+        if self.s3_client is None:
+            raise ValueError("AirbusHarvesterMessager needs an S3 client to write harvested files")
+        return self.s3_client
+
     def process_msg(self, msg: dict) -> Sequence[Messager.Action]:
-        action_list = []
+        return list(self.iter_actions(msg))
+
+    def iter_actions(self, msg: dict) -> Iterator[Messager.OutputFileAction]:
+        """Yields an action for each harvested document and deleted key. The harvested data may be
+        a dict or any iterable of key and document pairs, such as MessageBatch.drain. consume streams
+        the actions to S3 when writes run concurrently, rather than holding them as well as the
+        documents"""
         harvested_data = msg["harvested_data"]
         deleted_keys = msg["deleted_keys"]
-        for key, value in harvested_data.items():
-            # Retrieve data
-            stac_data = value
+        items: Iterable[tuple[str, Any]] = (
+            harvested_data.items() if isinstance(harvested_data, Mapping) else harvested_data
+        )
+        for key, value in items:
+            # Retrieve data. Documents are usually already serialised by the harvester
+            stac_data = value if isinstance(value, (bytes, str)) else json.dumps(value)
             # return action to save file to S3
             # bucket defaults to self.output_bucket
-            action = Messager.OutputFileAction(
-                file_body=json.dumps(stac_data),
+            yield Messager.OutputFileAction(
+                file_body=cast(str, stac_data),
                 cat_path=key,
             )
-            action_list.append(action)
 
         for key in deleted_keys:
             # return action to delete file from S3 (file_body=None signals deletion per upstream docs)
-            action = Messager.OutputFileAction(file_body=cast(str, None), cat_path=key)
-            action_list.append(action)
-
-        return action_list
+            yield Messager.OutputFileAction(file_body=cast(str, None), cat_path=key)
 
     def gen_empty_catalogue_message(self, msg: Any) -> dict:
         return {
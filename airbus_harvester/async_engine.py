@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+import time
+from collections.abc import Coroutine, Generator, Iterator
+from json import JSONDecodeError
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    import httpx
+else:
+    try:
+        import httpx
+    except ImportError:  # httpx is optional, only needed for the async engine
+        httpx = None
+
+from airbus_harvester.auth import AccessTokenManager, token_manager
+from airbus_harvester.http_client import (
+    HostBudget,
+    host_budget,
+    http_connect_timeout,
+    http_pool_size,
+    http_read_timeout,
+    page_retry_delay,
+)
+from airbus_harvester.metrics import HarvestMetrics
+from airbus_harvester.pagination import Page, PageCursor, harvest_windows, page_cursors, prefetch_depth
+from airbus_harvester.serialization import loads
+
+# Maximum number of Airbus API requests the async engine has in flight at once
+async_max_requests = int(os.environ.get("ASYNC_MAX_REQUESTS", 8))
+
+
+class AsyncAirbusClient:
+    """
+    Requests pages of Airbus data with httpx, on an event loop. Connections are pooled and at most
+    max_requests requests are in flight at once, however many windows are being paged through,
+    within the concurrency and rate budget for each host. Access tokens come from the same
+    AccessTokenManager as the sync engine, and failed requests are retried as by get_next_page.
+    """
+
+    def __init__(
+        self,
+        max_requests: int = async_max_requests,
+        connect_timeout: float = http_connect_timeout,
+        read_timeout: float = http_read_timeout,
+        pool_size: int = http_pool_size,
+        tokens: AccessTokenManager = token_manager,
+        budget: HostBudget = host_budget,
+        transport: Any = None,
+    ) -> None:
+        if httpx is None:
+            raise RuntimeError("The async engine requires httpx. Install airbus-harvester[async]")
+        self.tokens = tokens
+        self.budget = budget
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=transport,
+        )
+        self._requests = asyncio.Semaphore(max(max_requests, 1))
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        host = urlsplit(url).netloc
+        host_slot: Any = contextlib.nullcontext()
+        if self.budget.concurrency > 0:
+            host_slot = self._host_slots.setdefault(host, asyncio.Semaphore(self.budget.concurrency))
+        async with self._requests, host_slot:
+            if delay := self.budget.reserve_start(host):
+                await asyncio.sleep(delay)
+            return await self._client.request(method.upper(), url, **kwargs)
+
+    async def get_token(self, env: str) -> str:
+        """Return a valid access token for the given environment. Refreshes block, so are made in a
+        worker thread rather than on the event loop"""
+        return self.tokens.cached_token(env) or await asyncio.to_thread(self.tokens.get_token, env)
+
+    async def get_next_page(self, url: str, config: dict, metrics: HarvestMetrics | None = None) -> dict:
+        """Collects body of next page of Airbus data, counting the bytes received and any retries"""
+        retry_count = 0
+        token_retried = False
+        while True:
+            try:
+                headers = {"accept": "application/json"}
+                access_token = None
+                if config["auth_env"]:
+                    access_token = await self.get_token(config["auth_env"])
+                    headers["Authorization"] = "Bearer " + access_token
+
+                logging.info(f"Making {config['request_method'].upper()} request to {url} with body {config['body']}")
+                response = await self.request(config["request_method"], url, json=config["body"], headers=headers)
+                logging.info(f"Response status code: {response.status_code}")
+                if response.status_code == 401 and access_token and not token_retried:
+                    # Token may have been revoked or expired early. Retry once with a new one
+                    logging.warning(f"Access token rejected by {url}. Retrying with a new token")
+                    self.tokens.invalidate(config["auth_env"], access_token)
+                    token_retried = True
+                    continue
+                response.raise_for_status()
+
+                if metrics:
+                    metrics.count("bytes_in", len(response.content))
+                return loads(response.content)
+
+            except (JSONDecodeError, httpx.HTTPError) as e:
+                logging.error(e)
+                delay = page_retry_delay(url, retry_count, metrics)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                retry_count += 1
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+async def window_pages(
+    client: AsyncAirbusClient,
+    cursor: PageCursor,
+    window: int,
+    pages: asyncio.Queue,
+    metrics: HarvestMetrics | None = None,
+) -> None:
+    """Pages through one window of Airbus data, putting each page on the queue"""
+    while cursor.next_url:
+        page_url = cursor.next_url
+        start = time.perf_counter()
+        body = await client.get_next_page(page_url, cursor.config, metrics)
+        if metrics:
+            metrics.observe("fetch", time.perf_counter() - start)
+        cursor.advance(page_url, body)
+        await pages.put(Page(page_url, body, window, cursor.position()))
+
+
+class AsyncEngine:
+    """
+    Fetches pages of Airbus data with asyncio, on an event loop running in a background thread, and
+    hands them to the synchronous harvest as an ordinary iterator. The windows of a harvest are
+    paged through as coroutines sharing one AsyncAirbusClient, rather than as worker threads, so
+    many windows can be kept in flight cheaply.
+    """
+
+    def __init__(self, max_requests: int = async_max_requests, transport: Any = None) -> None:
+        self.client = AsyncAirbusClient(max_requests, transport=transport)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="airbus-async", daemon=True)
+        self._thread.start()
+
+    def _run(self, coroutine: Coroutine) -> Any:
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def pages(
+        self,
+        config: dict,
+        since: str | None = None,
+        windows: int = harvest_windows,
+        depth: int = prefetch_depth,
+        cursors: list[PageCursor] | None = None,
+        metrics: HarvestMetrics | None = None,
+    ) -> Generator[Page]:
+        """Yields every page of Airbus data for a config, like harvest_pages. All windows are paged
+        through concurrently, holding up to `depth` pages per window waiting for the caller.
+        Exceptions raised while fetching are re-raised in the caller. Requests are timed and counted
+        in the metrics, if given"""
+        if cursors is None:
+            cursors = page_cursors(config, since, windows)
+        if len(cursors) > 1:
+            date_ranges = [cursor.date_range for cursor in cursors]
+            logging.info(f"Harvesting {len(cursors)} windows asynchronously: {date_ranges}")
+        pages: asyncio.Queue = asyncio.Queue(maxsize=max(depth, 1) * len(cursors))
+        done = object()
+
+        async def produce() -> None:
+            tasks = [
+                asyncio.create_task(window_pages(self.client, cursor, window, pages, metrics))
+                for window, cursor in enumerate(cursors)
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        async def start() -> asyncio.Task:
+            return asyncio.create_task(produce())
+
+        async def next_page(producer: asyncio.Task) -> Any:
+            if pages.empty() and not producer.done():
+                get = asyncio.ensure_future(pages.get())
+                await asyncio.wait([get, producer], return_when=asyncio.FIRST_COMPLETED)
+                if get.done():
+                    return get.result()
+                get.cancel()
+            if not pages.empty():
+                return pages.get_nowait()
+            # Raises the first error from fetching pages
+            producer.result()
+            return done
+
+        async def stop(producer: asyncio.Task) -> None:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+        def consume() -> Generator[Page]:
+            producer = self._run(start())
+            try:
+                while (page := self._run(next_page(producer))) is not done:
+                    yield page
+            finally:
+                # Stop fetching if the caller finishes early or fetching failed
+                self._run(stop(producer))
+
+        return consume()
+
+    def close(self) -> None:
+        self._run(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def async_harvest_pages(
+    config: dict,
+    since: str | None = None,
+    cursors: list[PageCursor] | None = None,
+    metrics: HarvestMetrics | None = None,
+) -> Iterator[Page]:
+    """Yields every page of Airbus data for a config using an AsyncEngine of its own"""
+    engine = AsyncEngine()
+    try:
+        yield from engine.pages(config, since, cursors=cursors, metrics=metrics)
+    finally:
+        engine.close()
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import traceback
+
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+from airbus_harvester.http_client import http_client, max_api_retries
+
+# Seconds before expiry at which a cached token is considered stale and is replaced
+token_refresh_margin = int(os.environ.get("ACCESS_TOKEN_REFRESH_MARGIN", 60))
+background_token_refresh = os.environ.get("ACCESS_TOKEN_BACKGROUND_REFRESH", "false").lower() == "true"
+
+# Lifetime assumed when the IDP response does not include expires_in
+default_token_lifetime = 300
+# Largest fraction of a token's lifetime the refresh margin may take up, so that short lived tokens
+# are still reused rather than refreshed on every request
+max_refresh_fraction = 0.5
+
+token_urls = {
+    "prod": "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+    "dev": "https://authenticate-int.idp.private.geoapi-airbusds.com/auth/realms/IDP/protocol/openid-connect/token",
+}
+
+
+def request_access_token(env: str = "dev", retry_count: int = 0) -> dict:
+    """Request a new access token for the Airbus API. Returns the full IDP response, including
+    access_token and expires_in"""
+    url = token_urls["prod"] if env == "prod" else token_urls["dev"]
+
+    api_key = os.environ["AIRBUS_API_KEY"]
+
+    headers = {
+        "Content-Type": "application/x-www-form-urlencoded",
+    }
+
+    data = [
+        ("apikey", api_key),
+        ("grant_type", "api_key"),
+        ("client_id", "IDP"),
+    ]
+
+    try:
+        logging.info(f"Making POST request to {url} for access token")
+        response = http_client.post(url, headers=headers, data=data)
+        logging.info(f"Response status code: {response.status_code}")
+        response.raise_for_status()
+        token_response = response.json()
+
+        if token_response.get("access_token"):
+            return token_response
+        else:
+            raise ValueError("Access token is None")
+
+    except (ConnectionError, HTTPError, Timeout, ValueError) as e:
+        logging.error(e)
+        logging.error(traceback.format_exc())
+        if retry_count >= max_api_retries:
+            logging.error(f"Failed to generate access token after {retry_count + 1} attempts.")
+            raise
+
+        logging.error(f"Retrying access token generation. Attempt {retry_count + 1}")
+        time.sleep(2**retry_count)
+        return request_access_token(env, retry_count=retry_count + 1)
+
+
+class AccessTokenManager:
+    """
+    Caches Airbus access tokens per auth environment so that a token is only requested when the
+    previous one is about to expire, rather than once per page.
+    Safe to share between threads: concurrent callers wait for a single refresh instead of each
+    requesting their own token. Optionally refreshes tokens in the background ahead of expiry.
+    """
+
+    def __init__(
+        self,
+        refresh_margin: float = token_refresh_margin,
+        background_refresh: bool = background_token_refresh,
+    ) -> None:
+        self.refresh_margin = refresh_margin
+        self.background_refresh = background_refresh
+        # Token and the time it should be refreshed at, for each environment
+        self._tokens: dict[str, tuple[str, float]] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._timers: dict[str, threading.Timer] = {}
+        self._lock = threading.Lock()
+
+    def _env_lock(self, env: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(env, threading.Lock())
+
+    def get_token(self, env: str) -> str:
+        """Return a valid access token for the given environment, requesting one if required"""
+        with self._env_lock(env):
+            cached = self._tokens.get(env)
+            if cached and time.monotonic() < cached[1]:
+                return cached[0]
+            return self._refresh(env)
+
+    def cached_token(self, env: str) -> str | None:
+        """The cached token for the given environment if it is still valid, without waiting for or
+        making a refresh"""
+        cached = self._tokens.get(env)
+        if cached and time.monotonic() < cached[1]:
+            return cached[0]
+        return None
+
+    def invalidate(self, env: str, token: str | None = None) -> None:
+        """Forget the cached token for an environment, e.g. after it was rejected with a 401.
+        If a token is given it is only forgotten if it is still the cached one, so that a token
+        already refreshed by another thread is kept"""
+        with self._env_lock(env):
+            cached = self._tokens.get(env)
+            if cached and (token is None or cached[0] == token):
+                del self._tokens[env]
+
+    def close(self) -> None:
+        """Cancel any scheduled background refreshes"""
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers = {}
+
+    def _refresh(self, env: str) -> str:
+        """Request a new token and cache it. Must be called with the environment lock held"""
+        token_response = request_access_token(env)
+        access_token = token_response["access_token"]
+        try:
+            expires_in = float(token_response.get("expires_in") or default_token_lifetime)
+        except (TypeError, ValueError):
+            expires_in = default_token_lifetime
+
+        refresh_in = max(expires_in - min(self.refresh_margin, expires_in * max_refresh_fraction), 1)
+        self._tokens[env] = (access_token, time.monotonic() + refresh_in)
+        logging.info(f"Cached access token for {env}, expires in {expires_in}s")
+
+        if self.background_refresh:
+            self._schedule_refresh(env, refresh_in)
+
+        return access_token
+
+    def _schedule_refresh(self, env: str, delay: float) -> None:
+        timer = threading.Timer(delay, self._background_refresh, args=(env,))
+        timer.daemon = True
+        with self._lock:
+            if previous := self._timers.get(env):
+                previous.cancel()
+            self._timers[env] = timer
+        timer.start()
+
+    def _background_refresh(self, env: str) -> None:
+        try:
+            with self._env_lock(env):
+                self._refresh(env)
+        except Exception as e:
+            # The next get_token call will refresh synchronously instead
+            logging.error(f"Background refresh of access token for {env} failed: {e}")
+
+
+# Shared between all page fetches in the process
+token_manager = AccessTokenManager()
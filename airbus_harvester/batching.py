@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+
+
+class MessageBatch:
+    """
+    Documents harvested since the last message, kept serialised, by key. The batch is full once it
+    holds max_entries documents, max_bytes bytes of documents, or its oldest document has waited
+    max_age seconds, with each limit ignored if 0. Limiting bytes as well as entries keeps messages a
+    predictable size however large the items of a collection are. Adding a key again replaces its
+    document.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int = 0, max_age: float = 0) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.documents: dict[str, bytes] = {}
+        self.size = 0
+        self.started = 0.0
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.documents
+
+    def add(self, key: str, document: bytes) -> None:
+        if not self.documents:
+            self.started = time.monotonic()
+        if (previous := self.documents.get(key)) is not None:
+            self.size -= len(previous)
+        self.documents[key] = document
+        self.size += len(document)
+
+    def is_full(self) -> bool:
+        if not self.documents:
+            return False
+        if self.max_entries > 0 and len(self.documents) >= self.max_entries:
+            return True
+        if self.max_bytes > 0 and self.size >= self.max_bytes:
+            return True
+        return self.max_age > 0 and time.monotonic() - self.started >= self.max_age
+
+    def drain(self) -> Iterator[tuple[str, bytes]]:
+        """Empties the batch, returning an iterator over its documents in the order they were added.
+        Each document is released once it has been yielded"""
+        documents, self.documents = self.documents, {}
+        self.size = 0
+        return _pop_all(documents)
+
+
+def _pop_all(documents: dict[str, bytes]) -> Iterator[tuple[str, bytes]]:
+    items = list(documents.items())
+    documents.clear()
+    items.reverse()
+    while items:
+        yield items.pop()
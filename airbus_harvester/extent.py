@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import datetime
+import logging
+import math
+
+
+def parse_datetime(value: str) -> datetime.datetime:
+    """Parses an ISO 8601 date from the Airbus APIs as a timezone aware datetime"""
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.UTC)
+    return parsed
+
+
+class CollectionExtent:
+    """
+    Running spatial and temporal extent of a collection. Only the bounding box and the earliest
+    and latest times are kept, so each item is added in constant time and memory regardless of how
+    many vertices its geometry has. Coordinates are clipped to -180<long<180 and -90<lat<90.
+    """
+
+    def __init__(self) -> None:
+        self.min_lon = self.min_lat = math.inf
+        self.max_lon = self.max_lat = -math.inf
+        # Parsed time alongside the original string, which is what ends up in the collection
+        self.start: tuple[datetime.datetime, str] | None = None
+        self.stop: tuple[datetime.datetime, str] | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict | None) -> CollectionExtent:
+        """Restores an extent stored with to_dict. Also reads the previous summary format, which
+        listed the extreme coordinates and times"""
+        extent = cls()
+        if not data:
+            return extent
+
+        if "bbox" in data:
+            extent.add_bbox(data["bbox"])
+            extent.add_times(data.get("start_time"), data.get("stop_time"))
+        else:
+            for coordinates in data.get("coordinates", []):
+                extent.add_bbox([coordinates[0], coordinates[1], coordinates[0], coordinates[1]])
+            for start_time in data.get("start_time", []):
+                extent.add_times(start_time, None)
+            for stop_time in data.get("stop_time", []):
+                extent.add_times(None, stop_time)
+        return extent
+
+    @classmethod
+    def from_collection(cls, collection: dict) -> CollectionExtent:
+        """Creates an extent from a previously generated STAC collection"""
+        start_time = collection["extent"]["temporal"]["interval"][0][0].split(".")[0]
+        stop_time = collection["extent"]["temporal"]["interval"][0][1].split(".")[0]
+
+        extent = cls()
+        extent.add_bbox(collection["extent"]["spatial"]["bbox"][0])
+        extent.add_times(f"{start_time.rstrip('Z')}Z", f"{stop_time.rstrip('Z')}Z")
+        return extent
+
+    def is_empty(self) -> bool:
+        return self.start is None or self.stop is None or self.min_lon > self.max_lon
+
+    def add_item_times(self, item: dict) -> bool:
+        """Extends the temporal extent to include a STAC item. Returns whether the extent changed"""
+        properties = item["properties"]
+        return self.add_times(
+            properties.get("start_datetime", properties.get("datetime")),
+            properties.get("end_datetime", properties.get("datetime")),
+        )
+
+    def add_bbox(self, bbox: list) -> bool:
+        """Extends the extent to include a bbox, which may be 2D or 3D. Returns whether the extent changed"""
+        if not bbox:
+            return False
+        dimensions = len(bbox) // 2
+        min_lon = min(max(bbox[0], -180), 180)
+        min_lat = min(max(bbox[1], -90), 90)
+        max_lon = min(max(bbox[dimensions], -180), 180)
+        max_lat = min(max(bbox[dimensions + 1], -90), 90)
+
+        changed = False
+        if min_lon < self.min_lon:
+            self.min_lon = min_lon
+            changed = True
+        if min_lat < self.min_lat:
+            self.min_lat = min_lat
+            changed = True
+        if max_lon > self.max_lon:
+            self.max_lon = max_lon
+            changed = True
+        if max_lat > self.max_lat:
+            self.max_lat = max_lat
+            changed = True
+        return changed
+
+    def add_times(self, start_time: str | None, stop_time: str | None) -> bool:
+        """Extends the temporal extent to include the given times. Returns whether the extent changed"""
+        changed = False
+        try:
+            if start_time:
+                parsed_start = parse_datetime(start_time)
+                if self.start is None or parsed_start < self.start[0]:
+                    self.start = (parsed_start, start_time)
+                    changed = True
+            if stop_time:
+                parsed_stop = parse_datetime(stop_time)
+                if self.stop is None or parsed_stop > self.stop[0]:
+                    self.stop = (parsed_stop, stop_time)
+                    changed = True
+        except ValueError:
+            logging.warning(f"Invalid time in interval {start_time} - {stop_time}")
+        return changed
+
+    def bbox(self) -> list:
+        return [self.min_lon, self.min_lat, self.max_lon, self.max_lat]
+
+    def to_dict(self) -> dict:
+        """Compact form of the extent, suitable for storing in the harvest metadata"""
+        if self.is_empty():
+            return {}
+        return {
+            "bbox": self.bbox(),
+            "start_time": self.start[1] if self.start else None,
+            "stop_time": self.stop[1] if self.stop else None,
+        }
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import itertools
+import logging
+from typing import NamedTuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the plain Python implementation is used without it
+    np = None  # type: ignore[assignment]
+
+
+class PageGeometry(NamedTuple):
+    """Bounding box of each feature on a page, and of the whole page clipped to valid coordinates"""
+
+    bboxes: list[list]
+    page_bbox: list
+
+
+def coordinates_to_bbox(coordinates: list) -> list:
+    """Finds the biggest and smallest x and y coordinates"""
+
+    unzipped = list(zip(*coordinates, strict=False))
+
+    max_values = [max(index) for index in unzipped]
+    min_values = [min(index) for index in unzipped]
+
+    return min_values + max_values
+
+
+def clip_bbox(bbox: list) -> list:
+    """Clip a 2D bbox to -90<lat<90 and <-180<long<180"""
+    return [
+        min(max(bbox[0], -180), 180),
+        min(max(bbox[1], -90), 90),
+        min(max(bbox[2], -180), 180),
+        min(max(bbox[3], -90), 90),
+    ]
+
+
+def page_geometry(features: list[dict]) -> PageGeometry:
+    """Computes the bbox of the outer ring of every feature on a page, and the clipped bbox of the
+    whole page. Uses numpy to do this in a single vectorised pass where available"""
+    rings = [feature["geometry"]["coordinates"][0] for feature in features]
+
+    bboxes = None
+    if np is not None and rings:
+        try:
+            bboxes = _vectorised_bboxes(rings)
+        except (TypeError, ValueError) as e:
+            # e.g. a mixture of 2D and 3D coordinates
+            logging.debug(f"Falling back to plain bbox calculation: {e}")
+    if bboxes is None:
+        bboxes = [coordinates_to_bbox(ring) for ring in rings]
+
+    valid = [bbox for bbox in bboxes if bbox]
+    if not valid:
+        return PageGeometry(bboxes, [])
+
+    dimensions = len(valid[0]) // 2
+    page_bbox = [
+        min(bbox[0] for bbox in valid),
+        min(bbox[1] for bbox in valid),
+        max(bbox[dimensions] for bbox in valid),
+        max(bbox[dimensions + 1] for bbox in valid),
+    ]
+    return PageGeometry(bboxes, clip_bbox(page_bbox))
+
+
+def _vectorised_bboxes(rings: list[list]) -> list[list]:
+    """Packs the coordinates of all rings into one contiguous array, with the offset of each ring,
+    and finds the position of the minimum and maximum values in each ring. The bboxes are built
+    from the original coordinates, so that they are the same as from coordinates_to_bbox"""
+    if np is None:
+        raise ValueError("numpy is not installed")
+    lengths = np.fromiter((len(ring) for ring in rings), dtype=np.int64, count=len(rings))
+    if not lengths.all():
+        raise ValueError("Empty ring")
+
+    dimensions = len(rings[0][0])
+    total_points = int(lengths.sum())
+    coordinates = list(itertools.chain.from_iterable(itertools.chain.from_iterable(rings)))
+    values = np.fromiter(coordinates, dtype=np.float64, count=len(coordinates))
+    if values.size != total_points * dimensions:
+        raise ValueError("Coordinates have differing dimensions")
+    values = values.reshape(total_points, dimensions)
+
+    offsets = np.zeros(len(rings), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+
+    # The first point in each ring holding its minimum or maximum, as min() and max() return
+    points = np.arange(total_points)[:, np.newaxis]
+    extremes = []
+    for reduce in (np.minimum, np.maximum):
+        is_extreme = values == np.repeat(reduce.reduceat(values, offsets, axis=0), lengths, axis=0)
+        first = np.minimum.reduceat(np.where(is_extreme, points, total_points), offsets, axis=0)
+        extremes.append(first * dimensions + np.arange(dimensions))
+
+    indices = np.hstack(extremes).tolist()
+    return [[coordinates[index] for index in ring_indices] for ring_indices in indices]
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import random
+from collections.abc import Iterable
+from typing import NamedTuple
+
+try:
+    import xxhash
+except ImportError:  # xxhash is optional, only needed for the xxh3 hash algorithm
+    xxhash = None  # type: ignore[assignment]
+
+from airbus_harvester.serialization import (
+    canonical_dumps,
+    document_format,
+    is_format_available,
+    json_document_format,
+    orjson_document_format,
+)
+
+# Algorithm used to detect changes to harvested documents: blake2b, md5, or xxh3 (requires xxhash)
+hash_algorithm = os.environ.get("HASH_ALGORITHM", "blake2b").lower()
+# Bytes of the digest stored in the harvest metadata for each document
+hash_digest_size = int(os.environ.get("HASH_DIGEST_SIZE", 8))
+
+# What the fingerprint of raw Airbus features covers: "update_time" to use the feature's last update
+# time where it has one, or "raw" for the whole feature
+fingerprint_source = os.environ.get("FINGERPRINT_SOURCE", "update_time").lower()
+# Fraction of features with an unchanged fingerprint which are still transformed and compared in full
+fingerprint_verify_rate = float(os.environ.get("FINGERPRINT_VERIFY_RATE", 0.01))
+
+# Version of the harvest metadata format, recorded alongside the hash scheme
+metadata_version = 2
+
+# Metadata key recording the hash scheme. Before it existed, the serialisation alone was recorded
+# under legacy_format_key, and before that nothing was recorded
+hash_scheme_key = "hash_scheme"
+legacy_format_key = "document_format"
+
+
+def strip_fields(data: dict, paths: Iterable[str]) -> dict:
+    """A copy of a document without the fields at the given dotted paths, such as "properties.updated".
+    A "*" in a path matches every key at that level. Only the dicts along each path are copied"""
+    for path in paths:
+        data = _without(data, path.split("."))
+    return data
+
+
+def _without(node: dict, keys: list[str]) -> dict:
+    key, rest = keys[0], keys[1:]
+    matches = list(node) if key == "*" else [key] if key in node else []
+    if not matches:
+        return node
+    copy = dict(node)
+    for match in matches:
+        if not rest:
+            del copy[match]
+        elif isinstance(copy[match], dict):
+            copy[match] = _without(copy[match], rest)
+    return copy
+
+
+class HashScheme(NamedTuple):
+    """How the hashes in the harvest metadata were calculated: the hash algorithm, the number of
+    bytes of digest kept, how documents were serialised before hashing, and any volatile fields left
+    out of the hash"""
+
+    algorithm: str
+    digest_size: int
+    document_format: str
+    volatile_fields: tuple[str, ...] = ()
+
+    @classmethod
+    def from_metadata(cls, metadata: dict) -> HashScheme:
+        """The scheme recorded in harvest metadata, or the scheme used before one was recorded"""
+        if recorded := metadata.get(hash_scheme_key):
+            return cls(
+                recorded["algorithm"],
+                int(recorded["digest_size"]),
+                recorded["document_format"],
+                tuple(recorded.get("volatile_fields", ())),
+            )
+        if metadata.get(legacy_format_key) == json_document_format:
+            return cls("md5", 16, json_document_format)
+        return legacy_hash_scheme
+
+    def is_available(self) -> bool:
+        if not is_format_available(self.document_format):
+            return False
+        if self.algorithm == "xxh3":
+            return xxhash is not None
+        return self.algorithm in hashlib.algorithms_available
+
+    def to_metadata(self) -> dict:
+        return {**self._asdict(), "volatile_fields": list(self.volatile_fields), "version": metadata_version}
+
+    def digest(self, data: bytes) -> str:
+        """Hex digest of some bytes"""
+        if self.algorithm == "blake2b":
+            return hashlib.blake2b(data, digest_size=self.digest_size).hexdigest()
+        if self.algorithm == "xxh3":
+            if xxhash is None:
+                raise ValueError("Hash algorithm xxh3 requires xxhash, which is not installed")
+            hasher = xxhash.xxh3_64 if self.digest_size <= 8 else xxhash.xxh3_128
+            return hasher(data).hexdigest()[: self.digest_size * 2]
+        return hashlib.new(self.algorithm, data).hexdigest()[: self.digest_size * 2]
+
+    def hash_document(self, data: dict, document: bytes) -> str:
+        """Hash of a document, given as both the data and its canonical serialisation"""
+        if self.volatile_fields:
+            stripped = strip_fields(data, self.volatile_fields)
+            if stripped is not data:
+                return self.digest(self.serialise(stripped))
+        if self.document_format == document_format():
+            return self.digest(document)
+        return self.digest(self.serialise(data))
+
+    def serialise(self, data: dict) -> bytes:
+        """A document serialised in this scheme's format"""
+        if self.document_format in (json_document_format, orjson_document_format):
+            return canonical_dumps(data, self.document_format)
+        return json.dumps(data).encode("utf-8")
+
+
+# md5 of the json.dumps output, used by harvests before the scheme was recorded
+legacy_hash_scheme = HashScheme("md5", 16, "json")
+
+
+def configured_hash_scheme(
+    algorithm: str = hash_algorithm, digest_size: int = hash_digest_size, volatile_fields: Iterable[str] = ()
+) -> HashScheme:
+    """The hash scheme for new hashes, falling back to blake2b if the configured one is unavailable"""
+    scheme = HashScheme(algorithm, max(1, min(digest_size, 64)), document_format(), tuple(volatile_fields))
+    if not scheme.is_available():
+        logging.warning(f"Hash algorithm {algorithm} is not available. Using blake2b")
+        scheme = scheme._replace(algorithm="blake2b")
+    return scheme
+
+
+class DocumentHasher:
+    """
+    Hashes documents with the configured scheme and compares them to the hashes stored by the
+    previous harvest. If that harvest used a different scheme, stored hashes are also checked against
+    the document hashed with the old scheme, so that changing scheme does not republish every
+    document. Unchanged documents are then stored with the new hash, migrating the metadata as a side
+    effect of the next harvest.
+    """
+
+    def __init__(self, previous_scheme: HashScheme, scheme: HashScheme | None = None) -> None:
+        self.scheme = scheme or configured_hash_scheme()
+        self.previous_scheme = previous_scheme
+        self.migrating = previous_scheme != self.scheme
+        if self.migrating and not previous_scheme.is_available():
+            logging.warning(
+                f"Stored hashes use unavailable scheme {previous_scheme}. All documents will be republished"
+            )
+            self.migrating = False
+        elif self.migrating:
+            logging.info(f"Migrating stored hashes from {previous_scheme} to {self.scheme}")
+
+    def hash(self, data: dict, document: bytes) -> str:
+        return self.scheme.hash_document(data, document)
+
+    def is_unchanged(self, previous_hash: str | None, file_hash: str, data: dict, document: bytes) -> bool:
+        """Whether a document matches the hash stored for it by the previous harvest"""
+        if not previous_hash:
+            return False
+        if previous_hash == file_hash:
+            return True
+        return self.migrating and previous_hash == self.previous_scheme.hash_document(data, document)
+
+
+def split_stored_hash(value: str | None) -> tuple[str | None, str | None]:
+    """Splits a value stored in the harvest metadata into the document hash and the fingerprint of
+    the raw Airbus feature, if one was stored"""
+    if not value:
+        return None, None
+    document_hash, _, fingerprint = value.partition(":")
+    return document_hash, fingerprint or None
+
+
+def join_stored_hash(document_hash: str, fingerprint: str | None = None) -> str:
+    return f"{document_hash}:{fingerprint}" if fingerprint else document_hash
+
+
+class FeatureFingerprinter:
+    """
+    Cheap fingerprints of raw Airbus features, used to skip transforming features that have not
+    changed since they were last harvested. The fingerprint covers the feature's update time, or the
+    whole feature if it has none, together with a signature of everything else the item depends on
+    such as the transformer version, collection config and hash scheme. A sample of unchanged
+    features is still transformed and compared in full, to check the fingerprints can be relied on.
+    """
+
+    def __init__(
+        self,
+        scheme: HashScheme,
+        signature: bytes,
+        update_time_key: str | None = None,
+        source: str = fingerprint_source,
+        verify_rate: float = fingerprint_verify_rate,
+    ) -> None:
+        self.scheme = scheme
+        # Salted with the whole hash scheme, so changing any of it, such as the volatile fields,
+        # changes every fingerprint and the next harvest compares (and migrates) every document
+        self.signature = scheme.digest(canonical_dumps(scheme.to_metadata()) + signature).encode()
+        self.update_time_key = update_time_key if source == "update_time" else None
+        self.verify_rate = verify_rate
+        self.skipped = self.verified = self.mismatched = 0
+
+    def fingerprint(self, feature: dict) -> str:
+        if self.update_time_key and (update_time := feature["properties"].get(self.update_time_key)):
+            return self.scheme.digest(self.signature + str(update_time).encode("utf-8"))
+        return self.scheme.digest(self.signature + canonical_dumps(feature))
+
+    def should_skip(self, previous_fingerprint: str | None, fingerprint: str) -> bool:
+        """Whether a feature can be skipped, because its fingerprint is unchanged and it was not
+        picked to be verified"""
+        if previous_fingerprint != fingerprint:
+            return False
+        if self.verify_rate > 0 and random.random() < self.verify_rate:
+            self.verified += 1
+            return False
+        self.skipped += 1
+        return True
+
+    def summary(self) -> str:
+        return (
+            f"{self.skipped} unchanged features skipped, {self.verified} verified, "
+            f"{self.mismatched} changed despite an unchanged fingerprint"
+        )
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from airbus_harvester.metrics import HarvestMetrics
+
+max_api_retries = int(os.environ.get("MAX_API_RETRIES", 5))
+http_connect_timeout = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))
+http_read_timeout = float(os.environ.get("HTTP_READ_TIMEOUT", 10))
+http_pool_size = int(os.environ.get("HTTP_POOL_SIZE", 10))
+
+# Maximum number of requests in flight to each Airbus API host, and the maximum number started per
+# second, shared by every harvest in the process. 0 for no limit
+http_host_concurrency = int(os.environ.get("HTTP_HOST_CONCURRENCY", 8))
+http_host_rate = float(os.environ.get("HTTP_HOST_RATE", 0))
+
+
+class HostBudget:
+    """
+    Limits the number of requests in flight to each host, and optionally the rate they are started
+    at, across all the threads of a process. Collections harvested concurrently from the same Airbus
+    API then share its capacity rather than one starving the others.
+    """
+
+    def __init__(self, concurrency: int = http_host_concurrency, rate: float = http_host_rate) -> None:
+        self.concurrency = concurrency
+        self.rate = rate
+        self._slots: dict[str, threading.BoundedSemaphore] = {}
+        self._next_start: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def reserve_start(self, host: str) -> float:
+        """Reserves the next start time for a request to a host, returning the seconds to wait for it"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + 1 / self.rate
+        return start - now
+
+    @contextlib.contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        """Waits until a request to the host of the URL is within the budget, holding a place for it
+        until the context exits"""
+        host = urlsplit(url).netloc
+        semaphore = None
+        if self.concurrency > 0:
+            with self._lock:
+                semaphore = self._slots.setdefault(host, threading.BoundedSemaphore(self.concurrency))
+            semaphore.acquire()
+        try:
+            if delay := self.reserve_start(host):
+                time.sleep(delay)
+            yield
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+
+def page_retry_delay(url: str, retry_count: int, metrics: HarvestMetrics | None = None) -> float | None:
+    """Seconds to wait before retrying a failed request for a page of Airbus data, counting the retry
+    in the metrics, if given. None once max_api_retries retries have been made, when the error
+    should be raised. Shared by the sync and async engines"""
+    if retry_count > max_api_retries:
+        logging.error(f"Failed to obtain valid response after {retry_count + 1} attempts.")
+        return None
+
+    logging.error(f"Retrying retrieval of {url}. Attempt {retry_count + 1}")
+    if metrics:
+        metrics.count("retries")
+    return 5**retry_count
+
+
+class HttpClient:
+    """
+    Keeps one persistent requests session per host, so that connections to the Airbus APIs are
+    pooled and kept alive between pages rather than a new TCP and TLS handshake being made for
+    every request. Responses are requested with gzip/deflate compression.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = http_connect_timeout,
+        read_timeout: float = http_read_timeout,
+        pool_size: int = http_pool_size,
+        budget: HostBudget | None = None,
+    ) -> None:
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.budget = budget or HostBudget()
+        self._sessions: dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session(self, url: str) -> requests.Session:
+        """Returns the pooled session for the host of the given URL, creating it if required"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers["Accept-Encoding"] = "gzip, deflate"
+                self._sessions[host] = session
+            return session
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        with self.budget.slot(url):
+            return self.session(url).request(method.upper(), url, **kwargs)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+# Shared by all Airbus API requests in the process
+host_budget = HostBudget()
+http_client = HttpClient(budget=host_budget)
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import sys
+from collections.abc import Iterable, Iterator
+
+
+class KeyIndex:
+    """
+    A set of harvest metadata keys, which stores item keys as their interned ID within the
+    collection rather than the full key. Item keys all share the same prefix and suffix, so this
+    takes a fraction of the memory for a large collection, and interning lets indexes of the same
+    items share their IDs. Other keys, such as the collection and catalogue, are stored in full.
+
+    A read-only snapshot holds the keys of the previous harvest, without copying its metadata.
+    """
+
+    def __init__(self, item_prefix: str, item_suffix: str = ".json") -> None:
+        self.item_prefix = item_prefix
+        self.item_suffix = item_suffix
+        self.ids: set[str] = set()
+        self.other: set[str] = set()
+        self.read_only = False
+
+    @classmethod
+    def snapshot(cls, keys: Iterable[str], item_prefix: str, item_suffix: str = ".json") -> KeyIndex:
+        """A read-only index of some keys, such as those of the previous harvest's metadata"""
+        index = cls(item_prefix, item_suffix)
+        index.update(keys)
+        index.read_only = True
+        return index
+
+    def item_id(self, key: str) -> str | None:
+        """The ID within the collection of an item key, or None if the key is not an item key"""
+        if len(key) > len(self.item_prefix) + len(self.item_suffix) and (
+            key.startswith(self.item_prefix) and key.endswith(self.item_suffix)
+        ):
+            return key[len(self.item_prefix) : len(key) - len(self.item_suffix)]
+        return None
+
+    def add(self, key: str) -> None:
+        if self.read_only:
+            raise TypeError("Cannot add keys to a read-only KeyIndex")
+        if (item_id := self.item_id(key)) is not None:
+            self.ids.add(sys.intern(item_id))
+        else:
+            self.other.add(key)
+
+    def update(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: object) -> bool:
+        if not isinstance(key, str):
+            return False
+        item_id = self.item_id(key)
+        return item_id in self.ids if item_id is not None else key in self.other
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.other)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.other
+        for item_id in self.ids:
+            yield f"{self.item_prefix}{item_id}{self.item_suffix}"
+
+    def difference(self, other: KeyIndex) -> Iterator[str]:
+        """Yields the keys in this index which are not in another, comparing item IDs directly when
+        both indexes share the same item prefix and suffix"""
+        if (other.item_prefix, other.item_suffix) != (self.item_prefix, self.item_suffix):
+            yield from (key for key in self if key not in other)
+            return
+        for key in self.other:
+            if key not in other.other:
+                yield key
+        for item_id in self.ids:
+            if item_id not in other.ids:
+                yield f"{self.item_prefix}{item_id}{self.item_suffix}"
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+from eodhp_utils.aws.s3 import get_file_s3, upload_file_s3
+
+from airbus_harvester.metrics import HarvestMetrics
+from airbus_harvester.serialization import dumps, loads
+from airbus_harvester.state_codec import decode_state, encode_state, metadata_format, resolve_compression
+
+# The delta log is compacted into a new snapshot during a harvest once it holds this many bytes or deltas
+metadata_compaction_bytes = int(os.environ.get("METADATA_COMPACTION_BYTES", 50_000_000))
+metadata_compaction_deltas = int(os.environ.get("METADATA_COMPACTION_DELTAS", 1000))
+
+# Key in the snapshot recording the last delta it includes
+sequence_key = "delta_sequence"
+
+# S3 allows at most this many keys per DeleteObjects request
+max_delete_keys = 1000
+
+
+class MetadataStore:
+    """
+    Harvest metadata stored in S3 as a snapshot plus a log of deltas. Each message sent during a
+    harvest appends a small delta holding only the keys it changed, instead of rewriting the whole
+    metadata file, and the log is compacted into a new snapshot at the end of the harvest or when it
+    grows too large. Loading replays any deltas left by an interrupted harvest on top of the snapshot.
+
+    A harvest can also save a checkpoint alongside the metadata, recording how far it got so that it
+    can be resumed if interrupted. The keys seen since the previous checkpoint are saved with each
+    one, rather than all keys seen so far.
+
+    Uploads run in order on a background thread so the harvest does not wait for them. An upload
+    failure is raised by the next call that writes to the store.
+    """
+
+    def __init__(
+        self,
+        s3_client: Any,
+        bucket: str,
+        key: str,
+        item_prefix: str | None = None,
+        snapshot_format: str = metadata_format,
+        compaction_bytes: int = metadata_compaction_bytes,
+        compaction_deltas: int = metadata_compaction_deltas,
+        metrics: HarvestMetrics | None = None,
+    ) -> None:
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        # Snapshots are written in the binary format if the prefix of item keys is known
+        self.item_prefix = item_prefix
+        self.snapshot_format = snapshot_format if item_prefix else "json"
+        self.delta_prefix = f"{key}.deltas/"
+        self.checkpoint_key = f"{key}.checkpoint"
+        self.seen_prefix = f"{key}.checkpoint.seen/"
+        self.checkpoint_sequence = 0
+        self.compaction_bytes = compaction_bytes
+        self.compaction_deltas = compaction_deltas
+        self.sequence = 0
+        self.delta_keys: list[str] = []
+        self.delta_bytes = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="airbus-metadata")
+        self._pending: list[Future] = []
+        # Times each upload, if given
+        self.metrics = metrics
+
+    def load(self) -> dict:
+        """Reads the snapshot and replays any deltas written after it"""
+        metadata = self._read_snapshot()
+        self.sequence = metadata.pop(sequence_key, 0)
+
+        for delta_key in self._list(self.delta_prefix):
+            sequence = int(delta_key.rsplit("/", 1)[1])
+            self.delta_keys.append(delta_key)
+            if sequence <= self.sequence:
+                # Already included in the snapshot, but not yet deleted
+                continue
+
+            body = get_file_s3(self.bucket, delta_key, self.s3_client)
+            self.delta_bytes += len(body)
+            delta = loads(body)
+            metadata.update(delta.get("updates", {}))
+            for key in delta.get("deletes", []):
+                metadata.pop(key, None)
+            self.sequence = sequence
+
+        if self.delta_keys:
+            logging.info(f"Replayed {len(self.delta_keys)} metadata deltas from {self.delta_prefix}")
+        return metadata
+
+    def append(self, updates: dict, deletes: list | None = None) -> None:
+        """Records changed and deleted metadata keys as a new delta"""
+        self._check_pending()
+        self.sequence += 1
+        delta_key = f"{self.delta_prefix}{self.sequence:010d}"
+        body = dumps({"updates": updates, "deletes": deletes or []})
+
+        self.delta_keys.append(delta_key)
+        self.delta_bytes += len(body)
+        self._submit(upload_file_s3, body, self.bucket, delta_key, self.s3_client)
+
+    def needs_compaction(self) -> bool:
+        return self.delta_bytes >= self.compaction_bytes or len(self.delta_keys) >= self.compaction_deltas
+
+    def compact(self, metadata: dict, wait: bool = True) -> None:
+        """Writes all of the metadata as a new snapshot, then deletes the deltas it replaces. The
+        metadata is serialised before returning, so it can be modified while the upload runs"""
+        self._check_pending()
+        snapshot = {**metadata, sequence_key: self.sequence}
+        if self.snapshot_format == "binary" and self.item_prefix:
+            body = encode_state(snapshot, self.item_prefix, compression=resolve_compression())
+        else:
+            body = dumps(snapshot)
+        delta_keys, self.delta_keys, self.delta_bytes = self.delta_keys, [], 0
+
+        logging.info(f"Compacting {len(delta_keys)} metadata deltas into {self.key}")
+        self._submit(upload_file_s3, body, self.bucket, self.key, self.s3_client)
+        self._submit(self._delete_keys, delta_keys)
+        if wait:
+            self.flush()
+
+    def load_checkpoint(self) -> dict | None:
+        """The checkpoint saved by an interrupted harvest, with every key it had seen under
+        "seen_keys", or None if there is none"""
+        body = get_file_s3(self.bucket, self.checkpoint_key, self.s3_client)
+        if body is None:
+            return None
+        checkpoint = loads(body)
+
+        seen_keys: set[str] = set()
+        for seen_key in self._list(self.seen_prefix):
+            seen_keys.update(loads(get_file_s3(self.bucket, seen_key, self.s3_client)))
+            self.checkpoint_sequence = max(self.checkpoint_sequence, int(seen_key.rsplit("/", 1)[1]))
+        checkpoint["seen_keys"] = seen_keys
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint: dict, seen_keys: list[str]) -> None:
+        """Saves a checkpoint, along with the keys seen since the previous one. It is uploaded after
+        any deltas already appended, so it never refers to metadata which has not been saved"""
+        self._check_pending()
+        if seen_keys:
+            self.checkpoint_sequence += 1
+            seen_key = f"{self.seen_prefix}{self.checkpoint_sequence:010d}"
+            self._submit(upload_file_s3, dumps(seen_keys), self.bucket, seen_key, self.s3_client)
+        self._submit(upload_file_s3, dumps(checkpoint), self.bucket, self.checkpoint_key, self.s3_client)
+
+    def clear_checkpoint(self) -> None:
+        """Deletes any saved checkpoint, once its harvest is complete or is not going to be resumed"""
+        self._check_pending()
+        self.checkpoint_sequence = 0
+        self._submit(self._delete_checkpoint)
+
+    def flush(self) -> None:
+        """Waits for all uploads to finish, raising the first error"""
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self) -> None:
+        self.flush()
+        self._executor.shutdown()
+
+    def _submit(self, fn: Any, *args: Any) -> None:
+        self._pending.append(self._executor.submit(self._run, fn, *args))
+
+    def _run(self, fn: Any, *args: Any) -> Any:
+        if self.metrics is None:
+            return fn(*args)
+        with self.metrics.time("metadata"):
+            return fn(*args)
+
+    def _check_pending(self) -> None:
+        """Raises any error from a finished upload and forgets the successful ones"""
+        still_pending = []
+        for future in self._pending:
+            if future.done():
+                future.result()
+            else:
+                still_pending.append(future)
+        self._pending = still_pending
+
+    def _read_snapshot(self) -> dict:
+        """Reads the snapshot in either format, streaming it from S3"""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return {}
+        body = response["Body"]
+        try:
+            return decode_state(body)
+        finally:
+            body.close()
+
+    def _list(self, prefix: str) -> list[str]:
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        keys = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj["Key"] for obj in page.get("Contents", []))
+        return sorted(keys)
+
+    def _delete_checkpoint(self) -> None:
+        # Listed once earlier uploads have finished, so that none of the checkpoint is missed
+        if keys := self._list(self.checkpoint_key):
+            self._delete_keys(keys)
+
+    def _delete_keys(self, keys: list[str]) -> None:
+        for i in range(0, len(keys), max_delete_keys):
+            objects = [{"Key": key} for key in keys[i : i + max_delete_keys]]
+            self.s3_client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True})
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import bisect
+import contextlib
+import datetime
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from typing import TypeVar
+
+import requests
+
+T = TypeVar("T")
+
+# Prometheus Pushgateway the metrics of each harvest are pushed to, e.g. http://pushgateway:9091
+metrics_pushgateway_url = os.environ.get("METRICS_PUSHGATEWAY_URL", "")
+# Directory the metrics of each harvest are written to for the node exporter's textfile collector
+metrics_textfile_dir = os.environ.get("METRICS_TEXTFILE_DIR", "")
+
+# Upper bounds in seconds of the phase latency histogram buckets
+latency_buckets = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+# Phases of a harvest which are timed:
+#   fetch: requesting a page from the Airbus API, including retries
+#   page_wait: the harvest waiting for the next page, which is less than fetch when pages are prefetched
+#   transform: generating a STAC item from an Airbus feature
+#   hash: serialising a document and comparing its hash to the stored one
+#   publish: writing a message's documents to S3 and sending it to Pulsar
+#   metadata: reading and uploading the harvest metadata
+phases = ("fetch", "page_wait", "transform", "hash", "publish", "metadata")
+
+# Counters of a harvest, and their help text
+counters = {
+    "pages": "Pages of Airbus data harvested",
+    "items_added": "Items harvested for the first time",
+    "items_updated": "Items republished because they changed",
+    "items_skipped": "Items unchanged since the previous harvest",
+    "items_deleted": "Items deleted because they are no longer in the Airbus catalogue",
+    "messages": "Messages sent to Pulsar",
+    "bytes_in": "Bytes of Airbus API responses",
+    "bytes_out": "Bytes of STAC documents written to S3",
+    "retries": "Airbus API requests retried",
+}
+
+
+class Histogram:
+    """Counts of observed values by bucket, as a Prometheus histogram"""
+
+    def __init__(self, buckets: tuple[float, ...] = latency_buckets) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def cumulative_counts(self) -> list[int]:
+        """The count of values up to each bucket's upper bound, and of all values"""
+        counts = []
+        total = 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class HarvestMetrics:
+    """
+    Counters and phase latency histograms for the harvest of one collection. They can be updated
+    from any thread, as pages are fetched and metadata uploaded on background threads. At the end
+    of a harvest they are exported as Prometheus metrics, if configured, and as a JSON report.
+    """
+
+    def __init__(self, collection: str) -> None:
+        self.collection = collection
+        self.started = time.time()
+        self.status = "running"
+        self.finished: float | None = None
+        self.counters: dict[str, int] = defaultdict(int)
+        self.histograms = {phase: Histogram() for phase in phases}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.histograms[phase].observe(seconds)
+
+    @contextlib.contextmanager
+    def time(self, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start)
+
+    def timed(self, iterator: Iterator[T], phase: str) -> Iterator[T]:
+        """Yields from an iterator, timing how long each item takes to arrive"""
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(phase, time.perf_counter() - start)
+            yield item
+
+    def finish(self, status: str = "succeeded") -> None:
+        self.status = status
+        self.finished = time.time()
+
+    def report(self) -> dict:
+        """A summary of the harvest, written as JSON at the end of it"""
+        finished = self.finished or time.time()
+        with self._lock:
+            return {
+                "collection": self.collection,
+                "status": self.status,
+                "started": _timestamp(self.started),
+                "finished": _timestamp(finished),
+                "duration_seconds": round(finished - self.started, 3),
+                "counters": {name: self.counters[name] for name in counters},
+                "phases": {
+                    phase: {
+                        "count": histogram.count,
+                        "seconds": round(histogram.sum, 6),
+                        "mean_seconds": round(histogram.sum / histogram.count, 6) if histogram.count else 0,
+                        "max_seconds": round(histogram.max, 6),
+                    }
+                    for phase, histogram in self.histograms.items()
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        labels = f'collection="{self.collection}"'
+        finished = self.finished or time.time()
+        lines = [
+            "# HELP airbus_harvest_phase_seconds Time spent in each phase of a harvest",
+            "# TYPE airbus_harvest_phase_seconds histogram",
+        ]
+        with self._lock:
+            for phase, histogram in self.histograms.items():
+                phase_labels = f'{labels},phase="{phase}"'
+                bounds = [*(str(bound) for bound in histogram.buckets), "+Inf"]
+                for bound, count in zip(bounds, histogram.cumulative_counts(), strict=True):
+                    lines.append(f'airbus_harvest_phase_seconds_bucket{{{phase_labels},le="{bound}"}} {count}')
+                lines.append(f"airbus_harvest_phase_seconds_sum{{{phase_labels}}} {histogram.sum}")
+                lines.append(f"airbus_harvest_phase_seconds_count{{{phase_labels}}} {histogram.count}")
+            for name, help_text in counters.items():
+                lines.append(f"# HELP airbus_harvest_{name}_total {help_text}")
+                lines.append(f"# TYPE airbus_harvest_{name}_total counter")
+                lines.append(f"airbus_harvest_{name}_total{{{labels}}} {self.counters[name]}")
+        lines += [
+            "# HELP airbus_harvest_duration_seconds Duration of the harvest",
+            "# TYPE airbus_harvest_duration_seconds gauge",
+            f"airbus_harvest_duration_seconds{{{labels}}} {finished - self.started}",
+            "# HELP airbus_harvest_finished_timestamp_seconds When the harvest finished, by status",
+            "# TYPE airbus_harvest_finished_timestamp_seconds gauge",
+            f'airbus_harvest_finished_timestamp_seconds{{{labels},status="{self.status}"}} {finished}',
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def export_metrics(
+    metrics: HarvestMetrics, pushgateway_url: str = metrics_pushgateway_url, textfile_dir: str = metrics_textfile_dir
+) -> None:
+    """Pushes the metrics to a Pushgateway and writes them for the textfile collector, if either is
+    configured. Failures are logged rather than raised, so they do not fail the harvest"""
+    if not (pushgateway_url or textfile_dir):
+        return
+    content = metrics.to_prometheus()
+
+    if textfile_dir:
+        # Written to a temporary file and renamed, so the collector never reads a partial file
+        path = os.path.join(textfile_dir, f"airbus_harvest_{metrics.collection}.prom")
+        try:
+            with open(f"{path}.tmp", "w") as f:
+                f.write(content)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logging.error(f"Failed to write metrics to {path}: {e}")
+
+    if pushgateway_url:
+        url = f"{pushgateway_url.rstrip('/')}/metrics/job/airbus_harvester/collection/{metrics.collection}"
+        try:
+            response = requests.put(url, data=content.encode("utf-8"), timeout=10)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logging.error(f"Failed to push metrics to {url}: {e}")
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.datetime.fromtimestamp(seconds, datetime.UTC).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
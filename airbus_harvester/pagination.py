@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import copy
+import datetime
+import logging
+import os
+import queue
+import threading
+from collections.abc import Callable, Iterator
+from typing import Any, NamedTuple
+
+# Number of pages fetched ahead of the page currently being processed. 0 disables prefetching
+prefetch_depth = int(os.environ.get("PREFETCH_DEPTH", 1))
+
+# Number of last update date windows counter paginated collections are split into, and the number
+# of windows harvested concurrently
+harvest_windows = int(os.environ.get("HARVEST_WINDOWS", 1))
+harvest_workers = int(os.environ.get("HARVEST_WORKERS", harvest_windows))
+
+date_format = "%Y-%m-%dT%H:%M:%SZ"
+
+# Lower bound used when the counter pagination has to narrow the search by last update date
+archive_start_date = "2018-10-03T12:00:00Z"
+
+# The Airbus opensearch API does not allow startPage to go beyond this
+max_counter_pages = 50
+
+
+class Page(NamedTuple):
+    """A page of Airbus data, with the index of the window it was paged from and the position of
+    that window's cursor after it"""
+
+    url: str
+    body: dict
+    window: int
+    position: dict
+
+
+class PageCursor:
+    """
+    The URL and request body of the next page of Airbus data, following the pagination method in
+    the config. The request body is copied so the config passed in is not modified. If a date range
+    is given, counter pagination is limited to items last updated within it.
+    """
+
+    def __init__(self, config: dict, date_range: tuple[str, str] | None = None) -> None:
+        self.config = {**config, "body": copy.deepcopy(config["body"])}
+        self.date_range = date_range
+        self.range_start = archive_start_date
+        if date_range:
+            self.range_start = date_range[0]
+            self.config["body"]["lastUpdateDate"] = f"[{date_range[0]},{date_range[1]}]"
+        self.next_url: str | None = config["url"]
+        self.url_count = 0
+
+    @classmethod
+    def from_position(cls, config: dict, position: dict) -> PageCursor:
+        """A cursor continuing from a position saved by an earlier harvest"""
+        cursor = cls(config, tuple(position["date_range"]) if position["date_range"] else None)
+        cursor.config["body"] = copy.deepcopy(position["body"])
+        cursor.next_url = position["next_url"]
+        cursor.url_count = position["url_count"]
+        return cursor
+
+    def position(self) -> dict:
+        """Everything needed to continue paging from where the cursor is now. next_url is None once
+        the window has been paged through"""
+        return {
+            "date_range": list(self.date_range) if self.date_range else None,
+            "next_url": self.next_url,
+            "body": copy.deepcopy(self.config["body"]),
+            "url_count": self.url_count,
+        }
+
+    def advance(self, page_url: str, body: dict) -> None:
+        """Moves on to the page after the one just fetched from page_url"""
+        self.url_count += 1
+        features = body.get("features", [])
+
+        if self.config["pagination_method"] == "link":
+            links = body.get("_links")
+            if links is None:
+                msg_text = f"Missing '_links' in response from {page_url}"
+                logging.error(msg_text)
+                raise AttributeError(msg_text)
+            self.next_url = links.get("next")
+        elif self.config["pagination_method"] == "counter":
+            if not features:
+                self.next_url = None
+            else:
+                start_page = self.config["body"].get("startPage", 1)
+                if start_page >= max_counter_pages:
+                    # The counter can only go up to 50. Limit the search to items last updated no
+                    # later than the last one seen, and page through those from the start
+                    self.config["body"]["lastUpdateDate"] = (
+                        f"[{self.range_start},{features[-1]['properties']['lastUpdateDate']}]"
+                    )
+                    self.config["body"]["startPage"] = 1
+                else:
+                    self.config["body"]["startPage"] = start_page + 1
+
+        if self.date_range:
+            logging.info(f"Page {self.url_count} of window {self.date_range} next URL: {self.next_url}")
+        else:
+            logging.info(f"Page {self.url_count} next URL: {self.next_url}")
+
+
+def iter_pages(
+    config: dict,
+    fetch: Callable[[str, dict], dict],
+    date_range: tuple[str, str] | None = None,
+    cursor: PageCursor | None = None,
+) -> Iterator[tuple[str, dict]]:
+    """Yields the URL and body of each page of Airbus data, following the pagination method in
+    the config. If a date range is given, counter pagination is limited to items last updated within
+    it. If a cursor is given, paging continues from it instead"""
+    cursor = cursor or PageCursor(config, date_range)
+    while cursor.next_url:
+        page_url = cursor.next_url
+        body = fetch(page_url, cursor.config)
+        cursor.advance(page_url, body)
+        yield page_url, body
+
+
+def split_date_range(start: str, end: str, windows: int) -> list[tuple[str, str]]:
+    """Splits a range of ISO 8601 dates into the given number of consecutive windows, newest first.
+    Neighbouring windows share their boundary instant, so an item updated exactly on a boundary may
+    be returned by both"""
+    start_date = datetime.datetime.fromisoformat(start)
+    end_date = datetime.datetime.fromisoformat(end)
+    step = (end_date - start_date) / max(windows, 1)
+
+    boundaries = [start_date + step * i for i in range(windows)] + [end_date]
+    date_ranges = [
+        (boundaries[i].strftime(date_format), boundaries[i + 1].strftime(date_format)) for i in range(windows)
+    ]
+    return list(reversed(date_ranges))
+
+
+def harvest_pages(
+    config: dict,
+    fetch: Callable[[str, dict], dict],
+    since: str | None = None,
+    windows: int = harvest_windows,
+    workers: int = harvest_workers,
+    depth: int = prefetch_depth,
+    cursors: list[PageCursor] | None = None,
+) -> Iterator[Page]:
+    """Yields every page of Airbus data for a config. For counter paginated collections, `since`
+    limits the harvest to items last updated after that date, and the range can be split into time
+    windows which are fetched concurrently, each with its own page counter. Otherwise pages are
+    fetched in order, prefetching up to `depth` pages. The cursors of the windows can be given
+    instead, to continue an interrupted harvest"""
+    if cursors is None:
+        cursors = page_cursors(config, since, windows)
+    windows_pages = [window_pages(cursor, fetch, window) for window, cursor in enumerate(cursors) if cursor.next_url]
+    if len(windows_pages) > 1:
+        date_ranges = [cursor.date_range for cursor in cursors if cursor.next_url]
+        logging.info(f"Harvesting {len(windows_pages)} windows with {workers} workers: {date_ranges}")
+        return concurrent_pages(windows_pages, workers, depth)
+    if not windows_pages:
+        return iter(())
+
+    return prefetch(windows_pages[0], depth)
+
+
+def window_pages(cursor: PageCursor, fetch: Callable[[str, dict], dict], window: int) -> Iterator[Page]:
+    """Yields the pages of one window, with the cursor position after each"""
+    for page_url, body in iter_pages(cursor.config, fetch, cursor=cursor):
+        yield Page(page_url, body, window, cursor.position())
+
+
+def page_cursors(config: dict, since: str | None = None, windows: int = harvest_windows) -> list[PageCursor]:
+    """Cursors at the start of each window a harvest is paged through"""
+    return [PageCursor(config, date_range) for date_range in page_date_ranges(config, since, windows)]
+
+
+def page_date_ranges(config: dict, since: str | None = None, windows: int = harvest_windows) -> list:
+    """The last update date windows a harvest is paged through separately. Only counter paginated
+    collections can be limited by date, so other collections have a single unlimited window (None)"""
+    if config["pagination_method"] != "counter":
+        return [None]
+
+    now = datetime.datetime.now(datetime.UTC).strftime(date_format)
+    if windows > 1:
+        return split_date_range(since or archive_start_date, now, windows)
+    return [(since, now) if since else None]
+
+
+def prefetch(pages: Iterator[Any], depth: int = prefetch_depth) -> Iterator[Any]:
+    """Runs an iterator of pages in a background thread so that up to `depth` pages are fetched
+    while the caller is still processing the current one. Exceptions raised while fetching are
+    re-raised in the caller"""
+    if depth <= 0:
+        return pages
+    return concurrent_pages([pages], 1, depth)
+
+
+def concurrent_pages(page_iterators: list[Iterator[Any]], workers: int, depth: int) -> Iterator[Any]:
+    """Drains several iterators of pages using a pool of worker threads, yielding pages in the
+    order they arrive. At most `depth` pages per worker are held waiting for the caller. Exceptions
+    raised while fetching are re-raised in the caller"""
+    workers = max(min(workers, len(page_iterators)), 1)
+    page_queue: queue.Queue = queue.Queue(maxsize=max(depth, 1) * workers)
+    pending = list(reversed(page_iterators))
+    pending_lock = threading.Lock()
+    stop = threading.Event()
+    done = object()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                page_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker() -> None:
+        try:
+            while not stop.is_set():
+                with pending_lock:
+                    if not pending:
+                        break
+                    pages = pending.pop()
+                for page in pages:
+                    if not put((page, None)):
+                        return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+
+    def consume() -> Iterator[Any]:
+        threads = [threading.Thread(target=worker, name=f"airbus-pages-{i}", daemon=True) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        running = workers
+        try:
+            while running:
+                page, error = page_queue.get()
+                if page is done:
+                    if error is not None:
+                        raise error
+                    running -= 1
+                    continue
+                yield page
+        finally:
+            # Stop the workers if the caller finishes early or a worker failed
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    return consume()
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import cProfile
+import datetime
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any
+
+from eodhp_utils.aws.s3 import upload_file_s3
+
+# Seconds between the stack samples taken by the sampling profiler
+profile_sample_interval = float(os.environ.get("HARVEST_PROFILE_INTERVAL", 0.005))
+
+# Prefix in the harvest bucket profiles are uploaded under, when not written to a local directory
+profile_s3_prefix = "harvest-profiles/"
+
+
+class StackSampler:
+    """
+    Samples the stack of every other thread at an interval, from a background thread, and counts
+    each distinct stack. The counts are written as collapsed stacks, one line per stack of
+    semicolon separated frames starting with the thread name, as read by flamegraph.pl and
+    speedscope. The harvest itself is not slowed down other than by the sampling thread taking the
+    GIL, so the overhead is set by the interval.
+    """
+
+    def __init__(self, interval: float = profile_sample_interval) -> None:
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="airbus-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                current: Any = frame
+                while current is not None:
+                    stack.append(f"{current.f_globals.get('__name__', '?')}:{current.f_code.co_qualname}")
+                    current = current.f_back
+                self.stacks[";".join([names.get(ident, str(ident)), *reversed(stack)])] += 1
+            self.samples += 1
+
+    def collapsed(self) -> bytes:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()).encode("utf-8")
+
+
+class HarvestProfiler:
+    """
+    Profiles a harvest, either by sampling the stacks of all its threads ("sample"), or by tracing
+    every call made by the harvest thread with cProfile ("cprofile"), which is more detailed but
+    slows the harvest down more. Profiling can be limited to the first max_pages pages or
+    max_seconds seconds of the harvest. The profile is written to a local directory if one is
+    given, or uploaded to the harvest's S3 bucket otherwise.
+    """
+
+    def __init__(self, mode: str, max_pages: int = 0, max_seconds: float = 0, output_dir: str = "") -> None:
+        if mode not in ("sample", "cprofile"):
+            raise ValueError(f"Unknown profiling mode {mode}")
+        self.mode = mode
+        self.max_pages = max_pages
+        self.max_seconds = max_seconds
+        self.output_dir = output_dir
+        self.sampler = StackSampler() if mode == "sample" else None
+        self.tracer = cProfile.Profile() if mode == "cprofile" else None
+        self.running = False
+        self.started = 0.0
+        self.pages = 0
+
+    def start(self) -> None:
+        """Starts profiling. For cprofile, only calls made by the thread calling this are traced"""
+        logging.info(f"Profiling harvest with {self.mode}")
+        self.started = time.monotonic()
+        self.running = True
+        if self.sampler:
+            self.sampler.start()
+        if self.tracer:
+            self.tracer.enable()
+
+    def page_done(self) -> None:
+        """Stops profiling once the page or time limit is reached. Called after each page"""
+        self.pages += 1
+        if not self.running:
+            return
+        if (self.max_pages and self.pages >= self.max_pages) or (
+            self.max_seconds and time.monotonic() - self.started >= self.max_seconds
+        ):
+            logging.info(f"Stopping profiling after {self.pages} pages")
+            self.stop()
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        if self.tracer:
+            self.tracer.disable()
+        if self.sampler:
+            self.sampler.stop()
+
+    def profile(self) -> tuple[str, bytes]:
+        """The file extension and content of the profile"""
+        if self.sampler:
+            return "collapsed", self.sampler.collapsed()
+        # pstats can only be dumped to a file
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "harvest.pstats")
+            pstats.Stats(self.tracer).dump_stats(path)
+            with open(path, "rb") as f:
+                return "pstats", f.read()
+
+    def save(self, name: str, s3_bucket: str, s3_client: Any) -> str:
+        """Stops profiling and writes the profile, returning where it was written"""
+        self.stop()
+        extension, content = self.profile()
+        timestamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%SZ")
+        filename = f"{name}-{timestamp}.{extension}"
+
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+            location = os.path.join(self.output_dir, filename)
+            with open(location, "wb") as f:
+                f.write(content)
+        else:
+            key = f"{profile_s3_prefix}{filename}"
+            upload_file_s3(content, s3_bucket, key, s3_client)
+            location = f"s3://{s3_bucket}/{key}"
+        logging.info(f"Wrote {self.mode} profile of {self.pages} pages to {location}")
+        return location
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library json module is used without it
+    orjson = None  # type: ignore[assignment]
+
+# JSON library used to parse responses and serialise documents: "orjson", "json", or "auto" to use
+# orjson when it is installed
+json_backend = os.environ.get("JSON_BACKEND", "auto").lower()
+
+# Recorded in the harvest metadata so that hashes of differently serialised documents are recognised.
+# orjson and json write some floats differently (e.g. 1e16 and 1e+16), so each has its own format
+json_document_format = "canonical-json"
+orjson_document_format = "canonical-json-orjson"
+
+if json_backend == "orjson" and orjson is None:
+    logging.warning("JSON_BACKEND is orjson but orjson is not installed. Using json")
+
+
+def _use_orjson() -> bool:
+    return orjson is not None and json_backend != "json"
+
+
+def document_format() -> str:
+    """The format canonical_dumps serialises documents in, which depends on the JSON backend"""
+    return orjson_document_format if _use_orjson() else json_document_format
+
+
+def is_format_available(output_format: str) -> bool:
+    return output_format != orjson_document_format or orjson is not None
+
+
+def canonical_dumps(data: Any, output_format: str | None = None) -> bytes:
+    """Serialises a document to compact UTF-8 JSON with sorted keys, so the same document always
+    gives the same bytes regardless of the order its keys were added in. These bytes are used both
+    for change detection and as the body of the file written to S3. A document format can be given
+    to serialise the document as another backend would, such as the one a stored hash was made with"""
+    output_format = output_format or document_format()
+    if output_format == orjson_document_format:
+        if orjson is None:
+            raise ValueError("orjson is not installed")
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    if output_format == json_document_format:
+        return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    raise ValueError(f"Unknown document format {output_format}")
+
+
+def dumps(data: Any) -> bytes:
+    """Serialises data to compact UTF-8 JSON, keeping the key order"""
+    if orjson is not None and _use_orjson():
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def loads(data: str | bytes) -> Any:
+    """Parses JSON. Raises json.JSONDecodeError, which orjson's errors are a subclass of, if it is invalid"""
+    if orjson is not None and _use_orjson():
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import logging
+import os
+import struct
+from typing import IO, Any
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, gzip is used without it
+    zstandard = None  # type: ignore[assignment]
+
+from airbus_harvester.serialization import dumps, loads
+
+# Format the harvest metadata snapshot is written in: "binary", or "json" as written by older versions
+metadata_format = os.environ.get("METADATA_FORMAT", "binary").lower()
+# Compression of binary snapshots: "gzip", "zstd", or "auto" to use zstd when zstandard is installed
+metadata_compression = os.environ.get("METADATA_COMPRESSION", "auto").lower()
+
+# Binary snapshots start with the magic bytes, a format version and the compression used
+magic = b"ABHM"
+format_version = 2
+compression_ids = {"gzip": 1, "zstd": 2}
+
+# Binary snapshot layout, after decompression:
+#   header length (u32) | JSON header | blocks of item records
+# The header holds the item key prefix and suffix, the number of blocks, and all metadata which is
+# not an item hash. Each block holds items with the same digest and fingerprint lengths:
+#   item count (u32) | digest length (u8) | fingerprint length (u8) | IDs length (u32) |
+#   newline separated item IDs | digests | fingerprints
+# Version 1 blocks had no fingerprints, or fingerprint length
+header_struct = struct.Struct("<I")
+block_structs = {1: struct.Struct("<IBI"), 2: struct.Struct("<IBBI")}
+block_items = 1 << 16
+
+
+def resolve_compression(compression: str = metadata_compression) -> str:
+    if compression == "zstd" and zstandard is None:
+        logging.warning("Metadata compression is zstd but zstandard is not installed. Using gzip")
+    if compression in ("zstd", "auto") and zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+
+def _digest_bytes(value: str) -> bytes | None:
+    """The binary form of a lowercase hex digest, or None if the value is not one"""
+    if len(value) % 2 or len(value) > 510:
+        return None
+    try:
+        digest = bytes.fromhex(value)
+    except ValueError:
+        return None
+    return digest if digest.hex() == value else None
+
+
+def _stored_hash_bytes(value: Any) -> tuple[bytes, bytes] | None:
+    """The binary digest and fingerprint of a stored item hash, or None if the value is not one"""
+    if not isinstance(value, str):
+        return None
+    document_hash, separator, fingerprint = value.partition(":")
+    digest = _digest_bytes(document_hash)
+    fingerprint_digest = _digest_bytes(fingerprint) if separator else b""
+    if not digest or fingerprint_digest is None or (separator and not fingerprint_digest):
+        return None
+    return digest, fingerprint_digest
+
+
+def encode_state(metadata: dict, item_prefix: str, item_suffix: str = ".json", compression: str = "gzip") -> bytes:
+    """Encodes harvest metadata as a compressed binary snapshot. Items are stored by their ID within
+    the collection and their binary digest, rather than their full key and hex digest"""
+    other = {}
+    items_by_lengths: dict[tuple[int, int], tuple[list[str], list[bytes], list[bytes]]] = {}
+    for key, value in metadata.items():
+        hashes = None
+        if key.startswith(item_prefix) and key.endswith(item_suffix):
+            hashes = _stored_hash_bytes(value)
+        item_id = key[len(item_prefix) : len(key) - len(item_suffix)]
+        if hashes is None or "\n" in item_id:
+            other[key] = value
+            continue
+        digest, fingerprint = hashes
+        ids, digests, fingerprints = items_by_lengths.setdefault((len(digest), len(fingerprint)), ([], [], []))
+        ids.append(item_id)
+        digests.append(digest)
+        fingerprints.append(fingerprint)
+
+    block_struct = block_structs[format_version]
+    blocks = io.BytesIO()
+    block_count = 0
+    for (digest_length, fingerprint_length), (ids, digests, fingerprints) in items_by_lengths.items():
+        for i in range(0, len(ids), block_items):
+            encoded_ids = "\n".join(ids[i : i + block_items]).encode("utf-8")
+            block_digests = digests[i : i + block_items]
+            blocks.write(block_struct.pack(len(block_digests), digest_length, fingerprint_length, len(encoded_ids)))
+            blocks.write(encoded_ids)
+            blocks.write(b"".join(block_digests))
+            blocks.write(b"".join(fingerprints[i : i + block_items]))
+            block_count += 1
+
+    header = dumps({"item_prefix": item_prefix, "item_suffix": item_suffix, "blocks": block_count, "other": other})
+    payload = header_struct.pack(len(header)) + header + blocks.getvalue()
+
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires zstandard to be installed")
+        compressed = zstandard.ZstdCompressor().compress(payload)
+    else:
+        compressed = gzip.compress(payload, compresslevel=6, mtime=0)
+    return magic + bytes((format_version, compression_ids[compression])) + compressed
+
+
+def decode_state(stream: IO[bytes]) -> dict:
+    """Decodes harvest metadata from a binary snapshot or a JSON file. Binary snapshots are
+    decompressed and decoded a block at a time as the stream is read"""
+    prefix = stream.read(len(magic) + 2)
+    if not prefix.startswith(magic):
+        # JSON written by older versions
+        return loads(prefix + stream.read())
+
+    version, compression_id = prefix[len(magic)], prefix[len(magic) + 1]
+    if version not in block_structs:
+        raise ValueError(f"Unsupported metadata format version {version}")
+    if compression_id == compression_ids["zstd"]:
+        if zstandard is None:
+            raise ValueError("Metadata is compressed with zstd, which requires zstandard to be installed")
+        decompressed: IO[bytes] | io.BufferedIOBase = zstandard.ZstdDecompressor().stream_reader(stream)
+    elif compression_id == compression_ids["gzip"]:
+        decompressed = gzip.GzipFile(fileobj=stream, mode="rb")
+    else:
+        raise ValueError(f"Unsupported metadata compression {compression_id}")
+
+    (header_length,) = header_struct.unpack(_read_exact(decompressed, header_struct.size))
+    header = json.loads(_read_exact(decompressed, header_length))
+    item_prefix, item_suffix = header["item_prefix"], header["item_suffix"]
+
+    metadata = dict(header["other"])
+    block_struct = block_structs[version]
+    for _ in range(header["blocks"]):
+        if version == 1:
+            count, digest_length, ids_length = block_struct.unpack(_read_exact(decompressed, block_struct.size))
+            fingerprint_length = 0
+        else:
+            count, digest_length, fingerprint_length, ids_length = block_struct.unpack(
+                _read_exact(decompressed, block_struct.size)
+            )
+        ids = _read_exact(decompressed, ids_length).decode("utf-8").split("\n") if count else []
+        keys = [f"{item_prefix}{item_id}{item_suffix}" for item_id in ids]
+        values = _split_hex(_read_exact(decompressed, count * digest_length), digest_length)
+        if fingerprint_length:
+            fingerprints = _split_hex(_read_exact(decompressed, count * fingerprint_length), fingerprint_length)
+            values = [f"{digest}:{fingerprint}" for digest, fingerprint in zip(values, fingerprints, strict=True)]
+        metadata.update(zip(keys, values, strict=True))
+    return metadata
+
+
+def _read_exact(stream: IO[bytes] | io.BufferedIOBase, size: int) -> bytes:
+    data = stream.read(size)
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise ValueError("Truncated metadata snapshot")
+        data += chunk
+    return data
+
+
+def _split_hex(data: bytes, size: int) -> list[str]:
+    """Hex strings of consecutive `size` byte values"""
+    hexed = data.hex()
+    step = size * 2
+    return [hexed[i : i + step] for i in range(0, len(hexed), step)]
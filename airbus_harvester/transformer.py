@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import logging
+import os
+from collections.abc import Callable
+from typing import Any
+
+from inflection import underscore
+
+from airbus_harvester.geometry import coordinates_to_bbox
+from airbus_harvester.serialization import canonical_dumps
+
+# Increase when a change to the transformer changes the items it generates, so that fingerprints of
+# unchanged Airbus features are no longer trusted and every item is regenerated
+transformer_version = 1
+
+# Item properties which make up the temporal extent of a collection
+temporal_keys = ("datetime", "start_datetime", "end_datetime")
+
+# Collection config which only affects change detection, not the items generated
+change_detection_keys = ("volatile_fields", "volatile_refresh_days")
+
+mime_types = {
+    ".tiff": "image/tiff; application=geotiff; profile=cloud-optimized",
+    ".tif": "image/tiff; application=geotiff; profile=cloud-optimized",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+}
+
+
+def convert_look_direction(value: Any) -> Any:
+    """Convert look direction to human readable format"""
+    return "right" if value.upper() == "R" else "left" if value.upper() == "L" else value
+
+
+def convert_polarization_channels(value: Any) -> Any:
+    """Split dual polarisation channels into separate values"""
+    return [value[i : i + 2] for i in range(0, len(value), 2)]
+
+
+def convert_geometry_centroid(value: Any) -> Any:
+    if isinstance(value, dict):
+        return value
+    # Convert list to dict for consistency throughout the catalogue
+    if isinstance(value, list) and len(value) == 2:
+        return {"lat": value[1], "lon": value[0]}
+    # Type not understood - ignore it
+    return None
+
+
+# Conversions to STAC format for values of specific keys
+value_converters: dict[str, Callable[[Any], Any]] = {
+    "lookDirection": convert_look_direction,
+    "polarizationChannels": convert_polarization_channels,
+    "geometry_centroid": convert_geometry_centroid,
+}
+
+
+def modify_value(key: str, value: Any) -> Any:
+    """Modify a specific value to STAC format depending on the key"""
+    converter = value_converters.get(key)
+    return converter(value) if converter else value
+
+
+class ExternalUrl:
+    """An external URL in the Airbus response which is added to STAC items as an asset"""
+
+    __slots__ = ("mapped_key", "name", "path_keys", "proxy")
+
+    def __init__(self, name: str, path: str, proxy: bool = False) -> None:
+        self.name = name
+        self.path_keys = tuple(path.split("."))
+        self.mapped_key = self.path_keys[-1]
+        self.proxy = proxy
+
+    def add_asset(self, data: dict, assets: dict, mapped_keys: set, proxy: str | None = None) -> None:
+        """Adds the URL to the assets if it is present in the data, proxied if a proxy is given"""
+        value: Any = data
+        for path_key in self.path_keys:
+            value = value.get(path_key)
+            if value is None:
+                return
+        if not value or not isinstance(value, str):
+            return
+
+        mime_type = mime_types.get(os.path.splitext(value)[1].lower(), "application/octet-stream")
+        if proxy:
+            assets[f"external_{self.name}"] = {"href": value, "type": mime_type}
+            assets[self.name] = {"href": f"{proxy}/{self.name}", "type": mime_type}
+        else:
+            assets[self.name] = {"href": value, "type": mime_type}
+        mapped_keys.add(self.mapped_key)
+
+
+def handle_external_url(
+    data: dict,
+    links: list,
+    assets: dict,
+    mapped_keys: set,
+    name: str,
+    path: str,
+    proxy: str | None = None,
+) -> None:
+    """Convert external URL to link and asset"""
+    ExternalUrl(name, path).add_asset(data, assets, mapped_keys, proxy)
+
+
+class ItemTransformer:
+    """
+    Converts Airbus features to STAC items for one collection config. Everything that only depends
+    on the config - the property mapping and its value conversions, the external URL paths, and
+    the proxy URL prefix - is worked out once when the transformer is created, and the STAC name of
+    each unmapped Airbus property is worked out the first time it is seen.
+    """
+
+    def __init__(self, config: dict, proxy_base_url: str, catalogue_root: str) -> None:
+        self.config = config
+        self.proxy_base_url = proxy_base_url
+        self.catalogue_root = catalogue_root
+        self.item_id_key = config["item_id_key"]
+        self.collection_name = config["collection_name"]
+        self.stac_extensions = config["stac_extensions"]
+        self.stac_properties = config["stac_properties"]
+        self.property_map = [
+            (stac_key, airbus_key, value_converters.get(airbus_key))
+            for stac_key, airbus_key in config["stac_properties_map"].items()
+        ]
+        self.external_urls = [
+            ExternalUrl(url_config["name"], url_config["path"], bool(url_config.get("proxy", False)))
+            for url_config in config["external_urls"]
+        ]
+        self.proxy_prefix = (
+            f"{proxy_base_url}/api/catalogue/stac/{catalogue_root}/catalogs/airbus/"
+            f"collections/{self.collection_name}/items/"
+        )
+        self._renamed_keys: dict[str, tuple[str, Callable[[Any], Any] | None]] = {}
+
+    def signature(self) -> bytes:
+        """Everything the items generated depend on, other than the Airbus features themselves"""
+        config = {key: value for key, value in self.config.items() if key not in change_detection_keys}
+        return canonical_dumps([transformer_version, config, self.proxy_base_url, self.catalogue_root])
+
+    def _rename(self, key: str) -> tuple[str, Callable[[Any], Any] | None]:
+        renamed = self._renamed_keys.get(key)
+        if renamed is None:
+            property_key = underscore(key)
+            renamed = self._renamed_keys[key] = (property_key, value_converters.get(property_key))
+        return renamed
+
+    def transform(self, data: dict, bbox: list | None = None) -> dict:
+        """Catalogue item for an Airbus feature. The bbox is calculated from the geometry if not given"""
+        airbus_properties = data["properties"]
+        item_id = airbus_properties[self.item_id_key]
+        logging.info(f"Processing item {item_id}")
+
+        coordinates = data["geometry"]["coordinates"][0]
+        if bbox is None:
+            bbox = coordinates_to_bbox(coordinates)
+
+        mapped_keys = set()
+        properties = self.stac_properties.copy()
+        assets: dict = {}
+
+        for stac_key, airbus_key, converter in self.property_map:
+            value = airbus_properties.get(airbus_key)
+            if value is not None and value != "":
+                properties[stac_key] = converter(value) if converter else value
+                mapped_keys.add(airbus_key)
+
+        for external_url in self.external_urls:
+            proxy = f"{self.proxy_prefix}{item_id}" if external_url.proxy else None
+            external_url.add_asset(data, assets, mapped_keys, proxy)
+
+        for key, value in airbus_properties.items():
+            if key not in mapped_keys and value is not None and value != "":
+                property_key, converter = self._rename(key)
+                properties[property_key] = converter(value) if converter else value
+
+        return {
+            "type": "Feature",
+            "stac_version": "1.0.0",
+            "stac_extensions": self.stac_extensions,
+            "id": item_id,
+            "collection": self.collection_name,
+            "geometry": {"type": "Polygon", "coordinates": [coordinates]},
+            "bbox": bbox,
+            "properties": properties,
+            "links": [],
+            "assets": assets,
+        }
+
+    def item_times(self, data: dict) -> dict:
+        """The datetime properties transform would give an item, without transforming the rest of it.
+        Used to update the collection's temporal extent for items which do not need transforming"""
+        airbus_properties = data["properties"]
+        properties = {key: value for key, value in self.stac_properties.items() if key in temporal_keys}
+
+        mapped_keys = set()
+        for stac_key, airbus_key, converter in self.property_map:
+            value = airbus_properties.get(airbus_key)
+            if value is not None and value != "":
+                mapped_keys.add(airbus_key)
+                if stac_key in temporal_keys:
+                    properties[stac_key] = converter(value) if converter else value
+
+        for key, value in airbus_properties.items():
+            if key not in mapped_keys and value is not None and value != "":
+                property_key, converter = self._rename(key)
+                if property_key in temporal_keys:
+                    properties[property_key] = converter(value) if converter else value
+
+        return {"properties": properties}
@@ -0,0 +1,47 @@
+"""Compares the vectorised and plain Python bbox calculations for a page of features.
+
+Run with: uv run --extra fast python benchmarks/bench_geometry.py
+"""
+
+from __future__ import annotations
+
+import random
+import timeit
+
+from airbus_harvester import geometry
+from airbus_harvester.geometry import page_geometry
+
+
+def make_features(count: int, vertices: int = 5) -> list[dict]:
+    features = []
+    for _ in range(count):
+        x, y = random.uniform(-180, 180), random.uniform(-90, 90)
+        ring = [[x + random.random(), y + random.random()] for _ in range(vertices - 1)]
+        features.append({"geometry": {"type": "Polygon", "coordinates": [[*ring, ring[0]]]}})
+    return features
+
+
+def main() -> None:
+    numpy = geometry.np
+    if numpy is None:
+        raise SystemExit("numpy is required to compare against the vectorised implementation")
+
+    print(f"{'features':>10} {'python (ms)':>12} {'numpy (ms)':>12} {'speedup':>8}")
+    for count in (200, 2_000, 20_000):
+        features = make_features(count)
+        repeats = max(1, 20_000 // count)
+
+        geometry.np = None
+        python_time = (
+            min(timeit.repeat(lambda features=features: page_geometry(features), number=repeats, repeat=5)) / repeats
+        )
+        geometry.np = numpy
+        numpy_time = (
+            min(timeit.repeat(lambda features=features: page_geometry(features), number=repeats, repeat=5)) / repeats
+        )
+
+        print(f"{count:>10} {python_time * 1e3:>12.3f} {numpy_time * 1e3:>12.3f} {python_time / numpy_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""Measures end to end harvest throughput against a local fake Airbus API, moto S3 and a fake Pulsar
+producer. Both the SAR replication endpoint, paged by `_links.next`, and the opensearch endpoint,
+paged by `startPage` and `lastUpdateDate`, are emulated. Each collection is harvested twice: first
+into an empty bucket, when every item is new, then again when every item is unchanged. Each run is
+made in a fresh process, so the peak RSS reported is its own.
+
+Run with: uv run python benchmarks/bench_harvest.py
+Compare settings with e.g. --env MESSAGER_WRITE_WORKERS=8, and save results with --save. Saved
+results are appended to benchmarks/results/harvest.jsonl, and later runs with the same parameters
+are compared to the most recent saved one.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import datetime
+import json
+import logging
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tomllib
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, cast
+from urllib.parse import parse_qs, urlsplit
+
+root = Path(__file__).resolve().parent.parent
+results_path = root / "benchmarks" / "results" / "harvest.jsonl"
+
+bucket_name = "benchmark-bucket"
+# Newest last update time of the fake items. Each older item was updated a minute earlier
+newest_update = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+
+
+class FakeAirbusApi(ThreadingHTTPServer):
+    """
+    A local HTTP server returning pages of generated Airbus features, for the SAR replication
+    endpoint (GET /replication) and the opensearch endpoint (POST /opensearch). Requests wait
+    `latency` seconds, and fail with a 503 at the given rate.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, items: int, items_per_page: int, item_bytes: int, latency: float, error_rate: float) -> None:
+        super().__init__(("127.0.0.1", 0), FakeAirbusHandler)
+        self.items = items
+        self.items_per_page = items_per_page
+        self.item_bytes = item_bytes
+        self.latency = latency
+        self.error_rate = error_rate
+        self.pages = self.errors = self.bytes_served = 0
+        self.lock = threading.Lock()
+        # Update times of the items, oldest first, as seconds before the newest
+        self.ages = [-60 * i for i in reversed(range(items))]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def feature(self, index: int) -> dict:
+        """Airbus feature `index`, counting back from the most recently updated"""
+        updated = (newest_update - datetime.timedelta(minutes=index)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        random_state = random.Random(index)
+        x, y = random_state.uniform(-170, 170), random_state.uniform(-80, 80)
+        item_id = f"DS_FAKE_{index:09d}"
+        return {
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[x, y], [x + 0.5, y], [x + 0.5, y + 0.5], [x, y + 0.5], [x, y]]],
+            },
+            "properties": {
+                "acquisitionId": item_id,
+                "acquisitionIdentifier": item_id,
+                "acquisitionDate": "2024-01-22T10:42:44.800Z",
+                "catalogueTime": "2024-01-22T10:42:44.800Z",
+                "startTime": "2024-01-22T10:42:44.800Z",
+                "stopTime": "2024-01-22T10:42:46.800Z",
+                "lastUpdateDate": updated,
+                "lastUpdateTime": updated,
+                "cloudCover": random_state.uniform(0, 100),
+                "lookDirection": "R",
+                "polarizationChannels": "HHVV",
+                "quicklookUrl": f"https://content.fake.airbus.com/quicklooks/{item_id}.tif",
+                # Brings the feature up to roughly item_bytes
+                "comment": "x" * max(self.item_bytes - 900, 0),
+            },
+            "_links": {
+                "quicklook": {"href": f"https://content.fake.airbus.com/quicklooks/{item_id}.jpg"},
+                "thumbnail": {"href": f"https://content.fake.airbus.com/thumbnails/{item_id}.png"},
+            },
+        }
+
+    def replication_page(self, page: int) -> dict:
+        start = page * self.items_per_page
+        features = [self.feature(i) for i in range(start, min(start + self.items_per_page, self.items))]
+        links = {"next": f"{self.url}/replication?page={page + 1}"} if start + self.items_per_page < self.items else {}
+        return {"type": "FeatureCollection", "features": features, "_links": links}
+
+    def opensearch_page(self, body: dict) -> dict:
+        # Items are returned newest first, filtered by their last update date
+        oldest, newest = -math.inf, math.inf
+        if date_range := body.get("lastUpdateDate"):
+            start, end = date_range.strip("[]").split(",")
+            oldest = (datetime.datetime.fromisoformat(start) - newest_update).total_seconds()
+            newest = (datetime.datetime.fromisoformat(end) - newest_update).total_seconds()
+        first = len(self.ages) - bisect.bisect_right(self.ages, newest)
+        last = len(self.ages) - bisect.bisect_left(self.ages, oldest)
+        per_page = int(body.get("itemsPerPage", self.items_per_page))
+        start = first + (int(body.get("startPage", 1)) - 1) * per_page
+        features = [self.feature(i) for i in range(start, min(start + per_page, last))]
+        return {"type": "FeatureCollection", "totalResults": last - first, "features": features}
+
+
+class FakeAirbusHandler(BaseHTTPRequestHandler):
+    @property
+    def api(self) -> FakeAirbusApi:
+        return cast(FakeAirbusApi, self.server)
+
+    def do_GET(self) -> None:
+        query = parse_qs(urlsplit(self.path).query)
+        self.respond(lambda: self.api.replication_page(int(query.get("page", ["0"])[0])))
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.respond(lambda: self.api.opensearch_page(body))
+
+    def respond(self, page: Any) -> None:
+        time.sleep(self.api.latency)
+        if random.random() < self.api.error_rate:
+            with self.api.lock:
+                self.api.errors += 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        content = json.dumps(page()).encode("utf-8")
+        with self.api.lock:
+            self.api.pages += 1
+            self.api.bytes_served += len(content)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class FakeProducer:
+    def __init__(self) -> None:
+        self.messages = self.published = 0
+        self.item_keys: set[str] = set()
+
+    def send(self, content: bytes) -> None:
+        message = json.loads(content)
+        self.messages += 1
+        self.published += len(message["added_keys"]) + len(message["updated_keys"])
+        self.item_keys.update(key for key in message["added_keys"] if "/items/" in key)
+
+
+class FakePulsarClient:
+    def __init__(self) -> None:
+        self.producer = FakeProducer()
+
+    def create_producer(self, **_kwargs: Any) -> FakeProducer:
+        return self.producer
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_scenario(scenario: dict) -> dict:
+    """Harvests a collection from a fake API twice, in this process, returning the measurements"""
+    os.environ.update(
+        {
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            **scenario["env"],
+        }
+    )
+    os.chdir(root)
+    sys.path.insert(0, str(root))
+
+    # Imported once the environment is set up, as the harvester reads its settings on import
+    import boto3  # noqa: PLC0415
+    import moto  # noqa: PLC0415
+
+    from airbus_harvester.__main__ import harvest_collection, load_config  # noqa: PLC0415
+
+    logging.getLogger().setLevel(scenario["log_level"])
+
+    server = FakeAirbusApi(
+        scenario["items"],
+        scenario["items_per_page"],
+        scenario["item_bytes"],
+        scenario["latency"],
+        scenario["error_rate"],
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    config = load_config("airbus_harvester/config.json")[scenario["collection"]]
+    endpoint = "replication" if config["pagination_method"] == "link" else "opensearch"
+    config = {**config, "url": f"{server.url}/{endpoint}", "auth_env": None}
+    if config["body"]:
+        config["body"] = {**config["body"], "itemsPerPage": scenario["items_per_page"]}
+
+    runs = {}
+    with moto.mock_aws():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket=bucket_name)
+        uploaded = [0]
+
+        def count_upload(params: dict, **_kwargs: Any) -> None:
+            body = params.get("Body") or b""
+            uploaded[0] += len(body) if isinstance(body, (bytes, str)) else 0
+
+        s3_client.meta.events.register("provide-client-params.s3.PutObject", count_upload)
+
+        for run in ("first", "rerun"):
+            pulsar_client = FakePulsarClient()
+            pages, bytes_served, uploaded[0] = server.pages, server.bytes_served, 0
+            start = time.perf_counter()
+            harvest_collection(
+                scenario["collection"], config, bucket_name, s3_client, pulsar_client, engine=scenario["engine"]
+            )
+            seconds = time.perf_counter() - start
+            runs[run] = {
+                "seconds": round(seconds, 3),
+                "items_per_s": round(scenario["items"] / seconds, 1),
+                "pages_per_s": round((server.pages - pages) / seconds, 1),
+                "bytes_served": server.bytes_served - bytes_served,
+                "bytes_uploaded": uploaded[0],
+                "messages": pulsar_client.producer.messages,
+                "published": pulsar_client.producer.published,
+                "items_published": len(pulsar_client.producer.item_keys),
+            }
+    server.shutdown()
+    return {"runs": runs, "errors": server.errors, "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+def parameters(scenario: dict) -> dict:
+    """The parameters which must match for results to be compared"""
+    return {key: value for key, value in scenario.items() if key != "log_level"}
+
+
+def previous_results() -> dict[str, dict]:
+    """The most recent saved result for each set of parameters"""
+    previous: dict[str, dict] = {}
+    if results_path.exists():
+        for line in results_path.read_text().splitlines():
+            record = json.loads(line)
+            for result in record["results"]:
+                previous[json.dumps(result["parameters"], sort_keys=True)] = {**result, "version": record["version"]}
+    return previous
+
+
+def git_commit() -> str | None:
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.decode().strip()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collections", default="SAR,SPOT", help="Config keys to harvest (default: SAR,SPOT)")
+    parser.add_argument("--pages", type=int, default=60, help="Pages of items in each collection (default: 60)")
+    parser.add_argument("--items-per-page", type=int, default=200, help="Items in each page (default: 200)")
+    parser.add_argument(
+        "--item-bytes", type=int, default=1500, help="Approximate size of each feature (default: 1500)"
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds each API request takes (default: 0)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API requests which fail")
+    parser.add_argument("--engine", choices=["sync", "async"], default="sync", help="Page fetching engine")
+    parser.add_argument(
+        "--env", action="append", default=[], metavar="NAME=VALUE", help="Harvester setting, may be repeated"
+    )
+    parser.add_argument("--log-level", default="WARNING", help="Harvester log level (default: WARNING)")
+    parser.add_argument("--save", action="store_true", help=f"Append the results to {results_path.relative_to(root)}")
+    args = parser.parse_args()
+
+    env = dict(setting.split("=", 1) for setting in args.env)
+    scenarios = [
+        {
+            "collection": collection.strip().upper(),
+            "items": args.pages * args.items_per_page,
+            "items_per_page": args.items_per_page,
+            "item_bytes": args.item_bytes,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "engine": args.engine,
+            "env": env,
+            "log_level": args.log_level.upper(),
+        }
+        for collection in args.collections.split(",")
+    ]
+
+    previous = previous_results()
+    results = []
+    incomplete = []
+    print(
+        f"{'collection':<10} {'run':<6} {'seconds':>8} {'items/s':>9} {'pages/s':>8} {'published':>9} "
+        f"{'MB up':>7} {'RSS MB':>7}"
+    )
+    for scenario in scenarios:
+        # A fresh process for each scenario, so that peak RSS is measured separately
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            measured = executor.submit(run_scenario, scenario).result()
+        result = {"parameters": parameters(scenario), **measured}
+        results.append(result)
+
+        baseline = previous.get(json.dumps(result["parameters"], sort_keys=True))
+        for run, stats in measured["runs"].items():
+            change = ""
+            if baseline:
+                before = baseline["runs"][run]["items_per_s"]
+                change = f"  {(stats['items_per_s'] - before) / before:+.1%} items/s vs {baseline['version']}"
+            print(
+                f"{scenario['collection']:<10} {run:<6} {stats['seconds']:>8.2f} {stats['items_per_s']:>9.0f} "
+                f"{stats['pages_per_s']:>8.1f} {stats['published']:>9} {stats['bytes_uploaded'] / 2**20:>7.1f} "
+                f"{measured['peak_rss_mb']:>7.0f}{change}"
+            )
+        # Every generated item is new to the first harvest, so each must have been published once
+        items_published = measured["runs"]["first"]["items_published"]
+        if items_published != scenario["items"]:
+            incomplete.append(f"{scenario['collection']} published {items_published} of {scenario['items']} items")
+
+    if incomplete:
+        sys.exit("Harvest incomplete: " + ", ".join(incomplete))
+
+    if args.save:
+        with open(root / "pyproject.toml", "rb") as f:
+            version = tomllib.load(f)["project"]["version"]
+        record = {
+            "version": version,
+            "commit": git_commit(),
+            "date": datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "python": sys.version.split()[0],
+            "results": results,
+        }
+        results_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(results_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"Saved results to {results_path.relative_to(root)}")
+
+
+if __name__ == "__main__":
+    main()
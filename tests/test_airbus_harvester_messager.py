@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import json
-from typing import cast
+import threading
+from typing import Any, cast
 from unittest import mock
 
+import pytest
 from eodhp_utils.messagers import Messager
 from pytest_mock import MockerFixture
 
-from airbus_harvester.airbus_harvester_messager import AirbusHarvesterMessager
+from airbus_harvester.airbus_harvester_messager import AirbusHarvesterMessager, OutputWriteError
+from airbus_harvester.batching import MessageBatch
 
 
 def test_process_msg_updated(mocker: MockerFixture) -> None:
@@ -42,7 +45,7 @@ def test_process_msg_updated(mocker: MockerFixture) -> None:
         cat_path="key/to/data2",
     )
 
-    result = test_airbus_harvester.process_msg(test_msg)
+    result = list(test_airbus_harvester.process_msg(test_msg))
 
     assert result == [expected_action_1, expected_action_2]
 
@@ -76,7 +79,7 @@ def test_process_msg_deleted(mocker: MockerFixture) -> None:
         cat_path="key/to/data2",
     )
 
-    result = test_airbus_harvester.process_msg(test_msg)
+    result = list(test_airbus_harvester.process_msg(test_msg))
 
     assert result == [expected_action_1, expected_action_2]
 
@@ -116,7 +119,7 @@ def test_process_msg_update_and_delete(mocker: MockerFixture) -> None:
         cat_path="key/to/data4",
     )
 
-    result = test_airbus_harvester.process_msg(test_msg)
+    result = list(test_airbus_harvester.process_msg(test_msg))
 
     assert result == [
         expected_action_1,
@@ -160,3 +163,162 @@ def test_gen_empty_catalogue_message() -> None:
         "source": "",
         "target": "",
     }
+
+
+def test_process_msg_serialised() -> None:
+    test_airbus_harvester = AirbusHarvesterMessager(
+        s3_client=mock.MagicMock(),
+        output_bucket="files_bucket_name",
+        cat_output_prefix="git-harvester/",
+        producer=mock.MagicMock(),
+    )
+
+    test_msg = {
+        "harvested_data": {"key/to/data1": b'{"id":"data1-id"}'},
+        "deleted_keys": [],
+    }
+
+    result = list(test_airbus_harvester.process_msg(test_msg))
+
+    # Documents already serialised by the harvester are uploaded as they are
+    assert result == [Messager.OutputFileAction(file_body=cast(str, b'{"id":"data1-id"}'), cat_path="key/to/data1")]
+
+
+def test_iter_actions_streamed() -> None:
+    test_airbus_harvester = AirbusHarvesterMessager(
+        s3_client=mock.MagicMock(),
+        output_bucket="files_bucket_name",
+        cat_output_prefix="git-harvester/",
+        producer=mock.MagicMock(),
+    )
+    batch = MessageBatch(max_entries=10)
+    batch.add("key/to/data1", b'{"id":"data1-id"}')
+    batch.add("key/to/data2", b'{"id":"data2-id"}')
+
+    actions = test_airbus_harvester.iter_actions({"harvested_data": batch.drain(), "deleted_keys": ["key/to/data3"]})
+
+    # Documents are taken from the batch as each action is used
+    assert next(actions) == Messager.OutputFileAction(
+        file_body=cast(str, b'{"id":"data1-id"}'), cat_path="key/to/data1"
+    )
+    assert len(batch) == 0
+    assert [action.cat_path for action in actions] == ["key/to/data2", "key/to/data3"]
+
+
+def test_process_msg_from_batch() -> None:
+    test_airbus_harvester = AirbusHarvesterMessager(
+        s3_client=mock.MagicMock(),
+        output_bucket="files_bucket_name",
+        cat_output_prefix="git-harvester/",
+        producer=mock.MagicMock(),
+    )
+    batch = MessageBatch(max_entries=10)
+    batch.add("key/to/data1", b'{"id":"data1-id"}')
+
+    actions = test_airbus_harvester.process_msg({"harvested_data": batch.drain(), "deleted_keys": ["key/to/data2"]})
+
+    # A sequence, as the base Messager.consume expects
+    assert isinstance(actions, list)
+    assert [action.cat_path for action in actions] == ["key/to/data1", "key/to/data2"]
+
+
+def test_consume_parallel() -> None:
+    mock_s3_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    test_airbus_harvester = AirbusHarvesterMessager(
+        s3_client=mock_s3_client,
+        output_bucket="files_bucket_name",
+        cat_output_prefix="git-harvester/",
+        producer=mock_producer,
+        write_workers=4,
+    )
+    # Each write waits for another to start, so they can only complete if run concurrently
+    barrier = threading.Barrier(2, timeout=5)
+    mock_s3_client.put_object.side_effect = lambda **_kwargs: barrier.wait()
+
+    test_airbus_harvester.consume(
+        {"harvested_data": {f"key/to/data{i}": b"{}" for i in range(6)}, "deleted_keys": ["key/to/old"]}
+    )
+
+    assert mock_s3_client.put_object.call_count == 6
+    mock_s3_client.delete_objects.assert_called_once_with(
+        Bucket="files_bucket_name", Delete={"Objects": [{"Key": "git-harvester/key/to/old"}], "Quiet": True}
+    )
+    message = json.loads(mock_producer.send.call_args.args[0])
+    assert sorted(message["added_keys"]) == [f"key/to/data{i}" for i in range(6)]
+    assert message["deleted_keys"] == ["key/to/old"]
+    assert message["bucket_name"] == "files_bucket_name"
+
+
+def test_consume_parallel__failed_write() -> None:
+    mock_s3_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    test_airbus_harvester = AirbusHarvesterMessager(
+        s3_client=mock_s3_client,
+        output_bucket="files_bucket_name",
+        cat_output_prefix="git-harvester/",
+        producer=mock_producer,
+        write_workers=4,
+    )
+
+    def put_object(Key: str, **_kwargs: Any) -> None:
+        if Key.endswith("data2"):
+            raise ValueError("Access denied")
+
+    mock_s3_client.put_object.side_effect = put_object
+
+    with pytest.raises(OutputWriteError) as error:
+        test_airbus_harvester.consume(
+            {"harvested_data": {f"key/to/data{i}": b"{}" for i in range(4)}, "deleted_keys": []}
+        )
+
+    # The other writes still run, but nothing is published
+    assert mock_s3_client.put_object.call_count == 4
+    assert list(error.value.failures) == ["key/to/data2"]
+    assert str(error.value.failures["key/to/data2"]) == "Access denied"
+    mock_producer.send.assert_not_called()
+
+
+def test_consume_bulk_delete() -> None:
+    mock_s3_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    test_airbus_harvester = AirbusHarvesterMessager(
+        s3_client=mock_s3_client,
+        output_bucket="files_bucket_name",
+        cat_output_prefix="git-harvester/",
+        producer=mock_producer,
+        delete_batch_size=2,
+    )
+    mock_s3_client.delete_objects.return_value = {}
+    deleted_keys = [f"key/to/data{i}" for i in range(5)]
+
+    test_airbus_harvester.consume({"harvested_data": {}, "deleted_keys": deleted_keys})
+
+    # Deletions are batched rather than made one at a time
+    mock_s3_client.delete_object.assert_not_called()
+    batches = [call.kwargs["Delete"]["Objects"] for call in mock_s3_client.delete_objects.call_args_list]
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    message = json.loads(mock_producer.send.call_args.args[0])
+    assert message["deleted_keys"] == deleted_keys
+
+
+def test_consume_bulk_delete__partial_failure() -> None:
+    mock_s3_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    test_airbus_harvester = AirbusHarvesterMessager(
+        s3_client=mock_s3_client,
+        output_bucket="files_bucket_name",
+        cat_output_prefix="git-harvester/",
+        producer=mock_producer,
+    )
+    mock_s3_client.delete_objects.return_value = {
+        "Errors": [{"Key": "git-harvester/key/to/data1", "Code": "AccessDenied", "Message": "Access Denied"}]
+    }
+
+    with pytest.raises(OutputWriteError) as error:
+        test_airbus_harvester.consume({"harvested_data": {}, "deleted_keys": ["key/to/data0", "key/to/data1"]})
+
+    assert mock_s3_client.delete_objects.call_count == 1
+    assert list(error.value.failures) == ["key/to/data1"]
+    assert str(error.value.failures["key/to/data1"]) == "AccessDenied: Access Denied"
+    mock_producer.send.assert_not_called()
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections.abc import Callable, Iterator
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from airbus_harvester import http_client
+from airbus_harvester.async_engine import AsyncEngine
+from airbus_harvester.auth import AccessTokenManager, token_urls
+
+if TYPE_CHECKING:
+    import httpx
+else:
+    httpx = pytest.importorskip("httpx")
+
+
+def make_feature(last_update_date: str) -> dict:
+    return {"properties": {"lastUpdateDate": last_update_date}}
+
+
+@pytest.fixture
+def link_config() -> dict:
+    return {
+        "url": "https://test-url.co.uk/page1",
+        "body": None,
+        "auth_env": None,
+        "request_method": "GET",
+        "pagination_method": "link",
+    }
+
+
+@pytest.fixture
+def counter_config() -> dict:
+    return {
+        "url": "https://test-url.co.uk/search",
+        "body": {"startPage": 1},
+        "auth_env": None,
+        "request_method": "POST",
+        "pagination_method": "counter",
+    }
+
+
+@pytest.fixture
+def make_engine() -> Iterator[Callable[..., AsyncEngine]]:
+    engines = []
+
+    def make(handler: Callable, max_requests: int = 8) -> AsyncEngine:
+        engines.append(AsyncEngine(max_requests, transport=httpx.MockTransport(handler)))
+        return engines[-1]
+
+    yield make
+    for engine in engines:
+        engine.close()
+
+
+def test_async_engine__link(make_engine: Callable[..., AsyncEngine], link_config: dict) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        if str(request.url) == "https://test-url.co.uk/page1":
+            return httpx.Response(200, json={"features": [], "_links": {"next": "https://test-url.co.uk/page2"}})
+        return httpx.Response(200, json={"features": [], "_links": {}})
+
+    pages = list(make_engine(handler).pages(link_config))
+
+    assert [page.url for page in pages] == ["https://test-url.co.uk/page1", "https://test-url.co.uk/page2"]
+    assert pages[0].position["next_url"] == "https://test-url.co.uk/page2"
+    assert pages[1].position["next_url"] is None
+
+
+def test_async_engine__windows(make_engine: Callable[..., AsyncEngine], counter_config: dict) -> None:
+    in_flight = max_in_flight = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+        body = json.loads(request.content)
+        if body["startPage"] > 3:
+            return httpx.Response(200, json={"features": []})
+        return httpx.Response(200, json={"features": [make_feature("2024-01-01T00:00:00Z")]})
+
+    engine = make_engine(handler, max_requests=2)
+    pages = list(engine.pages(counter_config, since="2024-01-01T00:00:00Z", windows=4))
+
+    # Each window is paged through separately, with no more than max_requests requests at once
+    assert len(pages) == 4 * 4
+    assert max_in_flight == 2
+    assert counter_config["body"] == {"startPage": 1}
+
+
+def test_async_engine__token_refreshed_on_401(
+    make_engine: Callable[..., AsyncEngine],
+    link_config: dict,
+    monkeypatch: pytest.MonkeyPatch,
+    requests_mock: Any,
+) -> None:
+    monkeypatch.setenv("AIRBUS_API_KEY", "key")
+    link_config["auth_env"] = "prod"
+    requests_mock.post(
+        token_urls["prod"],
+        [
+            {"json": {"access_token": "token-1", "expires_in": 3600}},
+            {"json": {"access_token": "token-2", "expires_in": 3600}},
+        ],
+    )
+    authorizations = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        authorizations.append(request.headers["Authorization"])
+        if request.headers["Authorization"] == "Bearer token-1":
+            return httpx.Response(401)
+        return httpx.Response(200, json={"features": [], "_links": {}})
+
+    engine = make_engine(handler)
+    engine.client.tokens = AccessTokenManager(background_refresh=False)
+    pages = list(engine.pages(link_config))
+
+    assert len(pages) == 1
+    assert authorizations == ["Bearer token-1", "Bearer token-2"]
+    # The token cache is the one used by the sync engine
+    assert engine.client.tokens.get_token("prod") == "token-2"
+    assert requests_mock.call_count == 2
+
+
+def test_async_engine__cached_token(
+    make_engine: Callable[..., AsyncEngine],
+    link_config: dict,
+    monkeypatch: pytest.MonkeyPatch,
+    requests_mock: Any,
+) -> None:
+    monkeypatch.setenv("AIRBUS_API_KEY", "key")
+    link_config["auth_env"] = "prod"
+    requests_mock.post(token_urls["prod"], json={"access_token": "sync-token", "expires_in": 3600})
+    tokens = AccessTokenManager(background_refresh=False)
+    tokens.get_token("prod")
+    authorizations = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        authorizations.append(request.headers["Authorization"])
+        return httpx.Response(200, json={"features": [], "_links": {}})
+
+    engine = make_engine(handler)
+    engine.client.tokens = tokens
+    list(engine.pages(link_config))
+
+    # A token requested by the sync engine is reused rather than a new one requested
+    assert authorizations == ["Bearer sync-token"]
+    assert requests_mock.call_count == 1
+
+
+def test_async_engine__error(
+    make_engine: Callable[..., AsyncEngine], link_config: dict, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(http_client, "max_api_retries", -1)
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(500)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        list(make_engine(handler).pages(link_config))
+
+
+def test_async_engine__stopped_early(make_engine: Callable[..., AsyncEngine], counter_config: dict) -> None:
+    requests = 0
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        nonlocal requests
+        requests += 1
+        return httpx.Response(200, json={"features": [make_feature("2024-01-01T00:00:00Z")]})
+
+    pages = make_engine(handler).pages(counter_config, depth=1)
+    next(pages)
+    pages.close()
+
+    # Fetching stops once the caller stops iterating
+    stopped_at = requests
+    time.sleep(0.05)
+    assert requests == stopped_at
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import os
+from typing import Any
+from unittest import mock
+
+import pytest
+
+from airbus_harvester.auth import AccessTokenManager, request_access_token, token_urls
+
+
+@pytest.fixture(autouse=True)
+def setenvvar(monkeypatch: pytest.MonkeyPatch) -> Any:
+    with mock.patch.dict(os.environ, clear=True):
+        monkeypatch.setenv("AIRBUS_API_KEY", "41rbu5-4p1-k3y")
+        yield
+
+
+def test_request_access_token(requests_mock: Any) -> None:
+    requests_mock.post(token_urls["prod"], json={"access_token": "my_access_token", "expires_in": 300})
+
+    token_response = request_access_token("prod")
+
+    assert token_response == {"access_token": "my_access_token", "expires_in": 300}
+    assert "apikey=41rbu5-4p1-k3y" in requests_mock.last_request.text
+
+
+def test_get_token__cached(requests_mock: Any) -> None:
+    requests_mock.post(token_urls["prod"], json={"access_token": "my_access_token", "expires_in": 300})
+    token_manager = AccessTokenManager(refresh_margin=60, background_refresh=False)
+
+    tokens = [token_manager.get_token("prod") for _ in range(5)]
+
+    assert tokens == ["my_access_token"] * 5
+    assert requests_mock.call_count == 1
+
+
+@mock.patch("airbus_harvester.auth.time")
+def test_get_token__refreshed_before_expiry(mock_time: Any, requests_mock: Any) -> None:
+    requests_mock.post(
+        token_urls["prod"],
+        [
+            {"json": {"access_token": "first_token", "expires_in": 300}},
+            {"json": {"access_token": "second_token", "expires_in": 300}},
+        ],
+    )
+    token_manager = AccessTokenManager(refresh_margin=60, background_refresh=False)
+
+    mock_time.monotonic.return_value = 0
+    assert token_manager.get_token("prod") == "first_token"
+    mock_time.monotonic.return_value = 239
+    assert token_manager.get_token("prod") == "first_token"
+    # Within the refresh margin of expiry
+    mock_time.monotonic.return_value = 241
+    assert token_manager.get_token("prod") == "second_token"
+    assert requests_mock.call_count == 2
+
+
+@mock.patch("airbus_harvester.auth.time")
+def test_get_token__refresh_margin_clamped(mock_time: Any, requests_mock: Any) -> None:
+    requests_mock.post(
+        token_urls["prod"],
+        [
+            {"json": {"access_token": "first_token", "expires_in": 30}},
+            {"json": {"access_token": "second_token", "expires_in": 30}},
+        ],
+    )
+    token_manager = AccessTokenManager(refresh_margin=60, background_refresh=True)
+
+    with mock.patch.object(token_manager, "_schedule_refresh") as schedule_refresh:
+        # The margin is longer than the token's lifetime, so is cut to half of it
+        mock_time.monotonic.return_value = 0
+        assert token_manager.get_token("prod") == "first_token"
+        mock_time.monotonic.return_value = 14
+        assert token_manager.get_token("prod") == "first_token"
+        schedule_refresh.assert_called_once_with("prod", 15)
+
+        mock_time.monotonic.return_value = 16
+        assert token_manager.get_token("prod") == "second_token"
+    assert requests_mock.call_count == 2
+
+
+def test_get_token__per_env(requests_mock: Any) -> None:
+    requests_mock.post(token_urls["prod"], json={"access_token": "prod_token", "expires_in": 300})
+    requests_mock.post(token_urls["dev"], json={"access_token": "dev_token", "expires_in": 300})
+    token_manager = AccessTokenManager(refresh_margin=60, background_refresh=False)
+
+    assert token_manager.get_token("prod") == "prod_token"
+    assert token_manager.get_token("dev") == "dev_token"
+
+
+def test_invalidate(requests_mock: Any) -> None:
+    requests_mock.post(
+        token_urls["prod"],
+        [
+            {"json": {"access_token": "first_token", "expires_in": 300}},
+            {"json": {"access_token": "second_token", "expires_in": 300}},
+        ],
+    )
+    token_manager = AccessTokenManager(refresh_margin=60, background_refresh=False)
+    token_manager.get_token("prod")
+
+    # A stale token does not remove the current one
+    token_manager.invalidate("prod", "some_other_token")
+    assert token_manager.get_token("prod") == "first_token"
+
+    token_manager.invalidate("prod", "first_token")
+    assert token_manager.get_token("prod") == "second_token"
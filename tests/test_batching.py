@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from unittest import mock
+
+from airbus_harvester import batching
+from airbus_harvester.batching import MessageBatch
+
+
+def test_message_batch__max_entries() -> None:
+    batch = MessageBatch(max_entries=2)
+
+    batch.add("a", b"1")
+    assert not batch.is_full()
+    batch.add("b", b"2")
+    assert batch.is_full()
+
+
+def test_message_batch__max_bytes() -> None:
+    batch = MessageBatch(max_entries=0, max_bytes=10)
+
+    batch.add("a", b"12345")
+    batch.add("a", b"123456")
+    # Replacing a document replaces its size
+    assert batch.size == 6
+    assert not batch.is_full()
+    batch.add("b", b"1234")
+    assert batch.is_full()
+
+
+def test_message_batch__max_age() -> None:
+    batch = MessageBatch(max_entries=0, max_age=60)
+    assert not batch.is_full()
+
+    with mock.patch.object(batching.time, "monotonic", return_value=1000.0):
+        batch.add("a", b"1")
+    with mock.patch.object(batching.time, "monotonic", return_value=1059.0):
+        assert not batch.is_full()
+    with mock.patch.object(batching.time, "monotonic", return_value=1060.0):
+        assert batch.is_full()
+
+
+def test_message_batch__drain() -> None:
+    batch = MessageBatch(max_entries=1, max_age=60)
+    batch.add("a", b"1")
+    batch.add("b", b"2")
+
+    documents = batch.drain()
+
+    assert len(batch) == 0
+    assert batch.size == 0
+    assert not batch.is_full()
+    assert list(documents) == [("a", b"1"), ("b", b"2")]
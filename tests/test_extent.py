@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import pytest
+
+from airbus_harvester.extent import CollectionExtent
+
+
+@pytest.fixture
+def mock_item() -> dict:
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [
+                [
+                    [-27.9837603, 38.6070725],
+                    [-28.0150768, 38.7135605],
+                    [-28.1373002, 38.6958769],
+                    [-28.1166933, 38.5878242],
+                    [-27.9837603, 38.6070725],
+                ]
+            ],
+        },
+        "bbox": [-28.1373002, 38.5878242, -27.9837603, 38.7135605],
+        "properties": {
+            "start_datetime": "2024-01-22T19:42:44.735Z",
+            "end_datetime": "2024-01-22T19:42:46.446Z",
+        },
+    }
+
+
+def test_add_bbox_and_item_times(mock_item: dict) -> None:
+    extent = CollectionExtent()
+
+    assert extent.is_empty()
+    assert extent.add_bbox(mock_item["bbox"])
+    assert extent.add_item_times(mock_item)
+
+    assert extent.to_dict() == {
+        "bbox": [-28.1373002, 38.5878242, -27.9837603, 38.7135605],
+        "start_time": "2024-01-22T19:42:44.735Z",
+        "stop_time": "2024-01-22T19:42:46.446Z",
+    }
+    # Adding the same item again doesn't change anything
+    assert not extent.add_bbox(mock_item["bbox"])
+    assert not extent.add_item_times(mock_item)
+
+
+def test_add_bbox_and_item_times__extends(mock_item: dict) -> None:
+    extent = CollectionExtent()
+    extent.add_bbox(mock_item["bbox"])
+    extent.add_item_times(mock_item)
+
+    assert extent.add_bbox([10.0, 50.0, 11.0, 51.0])
+    assert extent.add_item_times({"properties": {"datetime": "2024-01-23T00:00:00Z"}})
+
+    assert extent.to_dict() == {
+        "bbox": [-28.1373002, 38.5878242, 11.0, 51.0],
+        "start_time": "2024-01-22T19:42:44.735Z",
+        "stop_time": "2024-01-23T00:00:00Z",
+    }
+
+
+def test_add_bbox__does_not_modify_bbox() -> None:
+    bbox = [-190.0, -95.0, 185.0, 92.0]
+    extent = CollectionExtent()
+
+    extent.add_bbox(bbox)
+
+    # Clipped to valid coordinates
+    assert extent.bbox() == [-180, -90, 180, 90]
+    assert bbox == [-190.0, -95.0, 185.0, 92.0]
+
+
+def test_add_times__compares_instants() -> None:
+    extent = CollectionExtent()
+
+    extent.add_times("2024-01-22T19:42:44Z", "2024-01-22T19:42:44Z")
+    extent.add_times("2024-01-22T19:42:44.500Z", "2024-01-22T19:42:44.500Z")
+
+    # Compared as times rather than strings, where "44.500Z" < "44Z"
+    assert extent.start is not None
+    assert extent.start[1] == "2024-01-22T19:42:44Z"
+    assert extent.stop is not None
+    assert extent.stop[1] == "2024-01-22T19:42:44.500Z"
+
+
+def test_from_dict__round_trip(mock_item: dict) -> None:
+    extent = CollectionExtent()
+    extent.add_bbox(mock_item["bbox"])
+    extent.add_item_times(mock_item)
+
+    assert CollectionExtent.from_dict(extent.to_dict()).to_dict() == extent.to_dict()
+
+
+def test_from_dict__previous_format() -> None:
+    previous_summary = {
+        "coordinates": [[-27.9837603, 38.6070725], [-28.1373002, 38.6958769], [-28.1166933, 38.5878242]],
+        "start_time": ["2024-01-22T19:42:44.735Z"],
+        "stop_time": ["2024-01-22T19:42:46.446Z"],
+    }
+
+    extent = CollectionExtent.from_dict(previous_summary)
+
+    assert extent.to_dict() == {
+        "bbox": [-28.1373002, 38.5878242, -27.9837603, 38.6958769],
+        "start_time": "2024-01-22T19:42:44.735Z",
+        "stop_time": "2024-01-22T19:42:46.446Z",
+    }
+
+
+def test_from_collection() -> None:
+    collection = {
+        "extent": {
+            "spatial": {"bbox": [[1, 2, 3, 4]]},
+            "temporal": {"interval": [["2024-01-22T19:42:44.735Z", "2024-01-22T19:42:46.446Z"]]},
+        }
+    }
+
+    extent = CollectionExtent.from_collection(collection)
+
+    assert extent.to_dict() == {
+        "bbox": [1, 2, 3, 4],
+        "start_time": "2024-01-22T19:42:44Z",
+        "stop_time": "2024-01-22T19:42:46Z",
+    }
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from airbus_harvester import geometry
+from airbus_harvester.geometry import coordinates_to_bbox, page_geometry
+
+
+def make_feature(coordinates: list) -> dict:
+    return {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [coordinates]}}
+
+
+@pytest.fixture
+def mock_features() -> list[dict]:
+    random.seed(1)
+    features = []
+    for _ in range(50):
+        x, y = random.uniform(-170, 170), random.uniform(-80, 80)
+        ring = [[x + random.random(), y + random.random()] for _ in range(random.randint(3, 12))]
+        features.append(make_feature([*ring, ring[0]]))
+    return features
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_page_geometry(mock_features: list[dict], use_numpy: bool, monkeypatch: pytest.MonkeyPatch) -> None:
+    if not use_numpy:
+        monkeypatch.setattr(geometry, "np", None)
+    elif geometry.np is None:
+        pytest.skip("numpy not installed")
+
+    actual = page_geometry(mock_features)
+
+    expected_bboxes = [coordinates_to_bbox(feature["geometry"]["coordinates"][0]) for feature in mock_features]
+    assert actual.bboxes == expected_bboxes
+    assert actual.page_bbox == [
+        min(bbox[0] for bbox in expected_bboxes),
+        min(bbox[1] for bbox in expected_bboxes),
+        max(bbox[2] for bbox in expected_bboxes),
+        max(bbox[3] for bbox in expected_bboxes),
+    ]
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_page_geometry__keeps_value_types(use_numpy: bool, monkeypatch: pytest.MonkeyPatch) -> None:
+    if not use_numpy:
+        monkeypatch.setattr(geometry, "np", None)
+    elif geometry.np is None:
+        pytest.skip("numpy not installed")
+    features = [
+        make_feature([[10, 20], [11, 21], [10, 20]]),
+        make_feature([[10, 20.0], [10.0, 21], [11.5, 20], [10, 20.0]]),
+    ]
+
+    actual = page_geometry(features)
+
+    # The same values, of the same types, as without numpy
+    assert [[type(value) for value in bbox] for bbox in actual.bboxes] == [
+        [int, int, int, int],
+        [int, float, float, int],
+    ]
+    assert actual.bboxes == [[10, 20, 11, 21], [10, 20.0, 11.5, 21]]
+    assert [type(value) for value in actual.page_bbox] == [int, int, float, int]
+    assert actual.page_bbox == [10, 20, 11.5, 21]
+
+
+def test_page_geometry__clipped() -> None:
+    features = [
+        make_feature([[-185.0, 10.0], [-175.0, 95.0], [-185.0, 10.0]]),
+        make_feature([[10.0, -91.0], [181.0, 0.0], [10.0, -91.0]]),
+    ]
+
+    actual = page_geometry(features)
+
+    # Item bboxes are left as they are, only the page bbox is clipped
+    assert actual.bboxes == [[-185.0, 10.0, -175.0, 95.0], [10.0, -91.0, 181.0, 0.0]]
+    assert actual.page_bbox == [-180, -90, 180, 90]
+
+
+def test_page_geometry__mixed_dimensions() -> None:
+    features = [
+        make_feature([[1.0, 2.0], [3.0, 4.0], [1.0, 2.0]]),
+        make_feature([[1.0, 2.0, 0.0], [3.0, 4.0, 5.0], [1.0, 2.0, 0.0]]),
+    ]
+
+    actual = page_geometry(features)
+
+    assert actual.bboxes == [[1.0, 2.0, 3.0, 4.0], [1.0, 2.0, 0.0, 3.0, 4.0, 5.0]]
+    assert actual.page_bbox == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_page_geometry__empty() -> None:
+    assert page_geometry([]) == ([], [])
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import hashlib
+import json
+
+import pytest
+
+from airbus_harvester import hashing, serialization
+from airbus_harvester.hashing import (
+    DocumentHasher,
+    FeatureFingerprinter,
+    HashScheme,
+    configured_hash_scheme,
+    join_stored_hash,
+    legacy_hash_scheme,
+    split_stored_hash,
+    strip_fields,
+)
+from airbus_harvester.serialization import canonical_dumps, document_format
+
+data = {"id": "item", "properties": {"b": 1, "a": 2}}
+document = canonical_dumps(data)
+
+
+@pytest.mark.parametrize(
+    ("metadata", "expected"),
+    [
+        pytest.param({}, legacy_hash_scheme, id="legacy"),
+        pytest.param({"document_format": "canonical-json"}, HashScheme("md5", 16, "canonical-json"), id="canonical"),
+        pytest.param(
+            {
+                "hash_scheme": {
+                    "algorithm": "blake2b",
+                    "digest_size": 8,
+                    "document_format": "canonical-json",
+                    "version": 2,
+                }
+            },
+            HashScheme("blake2b", 8, "canonical-json"),
+            id="recorded",
+        ),
+    ],
+)
+def test_hash_scheme_from_metadata(metadata: dict, expected: HashScheme) -> None:
+    assert HashScheme.from_metadata(metadata) == expected
+
+
+@pytest.mark.parametrize(
+    "scheme", [HashScheme("blake2b", 8, "canonical-json"), HashScheme("md5", 16, "canonical-json", ("a.b",))]
+)
+def test_hash_scheme_round_trip(scheme: HashScheme) -> None:
+    assert HashScheme.from_metadata({"hash_scheme": scheme.to_metadata()}) == scheme
+
+
+@pytest.mark.parametrize("algorithm", ["blake2b", "md5", "xxh3"])
+def test_hash_scheme_digest(algorithm: str) -> None:
+    if algorithm == "xxh3" and hashing.xxhash is None:
+        pytest.skip("xxhash not installed")
+    scheme = HashScheme(algorithm, 8, "canonical-json")
+
+    digest = scheme.hash_document(data, document)
+
+    assert len(digest) == 16
+    assert digest == scheme.digest(document)
+    assert digest != scheme.digest(canonical_dumps({**data, "id": "other"}))
+
+
+@pytest.mark.parametrize(
+    ("paths", "expected"),
+    [
+        pytest.param(["properties.a"], {"id": "item", "properties": {"b": 1}}, id="nested"),
+        pytest.param(["id", "properties.c"], {"properties": {"b": 1, "a": 2}}, id="missing"),
+        pytest.param(["properties.a.x"], data, id="not_a_dict"),
+        pytest.param(["*.b"], {"id": "item", "properties": {"a": 2}}, id="wildcard"),
+    ],
+)
+def test_strip_fields(paths: list, expected: dict) -> None:
+    original = json.dumps(data)
+
+    assert strip_fields(data, paths) == expected
+    assert json.dumps(data) == original
+
+
+def test_hash_scheme__volatile_fields() -> None:
+    scheme = HashScheme("blake2b", 8, "canonical-json", ("properties.a",))
+    changed = {"id": "item", "properties": {"b": 1, "a": 3}}
+
+    assert scheme.hash_document(data, document) == scheme.hash_document(changed, canonical_dumps(changed))
+    assert scheme.hash_document(data, document) != HashScheme("blake2b", 8, "canonical-json").hash_document(
+        data, document
+    )
+
+
+def test_document_hasher__volatile_fields_added() -> None:
+    previous = HashScheme("blake2b", 8, "canonical-json")
+    hasher = DocumentHasher(previous, previous._replace(volatile_fields=("properties.a",)))
+
+    assert hasher.migrating
+    assert hasher.is_unchanged(previous.digest(document), hasher.hash(data, document), data, document)
+
+
+def test_legacy_hash_scheme() -> None:
+    assert legacy_hash_scheme.hash_document(data, document) == hashlib.md5(json.dumps(data).encode()).hexdigest()
+
+
+def test_configured_hash_scheme__unavailable(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(hashing, "xxhash", None)
+
+    assert configured_hash_scheme("xxh3", 8) == HashScheme("blake2b", 8, document_format())
+    assert configured_hash_scheme("not-a-hash", 100) == HashScheme("blake2b", 64, document_format())
+
+
+def test_document_hasher__migration() -> None:
+    hasher = DocumentHasher(legacy_hash_scheme, HashScheme("blake2b", 8, "canonical-json"))
+    file_hash = hasher.hash(data, document)
+    legacy_hash = legacy_hash_scheme.hash_document(data, document)
+
+    assert hasher.migrating
+    assert hasher.is_unchanged(file_hash, file_hash, data, document)
+    assert hasher.is_unchanged(legacy_hash, file_hash, data, document)
+    assert not hasher.is_unchanged("changed", file_hash, data, document)
+    assert not hasher.is_unchanged(None, file_hash, data, document)
+
+
+def test_document_hasher__json_backend_changed(monkeypatch: pytest.MonkeyPatch) -> None:
+    if serialization.orjson is None:
+        pytest.skip("orjson not installed")
+    # orjson and json write these floats differently
+    floats = {"id": "item", "properties": {"a": 1e16, "b": 2.5e-05}}
+    json_scheme = HashScheme("blake2b", 8, "canonical-json")
+    orjson_scheme = HashScheme("blake2b", 8, "canonical-json-orjson")
+    monkeypatch.setattr(serialization, "json_backend", "json")
+    json_hash = json_scheme.hash_document(floats, canonical_dumps(floats))
+    monkeypatch.setattr(serialization, "json_backend", "orjson")
+    orjson_document = canonical_dumps(floats)
+
+    hasher = DocumentHasher(json_scheme, configured_hash_scheme())
+
+    # Switching backend changes the format, and hashes made by the old backend still match
+    assert hasher.scheme == orjson_scheme
+    assert hasher.migrating
+    assert json_hash != hasher.hash(floats, orjson_document)
+    assert hasher.is_unchanged(json_hash, hasher.hash(floats, orjson_document), floats, orjson_document)
+
+
+def test_hash_scheme__format_unavailable(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(serialization, "orjson", None)
+
+    assert not HashScheme("blake2b", 8, "canonical-json-orjson").is_available()
+    assert HashScheme("blake2b", 8, "canonical-json").is_available()
+
+
+def test_document_hasher__same_scheme() -> None:
+    scheme = HashScheme("blake2b", 8, "canonical-json")
+    hasher = DocumentHasher(scheme, scheme)
+    legacy_hash = legacy_hash_scheme.hash_document(data, document)
+
+    assert not hasher.migrating
+    assert not hasher.is_unchanged(legacy_hash, hasher.hash(data, document), data, document)
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        pytest.param(None, (None, None), id="missing"),
+        pytest.param("0123", ("0123", None), id="hash"),
+        pytest.param("0123:abcd", ("0123", "abcd"), id="fingerprint"),
+    ],
+)
+def test_split_stored_hash(value: str | None, expected: tuple) -> None:
+    assert split_stored_hash(value) == expected
+    if value:
+        assert join_stored_hash(*expected) == value
+
+
+@pytest.fixture
+def feature() -> dict:
+    return {"geometry": {"coordinates": [[[0, 1]]]}, "properties": {"id": "a", "lastUpdateDate": "2024-01-01"}}
+
+
+def test_feature_fingerprinter__update_time(feature: dict) -> None:
+    scheme = HashScheme("blake2b", 8, "canonical-json")
+    fingerprinter = FeatureFingerprinter(scheme, b"signature", "lastUpdateDate", source="update_time")
+    fingerprint = fingerprinter.fingerprint(feature)
+
+    # Only the update time is fingerprinted
+    assert fingerprinter.fingerprint({**feature, "geometry": None}) == fingerprint
+    assert fingerprinter.fingerprint({"properties": {"lastUpdateDate": "2024-01-02"}}) != fingerprint
+    assert FeatureFingerprinter(scheme, b"other", "lastUpdateDate").fingerprint(feature) != fingerprint
+    # Any change to the hash scheme changes the fingerprint
+    for other_scheme in (
+        scheme._replace(volatile_fields=("properties.updated",)),
+        scheme._replace(document_format="canonical-json-orjson"),
+        scheme._replace(digest_size=16),
+    ):
+        other = FeatureFingerprinter(other_scheme, b"signature", "lastUpdateDate")
+        assert other.fingerprint(feature)[:16] != fingerprint
+
+    # The whole feature is fingerprinted without an update time
+    feature["properties"]["lastUpdateDate"] = None
+    assert fingerprinter.fingerprint(feature) != fingerprinter.fingerprint({**feature, "geometry": None})
+
+
+def test_feature_fingerprinter__raw(feature: dict) -> None:
+    fingerprinter = FeatureFingerprinter(
+        HashScheme("blake2b", 8, "canonical-json"), b"signature", "lastUpdateDate", source="raw"
+    )
+
+    assert fingerprinter.fingerprint(feature) != fingerprinter.fingerprint({**feature, "geometry": None})
+
+
+@pytest.mark.parametrize(
+    ("verify_rate", "previous", "expected"),
+    [
+        pytest.param(0, "abcd", True, id="unchanged"),
+        pytest.param(0, "0000", False, id="changed"),
+        pytest.param(0, None, False, id="new"),
+        pytest.param(1, "abcd", False, id="verified"),
+    ],
+)
+def test_feature_fingerprinter__should_skip(verify_rate: float, previous: str | None, expected: bool) -> None:
+    fingerprinter = FeatureFingerprinter(
+        HashScheme("blake2b", 8, "canonical-json"), b"signature", verify_rate=verify_rate
+    )
+
+    assert fingerprinter.should_skip(previous, "abcd") == expected
+    assert fingerprinter.skipped == int(expected)
+    assert fingerprinter.verified == int(verify_rate == 1)
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any
+
+from requests.adapters import HTTPAdapter
+
+from airbus_harvester.http_client import HostBudget, HttpClient
+
+
+def test_session__pooled_per_host() -> None:
+    http_client = HttpClient()
+
+    first = http_client.session("https://search.foundation.api.oneatlas.airbus.com/api/v2/opensearch")
+    second = http_client.session("https://search.foundation.api.oneatlas.airbus.com/other")
+    other_host = http_client.session("https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication")
+
+    assert first is second
+    assert first is not other_host
+    adapter = first.get_adapter("https://search.foundation.api.oneatlas.airbus.com")
+    assert isinstance(adapter, HTTPAdapter)
+    assert adapter._pool_maxsize == 10
+
+
+def test_request__compression_and_timeouts(requests_mock: Any) -> None:
+    requests_mock.post("https://test-url.co.uk/collection", json={"features": []})
+    http_client = HttpClient(connect_timeout=3, read_timeout=30)
+
+    response = http_client.post("https://test-url.co.uk/collection", json={"startPage": 1})
+
+    assert response.json() == {"features": []}
+    assert requests_mock.last_request.headers["Accept-Encoding"] == "gzip, deflate"
+    assert requests_mock.last_request.timeout == (3, 30)
+    assert requests_mock.last_request.json() == {"startPage": 1}
+
+
+def test_close() -> None:
+    http_client = HttpClient()
+    session = http_client.session("https://test-url.co.uk/collection")
+
+    http_client.close()
+
+    assert http_client.session("https://test-url.co.uk/collection") is not session
+
+
+def test_host_budget__concurrency() -> None:
+    budget = HostBudget(concurrency=2)
+    in_flight = max_in_flight = 0
+    lock = threading.Lock()
+
+    def request(url: str) -> None:
+        nonlocal in_flight, max_in_flight
+        with budget.slot(url):
+            with lock:
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+            time.sleep(0.02)
+            with lock:
+                in_flight -= 1
+
+    threads = [threading.Thread(target=request, args=("https://test-url.co.uk/page",)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max_in_flight == 2
+
+
+def test_host_budget__rate() -> None:
+    budget = HostBudget(concurrency=0, rate=10)
+
+    delays = [budget.reserve_start("test-url.co.uk") for _ in range(3)]
+
+    # Requests are spaced 0.1s apart, and each host has its own schedule
+    assert delays[0] == 0
+    assert 0.19 < delays[2] <= 0.2
+    assert budget.reserve_start("other-url.co.uk") == 0
+
+
+def test_request__within_budget(requests_mock: Any) -> None:
+    requests_mock.get("https://test-url.co.uk/collection", json={})
+    budget = HostBudget(concurrency=1)
+    http_client = HttpClient(budget=budget)
+
+    http_client.get("https://test-url.co.uk/collection")
+
+    # The slot is released once the response has been read
+    assert budget._slots["test-url.co.uk"].acquire(blocking=False)
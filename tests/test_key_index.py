@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import pytest
+
+from airbus_harvester.key_index import KeyIndex
+
+prefix = "commercial/catalogs/airbus/collections/airbus_sar_data/items/"
+
+
+def test_key_index() -> None:
+    index = KeyIndex(prefix)
+
+    index.update([f"{prefix}A.json", f"{prefix}B.json", "commercial/catalogs/airbus.json", "watermark"])
+
+    # Item keys are stored by their ID alone
+    assert index.ids == {"A", "B"}
+    assert index.other == {"commercial/catalogs/airbus.json", "watermark"}
+    assert f"{prefix}A.json" in index
+    assert f"{prefix}C.json" not in index
+    assert "watermark" in index
+    assert len(index) == 4
+    assert set(index) == {f"{prefix}A.json", f"{prefix}B.json", "commercial/catalogs/airbus.json", "watermark"}
+
+
+@pytest.mark.parametrize("key", [f"{prefix}.json", f"{prefix}A.geojson", "other/items/A.json"])
+def test_key_index__not_item_key(key: str) -> None:
+    index = KeyIndex(prefix)
+
+    index.add(key)
+
+    assert index.ids == set()
+    assert key in index
+
+
+def test_key_index__snapshot() -> None:
+    metadata = {f"{prefix}A.json": "hash", "summary": {}}
+
+    snapshot = KeyIndex.snapshot(metadata, prefix)
+
+    assert set(snapshot) == set(metadata)
+    with pytest.raises(TypeError):
+        snapshot.add(f"{prefix}B.json")
+
+
+def test_key_index__difference() -> None:
+    old = KeyIndex.snapshot([f"{prefix}A.json", f"{prefix}B.json", "summary", "old"], prefix)
+    new = KeyIndex(prefix)
+    new.update([f"{prefix}A.json", f"{prefix}C.json", "summary"])
+
+    assert sorted(old.difference(new)) == [f"{prefix}B.json", "old"]
+    # Indexes of different collections are compared by their full keys
+    assert sorted(old.difference(KeyIndex.snapshot([f"{prefix}A.json"], "other/"))) == [
+        f"{prefix}B.json",
+        "old",
+        "summary",
+    ]
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+import boto3
+import moto
+import pytest
+from botocore.exceptions import ClientError
+
+from airbus_harvester.metadata import MetadataStore
+
+bucket_name = "my-bucket"
+metadata_key = "harvested-metadata/airbus_sar_data"
+
+
+@pytest.fixture
+def s3_client() -> Any:
+    with moto.mock_aws():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket=bucket_name)
+        yield s3_client
+
+
+def list_keys(s3_client: Any) -> list[str]:
+    return [obj["Key"] for obj in s3_client.list_objects_v2(Bucket=bucket_name).get("Contents", [])]
+
+
+def read_json(s3_client: Any, key: str) -> dict:
+    return json.loads(s3_client.get_object(Bucket=bucket_name, Key=key)["Body"].read())
+
+
+def test_load__legacy_snapshot(s3_client: Any) -> None:
+    s3_client.put_object(Bucket=bucket_name, Key=metadata_key, Body=json.dumps({"a.json": "hash"}))
+
+    assert MetadataStore(s3_client, bucket_name, metadata_key).load() == {"a.json": "hash"}
+
+
+def test_load__missing(s3_client: Any) -> None:
+    assert MetadataStore(s3_client, bucket_name, metadata_key).load() == {}
+
+
+def test_append__replayed_on_load(s3_client: Any) -> None:
+    s3_client.put_object(Bucket=bucket_name, Key=metadata_key, Body=json.dumps({"a.json": "a", "b.json": "b"}))
+    store = MetadataStore(s3_client, bucket_name, metadata_key)
+    store.load()
+
+    store.append({"a.json": "a2", "c.json": "c"})
+    store.append({"c.json": "c2"}, deletes=["b.json"])
+    store.flush()
+
+    # The snapshot is untouched until the log is compacted
+    assert read_json(s3_client, metadata_key) == {"a.json": "a", "b.json": "b"}
+    assert len(list_keys(s3_client)) == 3
+
+    reloaded = MetadataStore(s3_client, bucket_name, metadata_key)
+    assert reloaded.load() == {"a.json": "a2", "c.json": "c2"}
+    assert reloaded.sequence == 2
+
+    # Sequence numbers carry on from the existing deltas
+    reloaded.append({"d.json": "d"})
+    reloaded.flush()
+    assert MetadataStore(s3_client, bucket_name, metadata_key).load()["d.json"] == "d"
+
+
+def test_compact(s3_client: Any) -> None:
+    store = MetadataStore(s3_client, bucket_name, metadata_key)
+    metadata = store.load()
+    metadata["a.json"] = "a"
+    store.append({"a.json": "a"})
+
+    store.compact(metadata)
+
+    assert list_keys(s3_client) == [metadata_key]
+    assert read_json(s3_client, metadata_key) == {"a.json": "a", "delta_sequence": 1}
+    assert MetadataStore(s3_client, bucket_name, metadata_key).load() == {"a.json": "a"}
+
+
+def test_load__skips_deltas_in_snapshot(s3_client: Any) -> None:
+    # Compaction was interrupted after writing the snapshot, before deleting the deltas it includes
+    s3_client.put_object(Bucket=bucket_name, Key=metadata_key, Body=json.dumps({"a.json": "a3", "delta_sequence": 2}))
+    for sequence, value in [(1, "a1"), (2, "a2")]:
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=f"{metadata_key}.deltas/{sequence:010d}",
+            Body=json.dumps({"updates": {"a.json": value}, "deletes": []}),
+        )
+
+    store = MetadataStore(s3_client, bucket_name, metadata_key)
+
+    assert store.load() == {"a.json": "a3"}
+    assert store.sequence == 2
+    assert len(store.delta_keys) == 2
+
+
+@pytest.mark.parametrize(
+    ("compaction_bytes", "compaction_deltas", "expected"),
+    [
+        pytest.param(10**9, 3, [False, False, True], id="deltas"),
+        pytest.param(50, 10**9, [False, True, True], id="bytes"),
+    ],
+)
+def test_needs_compaction(s3_client: Any, compaction_bytes: int, compaction_deltas: int, expected: list[bool]) -> None:
+    store = MetadataStore(
+        s3_client, bucket_name, metadata_key, compaction_bytes=compaction_bytes, compaction_deltas=compaction_deltas
+    )
+    store.load()
+
+    actual = []
+    for i in range(3):
+        store.append({f"{i}.json": "hash"})
+        actual.append(store.needs_compaction())
+    store.close()
+
+    assert actual == expected
+
+
+def test_append__upload_error_raised(s3_client: Any) -> None:
+    store = MetadataStore(s3_client, "missing-bucket", metadata_key)
+
+    store.append({"a.json": "a"})
+
+    with pytest.raises(ClientError, match="NoSuchBucket"):
+        store.flush()
+
+
+def test_compact__binary(s3_client: Any) -> None:
+    item_key = "commercial/catalogs/airbus/collections/airbus_sar_data/items/item.json"
+    s3_client.put_object(Bucket=bucket_name, Key=metadata_key, Body=json.dumps({item_key: "0123456789abcdef"}))
+    store = MetadataStore(s3_client, bucket_name, metadata_key, item_prefix=item_key.rsplit("/", 1)[0] + "/")
+    metadata = store.load()
+
+    store.compact(metadata)
+
+    body = s3_client.get_object(Bucket=bucket_name, Key=metadata_key)["Body"].read()
+    assert body.startswith(b"ABHM")
+    assert MetadataStore(s3_client, bucket_name, metadata_key).load() == {item_key: "0123456789abcdef"}
+
+
+def test_checkpoint(s3_client: Any) -> None:
+    store = MetadataStore(s3_client, bucket_name, metadata_key)
+    assert store.load_checkpoint() is None
+
+    store.save_checkpoint({"windows": [1]}, ["a.json", "b.json"])
+    store.save_checkpoint({"windows": [2]}, [])
+    store.save_checkpoint({"windows": [3]}, ["c.json"])
+    store.flush()
+
+    resumed = MetadataStore(s3_client, bucket_name, metadata_key)
+    assert resumed.load_checkpoint() == {"windows": [3], "seen_keys": {"a.json", "b.json", "c.json"}}
+
+    # Keys seen after resuming are saved alongside the ones from before
+    resumed.save_checkpoint({"windows": [4]}, ["d.json"])
+    resumed.flush()
+    assert MetadataStore(s3_client, bucket_name, metadata_key).load_checkpoint() == {
+        "windows": [4],
+        "seen_keys": {"a.json", "b.json", "c.json", "d.json"},
+    }
+
+    resumed.clear_checkpoint()
+    resumed.flush()
+    assert list_keys(s3_client) == []
+    assert resumed.load_checkpoint() is None
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any
+
+from airbus_harvester.metrics import HarvestMetrics, Histogram, export_metrics
+
+
+def test_histogram() -> None:
+    histogram = Histogram((0.1, 1.0))
+
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    # Values on a bucket's upper bound are counted in that bucket
+    assert histogram.cumulative_counts() == [2, 3, 4]
+    assert histogram.sum == 2.65
+    assert histogram.max == 2.0
+
+
+def test_harvest_metrics__report() -> None:
+    metrics = HarvestMetrics("airbus_sar_data")
+    metrics.count("items_added", 2)
+    metrics.count("retries")
+    metrics.observe("fetch", 0.5)
+    metrics.observe("fetch", 1.5)
+    with metrics.time("transform"):
+        pass
+    assert list(metrics.timed(iter([1, 2]), "page_wait")) == [1, 2]
+    metrics.finish()
+
+    report = metrics.report()
+
+    assert report["status"] == "succeeded"
+    assert report["counters"]["items_added"] == 2
+    assert report["counters"]["retries"] == 1
+    assert report["counters"]["items_deleted"] == 0
+    assert report["phases"]["fetch"] == {"count": 2, "seconds": 2.0, "mean_seconds": 1.0, "max_seconds": 1.5}
+    assert report["phases"]["transform"]["count"] == 1
+    assert report["phases"]["page_wait"]["count"] == 2
+    json.dumps(report)
+
+
+def test_harvest_metrics__to_prometheus() -> None:
+    metrics = HarvestMetrics("airbus_sar_data")
+    metrics.count("pages", 3)
+    metrics.observe("hash", 0.002)
+    metrics.finish("interrupted")
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert "# TYPE airbus_harvest_phase_seconds histogram" in lines
+    assert 'airbus_harvest_phase_seconds_bucket{collection="airbus_sar_data",phase="hash",le="0.001"} 0' in lines
+    assert 'airbus_harvest_phase_seconds_bucket{collection="airbus_sar_data",phase="hash",le="0.005"} 1' in lines
+    assert 'airbus_harvest_phase_seconds_bucket{collection="airbus_sar_data",phase="hash",le="+Inf"} 1' in lines
+    assert 'airbus_harvest_phase_seconds_count{collection="airbus_sar_data",phase="hash"} 1' in lines
+    assert 'airbus_harvest_pages_total{collection="airbus_sar_data"} 3' in lines
+    assert any(
+        line.startswith('airbus_harvest_finished_timestamp_seconds{collection="airbus_sar_data",status="interrupted"}')
+        for line in lines
+    )
+
+
+def test_export_metrics__textfile(tmp_path: Path) -> None:
+    metrics = HarvestMetrics("airbus_sar_data")
+    metrics.finish()
+
+    export_metrics(metrics, pushgateway_url="", textfile_dir=str(tmp_path))
+
+    assert [path.name for path in tmp_path.iterdir()] == ["airbus_harvest_airbus_sar_data.prom"]
+    assert (tmp_path / "airbus_harvest_airbus_sar_data.prom").read_text() == metrics.to_prometheus()
+
+
+def test_export_metrics__pushgateway(requests_mock: Any) -> None:
+    url = "http://pushgateway:9091/metrics/job/airbus_harvester/collection/airbus_sar_data"
+    requests_mock.put(url)
+    metrics = HarvestMetrics("airbus_sar_data")
+    metrics.finish()
+
+    export_metrics(metrics, pushgateway_url="http://pushgateway:9091/", textfile_dir="")
+
+    assert requests_mock.last_request.url == url
+    assert requests_mock.last_request.body == metrics.to_prometheus().encode("utf-8")
+
+
+def test_export_metrics__push_failure(requests_mock: Any) -> None:
+    requests_mock.put(
+        "http://pushgateway:9091/metrics/job/airbus_harvester/collection/airbus_sar_data", status_code=500
+    )
+
+    # Failing to export metrics does not fail the harvest
+    export_metrics(HarvestMetrics("airbus_sar_data"), pushgateway_url="http://pushgateway:9091", textfile_dir="")
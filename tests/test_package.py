@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import copy
+import datetime
 import json
 import os
+import pstats
+import signal
 import tempfile
-from typing import Any
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
 from unittest import mock
 from unittest.mock import patch
 
@@ -13,17 +19,37 @@ import pytest
 from click.testing import CliRunner
 
 from airbus_harvester.__main__ import (
-    add_to_catalogue_data_summary,
-    coordinates_to_bbox,
     find_deleted_keys,
     generate_stac_collection,
     generate_stac_item,
+    get_file_hash,
+    get_incremental_start,
+    get_latest_update_time,
+    get_next_page,
     get_stac_collection_summary,
-    handle_external_url,
     harvest,
+    harvest_all,
+    load_collection_template,
+    load_config,
     make_catalogue,
-    modify_value,
 )
+from airbus_harvester.async_engine import AsyncEngine
+from airbus_harvester.auth import AccessTokenManager
+from airbus_harvester.extent import CollectionExtent
+from airbus_harvester.geometry import coordinates_to_bbox
+from airbus_harvester.hashing import configured_hash_scheme, split_stored_hash
+from airbus_harvester.key_index import KeyIndex
+from airbus_harvester.serialization import canonical_dumps, document_format
+from airbus_harvester.state_codec import decode_state
+from airbus_harvester.transformer import ItemTransformer, handle_external_url, modify_value
+
+if TYPE_CHECKING:
+    import httpx
+else:
+    try:
+        import httpx
+    except ImportError:  # httpx is optional, only needed for the async engine
+        httpx = None
 
 
 @pytest.fixture(autouse=True)
@@ -177,6 +203,7 @@ def mock_config() -> dict:
         "url": "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication",
         "auth_env": "prod",
         "body": None,
+        "request_method": "GET",
         "stac_properties": {
             "access": ["HTTPServer"],
             "sar:frequency_band": "X",
@@ -237,7 +264,7 @@ def test_harvest(mock_create_client: Any, requests_mock: Any, mock_catalogue_res
     s3_resource = boto3.resource("s3")
     my_bucket = s3_resource.Bucket(bucket_name)
 
-    assert len(list(my_bucket.objects.all())) == 4
+    assert len(list(my_bucket.objects.all())) == 5
 
     args, _kwargs = mock_producer.send.call_args
     call_args = json.loads(args[0])
@@ -256,6 +283,121 @@ def test_harvest(mock_create_client: Any, requests_mock: Any, mock_catalogue_res
     assert len(call_args["updated_keys"]) == len(call_args["deleted_keys"]) == 0
 
 
+@moto.mock_aws
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__report(mock_create_client: Any, requests_mock: Any, mock_catalogue_response: dict) -> None:
+    requests_mock.get(
+        "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication",
+        text=json.dumps(mock_catalogue_response),
+    )
+    requests_mock.post(
+        "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+        text='{"access_token": "my_access_token"}',
+    )
+    mock_create_client.return_value = mock.MagicMock()
+
+    bucket_name = "my-bucket"
+    s3_client: Any = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket=bucket_name)
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SAR"
+
+    reports = []
+    for _ in range(2):
+        result = CliRunner().invoke(harvest, f"workspace catalogue {bucket_name}".split())
+        assert result.exit_code == 0
+        body = s3_client.get_object(Bucket=bucket_name, Key="harvested-metadata/airbus_sar_data.report.json")["Body"]
+        reports.append(json.loads(body.read()))
+
+    assert reports[0]["status"] == "succeeded"
+    assert reports[0]["counters"]["pages"] == 1
+    assert reports[0]["counters"]["items_added"] == 1
+    assert reports[0]["counters"]["bytes_in"] == len(json.dumps(mock_catalogue_response))
+    assert reports[0]["counters"]["bytes_out"] > 0
+    assert reports[0]["phases"]["fetch"]["count"] == 1
+    assert reports[0]["phases"]["transform"]["count"] == 1
+    assert reports[0]["phases"]["publish"]["count"] == 1
+    assert reports[0]["phases"]["metadata"]["count"] > 0
+    # Nothing changed for the second harvest
+    assert reports[1]["counters"]["items_added"] == reports[1]["counters"]["items_updated"] == 0
+    assert reports[1]["counters"]["items_skipped"] == 1
+
+
+@moto.mock_aws
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__profile(
+    mock_create_client: Any, requests_mock: Any, mock_catalogue_response: dict, tmp_path: Path
+) -> None:
+    requests_mock.get(
+        "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication",
+        text=json.dumps(mock_catalogue_response),
+    )
+    requests_mock.post(
+        "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+        text='{"access_token": "my_access_token"}',
+    )
+    mock_create_client.return_value = mock.MagicMock()
+
+    bucket_name = "my-bucket"
+    s3_client: Any = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket=bucket_name)
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SAR"
+
+    result = CliRunner().invoke(harvest, f"workspace catalogue {bucket_name} --profile sample".split())
+    assert result.exit_code == 0
+    keys = [
+        obj["Key"] for obj in s3_client.list_objects_v2(Bucket=bucket_name, Prefix="harvest-profiles/")["Contents"]
+    ]
+    assert len(keys) == 1
+    assert keys[0].startswith("harvest-profiles/sar-")
+    assert keys[0].endswith(".collapsed")
+
+    args = f"workspace catalogue {bucket_name} --profile cprofile --profile-pages 1 --profile-dir {tmp_path}"
+    result = CliRunner().invoke(harvest, args.split())
+    assert result.exit_code == 0
+    profiles = list(tmp_path.glob("sar-*.pstats"))
+    assert len(profiles) == 1
+    assert "harvest_collection" in str(pstats.Stats(str(profiles[0])).stats)  # type: ignore[attr-defined]
+
+
+@pytest.mark.skipif(httpx is None, reason="httpx not installed")
+@moto.mock_aws
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__async_engine(mock_create_client: Any, mock_catalogue_response: dict) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host.startswith("authenticate"):
+            return httpx.Response(200, json={"access_token": "my_access_token"})
+        assert request.headers["Authorization"] == "Bearer my_access_token"
+        return httpx.Response(200, json=mock_catalogue_response)
+
+    mock_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    mock_create_client.return_value = mock_client
+    mock_client.create_producer.return_value = mock_producer
+
+    bucket_name = "my-bucket"
+    s3_resource: Any = boto3.resource("s3", region_name="us-east-1")
+    s3_resource.create_bucket(Bucket=bucket_name)
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SAR"
+
+    def engine() -> AsyncEngine:
+        return AsyncEngine(transport=httpx.MockTransport(handler))
+
+    runner = CliRunner()
+    with patch("airbus_harvester.async_engine.AsyncEngine", side_effect=engine):
+        result = runner.invoke(harvest, f"workspace catalogue {bucket_name} --engine async".split())
+    assert result.exit_code == 0
+
+    assert len(list(s3_resource.Bucket(bucket_name).objects.all())) == 5
+    args, _kwargs = mock_producer.send.call_args
+    assert len(json.loads(args[0])["added_keys"]) == 3
+
+
 @moto.mock_aws
 @patch("airbus_harvester.__main__.get_pulsar_client")
 def test_harvest_delete(
@@ -314,7 +456,7 @@ def test_harvest_delete(
     runner = CliRunner()
     runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
 
-    assert len(list(my_bucket.objects.all())) == 4
+    assert len(list(my_bucket.objects.all())) == 5
 
     args, _kwargs = mock_producer.send.call_args
     call_args = json.loads(args[0])
@@ -350,7 +492,7 @@ def test_get_stac_collection_summary(mock_data: dict, mock_response: dict) -> No
         "stop_time": mock_response["features"][0]["properties"]["stopTime"],
     }
 
-    actual_summary = get_stac_collection_summary(mock_data)
+    actual_summary = get_stac_collection_summary(CollectionExtent.from_dict(mock_data))
 
     assert actual_summary == expected_summary
 
@@ -382,6 +524,43 @@ def test_generate_stac_collection(mock_data: dict, mock_config: dict) -> None:
     }.issubset(set(actual_collection.keys()))
 
 
+def test_generate_stac_collection__template_cached(mock_config: dict) -> None:
+    mock_data_summary = {
+        "bbox": [1, 2, 3, 4],
+        "start_time": "2024-01-22T19:42:44.735Z",
+        "stop_time": "2024-01-22T19:42:46.446Z",
+    }
+    load_collection_template.cache_clear()
+
+    with patch("airbus_harvester.__main__.load_config", wraps=load_config) as mock_load_config:
+        first_collection = generate_stac_collection(mock_data_summary, mock_config)
+        second_collection = generate_stac_collection({**mock_data_summary, "bbox": [5, 6, 7, 8]}, mock_config)
+
+    assert mock_load_config.call_count == 1
+    assert first_collection["extent"]["spatial"]["bbox"] == [[1, 2, 3, 4]]
+    assert second_collection["extent"]["spatial"]["bbox"] == [[5, 6, 7, 8]]
+    assert load_collection_template(mock_config["collection_name"])["extent"]["spatial"]["bbox"] == []
+    assert list(first_collection.keys()) == list(load_config("airbus_harvester/airbus_sar_data.json").keys())
+
+
+def test_generate_stac_collection__template_not_shared(mock_config: dict) -> None:
+    mock_data_summary = {
+        "bbox": [1, 2, 3, 4],
+        "start_time": "2024-01-22T19:42:44.735Z",
+        "stop_time": "2024-01-22T19:42:46.446Z",
+    }
+    load_collection_template.cache_clear()
+
+    first_collection = generate_stac_collection(mock_data_summary, mock_config)
+    expected = copy.deepcopy(first_collection)
+    first_collection["links"].append({"rel": "self", "href": "https://example.com"})
+    for asset in first_collection["assets"].values():
+        asset["href"] = "modified"
+
+    # Changes to nested values of one collection do not reach the cached template
+    assert generate_stac_collection(mock_data_summary, mock_config) == expected
+
+
 def test_handle_external_url__with_quicklook(mock_config: dict) -> None:
     external_url = mock_config["external_urls"][0]
 
@@ -464,33 +643,8 @@ def test_make_catalogue() -> None:
     assert actual_catalogue == expected_catalogue
 
 
-def test_add_to_all_data_summary(mock_response: dict) -> None:
-    data = {
-        "type": "Feature",
-        "geometry": {
-            "type": "Polygon",
-            "coordinates": [
-                [
-                    [-27.9837603, 38.6070725],
-                    [-28.0150768, 38.7135605],
-                    [-28.1373002, 38.6958769],
-                    [-28.1166933, 38.5878242],
-                    [-27.9837603, 38.6070725],
-                ]
-            ],
-        },
-        "properties": {
-            "start_datetime": "2024-01-22T19:42:44.735Z",
-            "end_datetime": "2024-01-22T19:42:46.446Z",
-        },
-    }
-    all_data: dict[str, list] = {"coordinates": [], "start_time": [], "stop_time": []}
-
-    all_data = add_to_catalogue_data_summary(all_data, data)
-
-    assert all_data["coordinates"][0] == data["geometry"]["coordinates"][0][0]
-    assert all_data["start_time"][0] == data["properties"]["start_datetime"]
-    assert all_data["stop_time"][0] == data["properties"]["end_datetime"]
+def test_get_stac_collection_summary__empty() -> None:
+    assert get_stac_collection_summary(CollectionExtent()) == {}
 
 
 @pytest.mark.parametrize(
@@ -501,3 +655,696 @@ def test_find_deleted_keys(first: set, second: dict, expected: list) -> None:
     actual = find_deleted_keys(first, second)
 
     assert set(actual) == set(expected)
+
+
+def test_find_deleted_keys__key_index() -> None:
+    prefix = "commercial/catalogs/airbus/collections/airbus_sar_data/items/"
+    previous = KeyIndex.snapshot({f"{prefix}A.json": "1", f"{prefix}B.json": "2", "summary": {}}, prefix)
+    current = KeyIndex(prefix)
+    current.update([f"{prefix}A.json", "summary"])
+
+    assert list(find_deleted_keys(current, previous)) == [f"{prefix}B.json"]
+
+
+def test_get_next_page__retries_with_new_token_on_401(
+    requests_mock: Any, mock_catalogue_response: dict, mock_config: dict
+) -> None:
+    token_url = "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token"
+    requests_mock.post(
+        token_url,
+        [
+            {"text": '{"access_token": "revoked_token", "expires_in": 3600}'},
+            {"text": '{"access_token": "new_token", "expires_in": 3600}'},
+        ],
+    )
+    requests_mock.get(
+        mock_config["url"],
+        [
+            {"status_code": 401},
+            {"text": json.dumps(mock_catalogue_response)},
+        ],
+    )
+
+    with patch("airbus_harvester.__main__.token_manager", AccessTokenManager(background_refresh=False)):
+        body = get_next_page(mock_config["url"], mock_config)
+
+    assert body == mock_catalogue_response
+    assert requests_mock.request_history[-1].headers["Authorization"] == "Bearer new_token"
+
+
+@pytest.fixture
+def mock_optical_response() -> dict:
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [
+                        [
+                            [-1.7, 52.1],
+                            [-1.5, 52.1],
+                            [-1.5, 52.3],
+                            [-1.7, 52.3],
+                            [-1.7, 52.1],
+                        ]
+                    ],
+                },
+                "properties": {
+                    "acquisitionIdentifier": "DS_SPOT7_202401221042448_FR1_FR1_SE1_SE1_W002N52_01709",
+                    "acquisitionDate": "2024-01-22T10:42:44.800Z",
+                    "lastUpdateDate": "2024-02-01T08:00:00.123Z",
+                    "cloudCover": 2.5,
+                    "constellation": "SPOT",
+                },
+                "_links": {
+                    "quicklook": {"href": "https://test-url.co.uk/quicklook.jpg"},
+                    "thumbnail": {"href": "https://test-url.co.uk/thumbnail.jpg"},
+                },
+            }
+        ],
+    }
+
+
+@pytest.mark.parametrize(
+    ("watermark", "expected"),
+    [
+        pytest.param({}, None, id="no_watermark"),
+        pytest.param({"last_update": "2024-02-01T08:00:00.123Z"}, None, id="no_full_harvest"),
+        pytest.param(
+            {"last_update": "2024-02-01T08:00:00.123Z", "last_full_harvest": "2000-01-01T00:00:00Z"},
+            None,
+            id="full_harvest_due",
+        ),
+        pytest.param(
+            {"last_update": "2024-02-01T08:00:00.123Z", "last_full_harvest": "recent"},
+            "2024-01-31T08:00:00Z",
+            id="incremental",
+        ),
+    ],
+)
+def test_get_incremental_start(watermark: dict, expected: str | None) -> None:
+    config = load_config("airbus_harvester/config.json")["SPOT"]
+    if watermark.get("last_full_harvest") == "recent":
+        watermark["last_full_harvest"] = datetime.datetime.now(datetime.UTC).isoformat()
+
+    assert get_incremental_start(watermark, config) == expected
+
+
+def test_get_incremental_start__unsorted() -> None:
+    config = load_config("airbus_harvester/config.json")["SAR"]
+    watermark = {
+        "last_update": "2024-02-01T08:00:00Z",
+        "last_full_harvest": datetime.datetime.now(datetime.UTC).isoformat(),
+    }
+
+    assert get_incremental_start(watermark, config) is None
+
+
+@pytest.mark.parametrize(
+    ("latest", "update_time", "expected"),
+    [
+        pytest.param(None, "2024-02-01T08:00:00Z", "2024-02-01T08:00:00Z", id="first"),
+        pytest.param("2024-02-01T08:00:00Z", "2024-02-01T08:00:00.500Z", "2024-02-01T08:00:00.500Z", id="newer"),
+        pytest.param("2024-02-01T08:00:00.500Z", "2024-02-01T08:00:00Z", "2024-02-01T08:00:00.500Z", id="older"),
+        pytest.param("2024-02-01T08:00:00Z", None, "2024-02-01T08:00:00Z", id="missing"),
+    ],
+)
+def test_get_latest_update_time(latest: str | None, update_time: str | None, expected: str) -> None:
+    entry = {"properties": {"lastUpdateDate": update_time}}
+
+    assert get_latest_update_time(latest, entry, {"update_time_key": "lastUpdateDate"}) == expected
+
+
+@moto.mock_aws
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__incremental(mock_create_client: Any, requests_mock: Any, mock_optical_response: dict) -> None:
+    opensearch_url = "https://search.foundation.api.oneatlas.airbus.com/api/v2/opensearch"
+    requests_mock.post(
+        opensearch_url,
+        [{"text": json.dumps(mock_optical_response)}, {"text": json.dumps({"features": []})}],
+    )
+
+    mock_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    mock_create_client.return_value = mock_client
+    mock_client.create_producer.return_value = mock_producer
+
+    bucket_name = "my-bucket"
+    s3_client: Any = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket=bucket_name)
+    previous_metadata = {
+        "some/file/key/not/deleted.json": "hash",
+        "watermark": {
+            "last_update": "2024-01-30T12:00:00Z",
+            "last_full_harvest": datetime.datetime.now(datetime.UTC).isoformat(),
+        },
+    }
+    s3_client.put_object(
+        Bucket=bucket_name, Key="harvested-metadata/airbus_spot_data", Body=json.dumps(previous_metadata)
+    )
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SPOT"
+
+    runner = CliRunner()
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name} --incremental".split())
+    assert result.exit_code == 0
+
+    # Only items updated since the watermark, with an overlap, are requested
+    assert requests_mock.request_history[0].json()["lastUpdateDate"].startswith("[2024-01-29T12:00:00Z,")
+
+    args, _kwargs = mock_producer.send.call_args
+    call_args = json.loads(args[0])
+    assert len(call_args["added_keys"]) == 3
+    assert len(call_args["deleted_keys"]) == 0
+
+    metadata = decode_state(
+        s3_client.get_object(Bucket=bucket_name, Key="harvested-metadata/airbus_spot_data")["Body"]
+    )
+    assert "some/file/key/not/deleted.json" in metadata
+    assert metadata["watermark"]["last_update"] == "2024-02-01T08:00:00.123Z"
+    assert metadata["watermark"]["last_full_harvest"] == previous_metadata["watermark"]["last_full_harvest"]
+    # Items not requested still have hashes from the previous scheme
+    assert metadata["hash_scheme"]["algorithm"] == "md5"
+
+
+@moto.mock_aws
+@patch("airbus_harvester.__main__.collection_publish_interval", 2)
+@patch("airbus_harvester.__main__.minimum_message_entries", 1)
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__collection_publish_interval(
+    mock_create_client: Any, requests_mock: Any, mock_catalogue_response: dict
+) -> None:
+    url = "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication"
+    for page in range(3):
+        response = json.loads(json.dumps(mock_catalogue_response))
+        feature = response["features"][0]
+        feature["properties"]["acquisitionId"] = f"item-{page}"
+        # Each page extends the collection extent
+        feature["geometry"]["coordinates"][0][1][0] += page + 1
+        response["_links"] = {"next": f"{url}?page={page + 1}"} if page < 2 else {}
+        requests_mock.get(url if page == 0 else f"{url}?page={page}", text=json.dumps(response))
+    requests_mock.post(
+        "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+        text='{"access_token": "my_access_token"}',
+    )
+
+    mock_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    mock_create_client.return_value = mock_client
+    mock_client.create_producer.return_value = mock_producer
+
+    bucket_name = "my-bucket"
+    s3_resource: Any = boto3.resource("s3", region_name="us-east-1")
+    s3_resource.create_bucket(Bucket=bucket_name)
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SAR"
+
+    runner = CliRunner()
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert result.exit_code == 0
+
+    messages = [json.loads(args[0]) for args, _kwargs in mock_producer.send.call_args_list]
+    collection_sent = [
+        any(key.endswith("collections/airbus_sar_data.json") for key in message["added_keys"]) for message in messages
+    ]
+    # Sent in the first message, then at most every other message, and in the final message
+    assert collection_sent == [True, False, True, True]
+
+    # Metadata deltas written for each message are compacted at the end of the harvest
+    metadata_keys = [obj.key for obj in s3_resource.Bucket(bucket_name).objects.filter(Prefix="harvested-metadata/")]
+    assert metadata_keys == ["harvested-metadata/airbus_sar_data", "harvested-metadata/airbus_sar_data.report.json"]
+
+
+@moto.mock_aws
+@patch("airbus_harvester.__main__.message_max_bytes", 1)
+@patch("airbus_harvester.__main__.minimum_message_entries", 1000)
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__message_max_bytes(
+    mock_create_client: Any, requests_mock: Any, mock_catalogue_response: dict
+) -> None:
+    url = "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication"
+    for page in range(3):
+        response = json.loads(json.dumps(mock_catalogue_response))
+        response["features"][0]["properties"]["acquisitionId"] = f"item-{page}"
+        response["_links"] = {"next": f"{url}?page={page + 1}"} if page < 2 else {}
+        requests_mock.get(url if page == 0 else f"{url}?page={page}", text=json.dumps(response))
+    requests_mock.post(
+        "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+        text='{"access_token": "my_access_token"}',
+    )
+
+    mock_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    mock_create_client.return_value = mock_client
+    mock_client.create_producer.return_value = mock_producer
+
+    bucket_name = "my-bucket"
+    s3_resource: Any = boto3.resource("s3", region_name="us-east-1")
+    s3_resource.create_bucket(Bucket=bucket_name)
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SAR"
+
+    runner = CliRunner()
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert result.exit_code == 0
+
+    # The byte budget is used up by every page, well before the entry limit
+    messages = [json.loads(args[0]) for args, _kwargs in mock_producer.send.call_args_list]
+    assert len(messages) == 4
+    for page in range(3):
+        item_key = f"commercial/catalogs/airbus/collections/airbus_sar_data/items/item-{page}.json"
+        assert item_key in messages[page]["added_keys"]
+        assert s3_resource.Object(bucket_name, f"git-harvester/{item_key}").get()["ContentLength"] > 0
+
+
+@moto.mock_aws
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__legacy_hashes_not_republished(
+    mock_create_client: Any, requests_mock: Any, mock_catalogue_response: dict
+) -> None:
+    requests_mock.get(
+        "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication",
+        text=json.dumps(mock_catalogue_response),
+    )
+    requests_mock.post(
+        "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+        text='{"access_token": "my_access_token"}',
+    )
+
+    mock_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    mock_create_client.return_value = mock_client
+    mock_client.create_producer.return_value = mock_producer
+
+    config = load_config("airbus_harvester/config.json")["SAR"]
+    feature = mock_catalogue_response["features"][0]
+    item = generate_stac_item(feature, config)
+    item_key = f"commercial/catalogs/airbus/collections/airbus_sar_data/items/{item['id']}.json"
+
+    # Metadata written before documents were serialised canonically
+    bucket_name = "my-bucket"
+    s3_client: Any = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket=bucket_name)
+    previous_metadata = {
+        "commercial/catalogs/airbus.json": get_file_hash(json.dumps(make_catalogue())),
+        item_key: get_file_hash(json.dumps(item)),
+    }
+    s3_client.put_object(
+        Bucket=bucket_name, Key="harvested-metadata/airbus_sar_data", Body=json.dumps(previous_metadata)
+    )
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SAR"
+
+    runner = CliRunner()
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert result.exit_code == 0
+
+    args, _kwargs = mock_producer.send.call_args
+    call_args = json.loads(args[0])
+    assert call_args["added_keys"] == ["commercial/catalogs/airbus/collections/airbus_sar_data.json"]
+
+    metadata = decode_state(s3_client.get_object(Bucket=bucket_name, Key="harvested-metadata/airbus_sar_data")["Body"])
+    assert metadata["hash_scheme"] == {
+        "algorithm": "blake2b",
+        "digest_size": 8,
+        "document_format": document_format(),
+        "volatile_fields": ["properties.updated", "properties.expiry"],
+        "version": 2,
+    }
+    assert split_stored_hash(metadata[item_key])[0] == configured_hash_scheme().digest(canonical_dumps(item))
+
+
+@moto.mock_aws
+@patch("airbus_harvester.hashing.random.random", return_value=1.0)
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__unchanged_features_not_transformed(
+    mock_create_client: Any, mock_random: Any, requests_mock: Any, mock_catalogue_response: dict
+) -> None:
+    requests_mock.get(
+        "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication",
+        text=json.dumps(mock_catalogue_response),
+    )
+    requests_mock.post(
+        "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+        text='{"access_token": "my_access_token"}',
+    )
+
+    mock_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    mock_create_client.return_value = mock_client
+    mock_client.create_producer.return_value = mock_producer
+
+    bucket_name = "my-bucket"
+    s3_resource: Any = boto3.resource("s3", region_name="us-east-1")
+    s3_resource.create_bucket(Bucket=bucket_name)
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SAR"
+
+    collection_key = "git-harvester/commercial/catalogs/airbus/collections/airbus_sar_data.json"
+    runner = CliRunner()
+    with patch.object(ItemTransformer, "transform", autospec=True, side_effect=ItemTransformer.transform) as transform:
+        result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+        assert result.exit_code == 0
+        assert transform.call_count == 1
+        collection = s3_resource.Object(bucket_name, collection_key).get()["Body"].read()
+
+        result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+        assert result.exit_code == 0
+        assert transform.call_count == 1
+
+    args, _kwargs = mock_producer.send.call_args
+    call_args = json.loads(args[0])
+    assert call_args["added_keys"] == ["commercial/catalogs/airbus/collections/airbus_sar_data.json"]
+    # The collection extent is still kept up to date from the skipped item
+    assert s3_resource.Object(bucket_name, collection_key).get()["Body"].read() == collection
+
+
+@moto.mock_aws
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__volatile_changes_held_until_refresh(
+    mock_create_client: Any, requests_mock: Any, mock_catalogue_response: dict
+) -> None:
+    url = "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication"
+    requests_mock.get(url, text=json.dumps(mock_catalogue_response))
+    requests_mock.post(
+        "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+        text='{"access_token": "my_access_token"}',
+    )
+
+    mock_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    mock_create_client.return_value = mock_client
+    mock_client.create_producer.return_value = mock_producer
+
+    bucket_name = "my-bucket"
+    s3_resource: Any = boto3.resource("s3", region_name="us-east-1")
+    s3_resource.create_bucket(Bucket=bucket_name)
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SAR"
+
+    feature = mock_catalogue_response["features"][0]
+    item_key = (
+        f"commercial/catalogs/airbus/collections/airbus_sar_data/items/{feature['properties']['acquisitionId']}.json"
+    )
+    runner = CliRunner()
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert result.exit_code == 0
+
+    # Only a volatile field changes, so the item is not republished until the next refresh
+    feature["properties"]["expiry"] = "2024-09-13T15:06:19Z"
+    requests_mock.get(url, text=json.dumps(mock_catalogue_response))
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert result.exit_code == 0
+    args, _kwargs = mock_producer.send.call_args
+    assert item_key not in json.loads(args[0])["added_keys"]
+
+    with patch("airbus_harvester.__main__.is_volatile_refresh_due", return_value=True):
+        result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert result.exit_code == 0
+    args, _kwargs = mock_producer.send.call_args
+    assert item_key in json.loads(args[0])["added_keys"]
+
+    item = s3_resource.Object(bucket_name, f"git-harvester/{item_key}").get()["Body"].read()
+    assert json.loads(item)["properties"]["expiry"] == "2024-09-13T15:06:19Z"
+
+    # Once published, the change is not published again
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert result.exit_code == 0
+    args, _kwargs = mock_producer.send.call_args
+    assert item_key not in json.loads(args[0])["added_keys"]
+
+
+@moto.mock_aws
+@patch("airbus_harvester.hashing.random.random", return_value=1.0)
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__volatile_fields_changed(
+    mock_create_client: Any, mock_random: Any, requests_mock: Any, mock_catalogue_response: dict
+) -> None:
+    url = "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication"
+    requests_mock.get(url, text=json.dumps(mock_catalogue_response))
+    requests_mock.post(
+        "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+        text='{"access_token": "my_access_token"}',
+    )
+
+    mock_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    mock_create_client.return_value = mock_client
+    mock_client.create_producer.return_value = mock_producer
+
+    bucket_name = "my-bucket"
+    s3_client: Any = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket=bucket_name)
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SAR"
+
+    feature = mock_catalogue_response["features"][0]
+    feature["properties"]["lastUpdateTime"] = "2024-08-30T15:06:20Z"
+    requests_mock.get(url, text=json.dumps(mock_catalogue_response))
+    item_key = (
+        f"commercial/catalogs/airbus/collections/airbus_sar_data/items/{feature['properties']['acquisitionId']}.json"
+    )
+    configs = load_config("airbus_harvester/config.json")
+    without_volatile_fields = {**configs, "SAR": {**configs["SAR"], "volatile_fields": []}}
+    runner = CliRunner()
+    with patch("airbus_harvester.__main__.load_config", return_value=without_volatile_fields):
+        result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert result.exit_code == 0
+
+    # Adding volatile fields doesn't republish the unchanged item, and migrates its stored hash
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert result.exit_code == 0
+    args, _kwargs = mock_producer.send.call_args
+    assert item_key not in json.loads(args[0])["added_keys"]
+    metadata = decode_state(s3_client.get_object(Bucket=bucket_name, Key="harvested-metadata/airbus_sar_data")["Body"])
+    assert metadata["hash_scheme"]["volatile_fields"] == ["properties.updated", "properties.expiry"]
+    item = json.loads(s3_client.get_object(Bucket=bucket_name, Key=f"git-harvester/{item_key}")["Body"].read())
+    assert split_stored_hash(metadata[item_key])[0] == configured_hash_scheme(
+        volatile_fields=["properties.updated", "properties.expiry"]
+    ).hash_document(item, canonical_dumps(item))
+
+    # So a later change to only a volatile field is held back as usual
+    feature["properties"]["lastUpdateTime"] = "2024-09-13T15:06:20Z"
+    requests_mock.get(url, text=json.dumps(mock_catalogue_response))
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert result.exit_code == 0
+    args, _kwargs = mock_producer.send.call_args
+    assert item_key not in json.loads(args[0])["added_keys"]
+
+
+@moto.mock_aws
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest_all(
+    mock_create_client: Any, requests_mock: Any, mock_catalogue_response: dict, mock_optical_response: dict
+) -> None:
+    requests_mock.get(
+        "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication",
+        text=json.dumps(mock_catalogue_response),
+    )
+    requests_mock.post(
+        "https://search.foundation.api.oneatlas.airbus.com/api/v2/opensearch",
+        [{"text": json.dumps(mock_optical_response)}, {"text": json.dumps({"features": []})}],
+    )
+    requests_mock.post(
+        "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+        text='{"access_token": "my_access_token"}',
+    )
+
+    mock_client = mock.MagicMock()
+    mock_create_client.return_value = mock_client
+
+    bucket_name = "my-bucket"
+    s3_resource: Any = boto3.resource("s3", region_name="us-east-1")
+    s3_resource.create_bucket(Bucket=bucket_name)
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+
+    runner = CliRunner()
+    result = runner.invoke(harvest_all, f"workspace catalogue {bucket_name} --config-keys sar,spot".split())
+    assert result.exit_code == 0
+
+    # One Pulsar client is shared, with a producer per collection
+    assert mock_create_client.call_count == 1
+    assert mock_client.create_producer.call_count == 2
+    keys = {obj.key for obj in s3_resource.Bucket(bucket_name).objects.all()}
+    assert {"harvested-metadata/airbus_sar_data", "harvested-metadata/airbus_spot_data"} <= keys
+    assert "git-harvester/commercial/catalogs/airbus/collections/airbus_sar_data.json" in keys
+    assert "git-harvester/commercial/catalogs/airbus/collections/airbus_spot_data.json" in keys
+
+
+@moto.mock_aws
+def test_harvest__unknown_config_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("HARVESTER_CONFIG_KEY", "NOPE")
+
+    result = CliRunner().invoke(harvest, ["workspace", "catalogue", "my-bucket"])
+
+    assert result.exit_code == 1
+    assert "NOPE" in result.output
+
+
+def test_harvest_all__unknown_config_key() -> None:
+    result = CliRunner().invoke(harvest_all, ["workspace", "catalogue", "my-bucket", "--config-keys", "SAR,NOPE"])
+
+    assert result.exit_code == 2
+    assert "NOPE" in result.output
+
+
+@moto.mock_aws
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__resumed_after_sigterm(
+    mock_create_client: Any, requests_mock: Any, mock_catalogue_response: dict
+) -> None:
+    url = "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication"
+    feature = mock_catalogue_response["features"][0]
+    first_page: dict[str, Any] = {
+        "features": [{**feature, "properties": {**feature["properties"], "acquisitionId": "A"}}]
+    }
+    first_page["_links"] = {"next": f"{url}?page=2"}
+    second_page: dict[str, Any] = {
+        "features": [{**feature, "properties": {**feature["properties"], "acquisitionId": "B"}}]
+    }
+    second_page["_links"] = {}
+    first_page_requests = 0
+
+    def get_first_page(_request: Any, _context: Any) -> str:
+        nonlocal first_page_requests
+        first_page_requests += 1
+        if first_page_requests == 1:
+            # The pod is told to stop while the first page is being harvested
+            os.kill(os.getpid(), signal.SIGTERM)
+        return json.dumps(first_page)
+
+    requests_mock.get(url, text=get_first_page)
+    requests_mock.get(f"{url}?page=2", text=json.dumps(second_page))
+    requests_mock.post(
+        "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+        text='{"access_token": "my_access_token"}',
+    )
+
+    mock_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    mock_create_client.return_value = mock_client
+    mock_client.create_producer.return_value = mock_producer
+
+    bucket_name = "my-bucket"
+    s3_client: Any = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket=bucket_name)
+    items = "commercial/catalogs/airbus/collections/airbus_sar_data/items"
+    s3_client.put_object(
+        Bucket=bucket_name, Key="harvested-metadata/airbus_sar_data", Body=json.dumps({f"{items}/C.json": "hash"})
+    )
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SAR"
+
+    runner = CliRunner()
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert result.exit_code == 128 + signal.SIGTERM
+    args, _kwargs = mock_producer.send.call_args
+    assert f"{items}/A.json" in json.loads(args[0])["added_keys"]
+    s3_client.head_object(Bucket=bucket_name, Key="harvested-metadata/airbus_sar_data.checkpoint")
+
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name} --resume".split())
+    assert result.exit_code == 0
+
+    # The first page is not harvested again, and its item is not treated as deleted
+    assert first_page_requests == 1
+    args, _kwargs = mock_producer.send.call_args
+    call_args = json.loads(args[0])
+    assert f"{items}/B.json" in call_args["added_keys"]
+    assert call_args["deleted_keys"] == [f"{items}/C.json"]
+
+    metadata_keys = [
+        obj["Key"] for obj in s3_client.list_objects_v2(Bucket=bucket_name, Prefix="harvested-metadata/")["Contents"]
+    ]
+    assert metadata_keys == ["harvested-metadata/airbus_sar_data", "harvested-metadata/airbus_sar_data.report.json"]
+    metadata = decode_state(s3_client.get_object(Bucket=bucket_name, Key="harvested-metadata/airbus_sar_data")["Body"])
+    assert {f"{items}/A.json", f"{items}/B.json"} <= set(metadata)
+    assert f"{items}/C.json" not in metadata
+
+
+@moto.mock_aws
+@patch("airbus_harvester.__main__.checkpoint_interval_pages", 1)
+@patch("airbus_harvester.__main__.minimum_message_entries", 1000)
+@patch("airbus_harvester.__main__.get_pulsar_client")
+def test_harvest__checkpoint_without_full_batch(
+    mock_create_client: Any, requests_mock: Any, mock_catalogue_response: dict
+) -> None:
+    url = "https://sar.api.oneatlas.airbus.com/v1/sar/catalogue/replication"
+    feature = mock_catalogue_response["features"][0]
+    first_page: dict[str, Any] = {
+        "features": [{**feature, "properties": {**feature["properties"], "acquisitionId": "A"}}],
+        "_links": {"next": f"{url}?page=2"},
+    }
+    second_page: dict[str, Any] = {
+        "features": [{**feature, "properties": {**feature["properties"], "acquisitionId": "B"}}],
+        "_links": {},
+    }
+    first_page_requests = second_page_requests = 0
+
+    def get_first_page(_request: Any, _context: Any) -> str:
+        nonlocal first_page_requests
+        first_page_requests += 1
+        return json.dumps(first_page)
+
+    def get_second_page(_request: Any, _context: Any) -> str:
+        nonlocal second_page_requests
+        second_page_requests += 1
+        if second_page_requests == 1:
+            # The harvest crashes, without a chance to save a checkpoint
+            raise RuntimeError("Killed")
+        return json.dumps(second_page)
+
+    requests_mock.get(url, text=get_first_page)
+    requests_mock.get(f"{url}?page=2", text=get_second_page)
+    requests_mock.post(
+        "https://authenticate.foundation.api.oneatlas.airbus.com/auth/realms/IDP/protocol/openid-connect/token",
+        text='{"access_token": "my_access_token"}',
+    )
+
+    mock_client = mock.MagicMock()
+    mock_producer = mock.MagicMock()
+    mock_create_client.return_value = mock_client
+    mock_client.create_producer.return_value = mock_producer
+
+    bucket_name = "my-bucket"
+    s3_client: Any = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket=bucket_name)
+    items = "commercial/catalogs/airbus/collections/airbus_sar_data/items"
+
+    os.environ["PULSAR_URL"] = "mypulsar.com/pulsar"
+    os.environ["HARVESTER_CONFIG_KEY"] = "SAR"
+
+    runner = CliRunner()
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name}".split())
+    assert isinstance(result.exception, RuntimeError)
+
+    # A checkpoint was saved after the first page, although too few items were harvested to fill a batch
+    checkpoint_key = "harvested-metadata/airbus_sar_data.checkpoint"
+    for _ in range(50):
+        if s3_client.list_objects_v2(Bucket=bucket_name, Prefix=checkpoint_key).get("KeyCount"):
+            break
+        time.sleep(0.1)
+    args, _kwargs = mock_producer.send.call_args
+    assert f"{items}/A.json" in json.loads(args[0])["added_keys"]
+    mock_producer.send.reset_mock()
+
+    result = runner.invoke(harvest, f"workspace catalogue {bucket_name} --resume".split())
+    assert result.exit_code == 0
+
+    # The harvest resumes after the first page, and its item is not treated as deleted
+    assert first_page_requests == 1
+    messages = [json.loads(args[0]) for args, _kwargs in mock_producer.send.call_args_list]
+    assert [key for message in messages for key in message["added_keys"] if key.startswith(items)] == [
+        f"{items}/B.json"
+    ]
+    assert all(message["deleted_keys"] == [] for message in messages)
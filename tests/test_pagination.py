@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import json
+import threading
+from collections import Counter
+from collections.abc import Generator, Iterator
+
+import pytest
+
+from airbus_harvester.pagination import (
+    PageCursor,
+    archive_start_date,
+    harvest_pages,
+    iter_pages,
+    prefetch,
+    split_date_range,
+)
+
+
+def make_feature(last_update_date: str) -> dict:
+    return {"properties": {"lastUpdateDate": last_update_date}}
+
+
+def test_iter_pages__link() -> None:
+    config = {"url": "https://test-url.co.uk/page1", "body": None, "pagination_method": "link"}
+    responses = {
+        "https://test-url.co.uk/page1": {"features": [], "_links": {"next": "https://test-url.co.uk/page2"}},
+        "https://test-url.co.uk/page2": {"features": [], "_links": {"self": "https://test-url.co.uk/page2"}},
+    }
+
+    pages = list(iter_pages(config, lambda url, _config: responses[url]))
+
+    assert [url for url, _body in pages] == ["https://test-url.co.uk/page1", "https://test-url.co.uk/page2"]
+
+
+def test_iter_pages__link_missing() -> None:
+    config = {"url": "https://test-url.co.uk/page1", "body": None, "pagination_method": "link"}
+
+    with pytest.raises(AttributeError):
+        list(iter_pages(config, lambda _url, _config: {"features": []}))
+
+
+def test_iter_pages__counter() -> None:
+    config = {"url": "https://test-url.co.uk/search", "body": {"startPage": 1}, "pagination_method": "counter"}
+    requested_bodies = []
+
+    def fetch(_url: str, page_config: dict) -> dict:
+        requested_bodies.append(dict(page_config["body"]))
+        if len(requested_bodies) > 52:
+            return {"features": []}
+        return {"features": [make_feature(f"2024-01-01T00:00:{len(requested_bodies):02}Z")]}
+
+    pages = list(iter_pages(config, fetch))
+
+    assert len(pages) == 53
+    assert [body["startPage"] for body in requested_bodies[:3]] == [1, 2, 3]
+    assert requested_bodies[49] == {"startPage": 50}
+    # The counter is reset after 50 pages, with the search narrowed to the last update seen
+    assert requested_bodies[50] == {
+        "startPage": 1,
+        "lastUpdateDate": f"[{archive_start_date},2024-01-01T00:00:50Z]",
+    }
+    assert requested_bodies[51]["startPage"] == 2
+    # The config passed in is left unchanged
+    assert config["body"] == {"startPage": 1}
+
+
+@pytest.mark.parametrize("item_count", [490, 990, 1010, 2500])
+def test_iter_pages__counter_returns_every_item(item_count: int) -> None:
+    # Items newest first, as requested with sortBy -lastUpdateDate, 10 to a page
+    dates = [f"2024-01-01T{i // 3600:02}:{i // 60 % 60:02}:{i % 60:02}Z" for i in reversed(range(item_count))]
+    config = {"url": "https://test-url.co.uk/search", "body": {"startPage": 1}, "pagination_method": "counter"}
+
+    def fetch(_url: str, page_config: dict) -> dict:
+        body = page_config["body"]
+        assert 1 <= body["startPage"] <= 50
+        matching = dates
+        if "lastUpdateDate" in body:
+            start, end = body["lastUpdateDate"][1:-1].split(",")
+            matching = [date for date in dates if start <= date <= end]
+        start_index = (body["startPage"] - 1) * 10
+        return {"features": [make_feature(date) for date in matching[start_index : start_index + 10]]}
+
+    pages = list(iter_pages(config, fetch))
+
+    # Every item is returned, past the 50 page limit. The last item before the search was narrowed
+    # is the only one returned twice
+    returned = Counter(feature["properties"]["lastUpdateDate"] for _url, body in pages for feature in body["features"])
+    assert set(returned) == set(dates)
+    assert max(returned.values()) <= 2
+
+
+def test_prefetch() -> None:
+    assert list(prefetch(iter(range(10)), depth=2)) == list(range(10))
+    assert list(prefetch(iter(range(10)), depth=0)) == list(range(10))
+
+
+def test_prefetch__fetches_ahead() -> None:
+    fetched = []
+    next_page_fetched = threading.Event()
+
+    def pages() -> Iterator[int]:
+        for page in range(3):
+            fetched.append(page)
+            if page == 1:
+                next_page_fetched.set()
+            yield page
+
+    iterator = prefetch(pages(), depth=1)
+    assert next(iterator) == 0
+    # Page 1 is requested while page 0 is still being processed
+    assert next_page_fetched.wait(timeout=5)
+    assert list(iterator) == [1, 2]
+
+
+def test_prefetch__error() -> None:
+    def pages() -> Iterator[int]:
+        yield 1
+        raise ConnectionError("Failed")
+
+    iterator = prefetch(pages(), depth=1)
+    assert next(iterator) == 1
+    with pytest.raises(ConnectionError):
+        next(iterator)
+
+
+def test_prefetch__stopped_early() -> None:
+    fetched = []
+
+    def pages() -> Iterator[int]:
+        for page in range(100):
+            fetched.append(page)
+            yield page
+
+    iterator = prefetch(pages(), depth=2)
+    assert isinstance(iterator, Generator)
+    assert next(iterator) == 0
+    iterator.close()
+
+    # No more than the look-ahead depth is fetched beyond the consumed page
+    assert len(fetched) <= 4
+
+
+def test_split_date_range() -> None:
+    date_ranges = split_date_range("2020-01-01T00:00:00Z", "2020-01-05T00:00:00Z", 4)
+
+    assert date_ranges == [
+        ("2020-01-04T00:00:00Z", "2020-01-05T00:00:00Z"),
+        ("2020-01-03T00:00:00Z", "2020-01-04T00:00:00Z"),
+        ("2020-01-02T00:00:00Z", "2020-01-03T00:00:00Z"),
+        ("2020-01-01T00:00:00Z", "2020-01-02T00:00:00Z"),
+    ]
+
+
+def test_harvest_pages__windows() -> None:
+    config = {"url": "https://test-url.co.uk/search", "body": {"startPage": 1}, "pagination_method": "counter"}
+    requested_ranges = []
+    lock = threading.Lock()
+
+    def fetch(_url: str, page_config: dict) -> dict:
+        body = page_config["body"]
+        with lock:
+            requested_ranges.append((body["lastUpdateDate"], body["startPage"]))
+        if body["startPage"] > 2:
+            return {"features": []}
+        return {"features": [make_feature(body["lastUpdateDate"][1:21])]}
+
+    pages = list(harvest_pages(config, fetch, windows=3, workers=2, depth=1))
+
+    # Each window is paged through separately with its own counter
+    assert len(pages) == 9
+    windows = {date_range for date_range, _start_page in requested_ranges}
+    assert len(windows) == 3
+    for window in windows:
+        assert sorted(page for date_range, page in requested_ranges if date_range == window) == [1, 2, 3]
+    assert min(windows).startswith(f"[{archive_start_date},")
+
+
+def test_harvest_pages__windows_ignored_for_link() -> None:
+    config = {"url": "https://test-url.co.uk/page1", "body": None, "pagination_method": "link"}
+
+    pages = list(harvest_pages(config, lambda _url, _config: {"_links": {}}, windows=3, workers=2, depth=1))
+
+    assert len(pages) == 1
+
+
+def test_page_cursor__from_position() -> None:
+    config = {"url": "https://test-url.co.uk/search", "body": {"startPage": 1}, "pagination_method": "counter"}
+    requested_bodies: list[dict] = []
+
+    def fetch(_url: str, page_config: dict) -> dict:
+        requested_bodies.append(dict(page_config["body"]))
+        return {"features": [make_feature(f"2024-01-01T00:00:{len(requested_bodies) % 60:02}Z")]}
+
+    cursor = PageCursor(config, ("2024-01-01T00:00:00Z", "2024-01-02T00:00:00Z"))
+    pages = iter_pages(config, fetch, cursor=cursor)
+    for _ in range(48):
+        next(pages)
+    position = json.loads(json.dumps(cursor.position()))
+    for _ in range(3):
+        next(pages)
+    expected = requested_bodies[48:]
+
+    # A cursor restored from the position requests the same pages as the original did
+    del requested_bodies[48:]
+    resumed = iter_pages(config, fetch, cursor=PageCursor.from_position(config, position))
+    for _ in range(3):
+        next(resumed)
+    assert requested_bodies[48:] == expected
+    assert [body["startPage"] for body in expected] == [49, 50, 1]
+
+
+def test_harvest_pages__cursors() -> None:
+    config = {"url": "https://test-url.co.uk/page1", "body": None, "pagination_method": "link"}
+    responses = {
+        "https://test-url.co.uk/page2": {"features": [], "_links": {"next": "https://test-url.co.uk/page3"}},
+        "https://test-url.co.uk/page3": {"features": [], "_links": {}},
+    }
+    cursor = PageCursor(config)
+    cursor.next_url = "https://test-url.co.uk/page2"
+    finished = PageCursor(config)
+    finished.next_url = None
+
+    pages = list(harvest_pages(config, lambda url, _config: responses[url], cursors=[finished, cursor], depth=0))
+
+    # Paging continues from the cursors, skipping windows which are finished
+    assert [(page.url, page.window) for page in pages] == [
+        ("https://test-url.co.uk/page2", 1),
+        ("https://test-url.co.uk/page3", 1),
+    ]
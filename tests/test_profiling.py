@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import pstats
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import boto3
+import moto
+import pytest
+
+from airbus_harvester.profiling import HarvestProfiler, StackSampler
+
+
+def busy_wait(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_stack_sampler() -> None:
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_wait, args=(stop,), name="busy")
+    worker.start()
+    sampler = StackSampler(interval=0.001)
+
+    sampler.start()
+    time.sleep(0.05)
+    sampler.stop()
+    stop.set()
+    worker.join()
+
+    assert sampler.samples > 0
+    lines = sampler.collapsed().decode().splitlines()
+    busy = [line for line in lines if line.startswith("busy;")]
+    assert busy
+    stack, count = busy[0].rsplit(" ", 1)
+    assert "tests.test_profiling:busy_wait" in stack.split(";")
+    assert int(count) > 0
+    # The sampler does not sample itself
+    assert not any(line.startswith("airbus-profiler;") for line in lines)
+
+
+def test_harvest_profiler__unknown_mode() -> None:
+    with pytest.raises(ValueError, match="Unknown profiling mode"):
+        HarvestProfiler("perf")
+
+
+def test_harvest_profiler__page_limit(tmp_path: Path) -> None:
+    profiler = HarvestProfiler("cprofile", max_pages=2, output_dir=str(tmp_path))
+
+    profiler.start()
+    sum(range(1000))
+    profiler.page_done()
+    assert profiler.running
+    profiler.page_done()
+    assert not profiler.running
+    profiler.page_done()
+    location = profiler.save("sar", "my-bucket", None)
+
+    assert profiler.pages == 3
+    assert Path(location).parent == tmp_path
+    assert location.endswith(".pstats")
+    stats = pstats.Stats(location)
+    assert stats.total_calls > 0  # type: ignore[attr-defined]
+
+
+def test_harvest_profiler__time_limit() -> None:
+    profiler = HarvestProfiler("sample", max_seconds=0.01)
+
+    profiler.start()
+    profiler.page_done()
+    assert profiler.running
+    time.sleep(0.02)
+    profiler.page_done()
+
+    assert not profiler.running
+
+
+@moto.mock_aws
+def test_harvest_profiler__save_s3() -> None:
+    s3_client: Any = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket="my-bucket")
+    profiler = HarvestProfiler("sample")
+
+    profiler.start()
+    time.sleep(0.02)
+    location = profiler.save("sar", "my-bucket", s3_client)
+
+    key = location.removeprefix("s3://my-bucket/")
+    assert key.startswith("harvest-profiles/sar-")
+    assert key.endswith(".collapsed")
+    s3_client.head_object(Bucket="my-bucket", Key=key)
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from airbus_harvester import serialization
+from airbus_harvester.serialization import canonical_dumps, dumps, loads
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> str:
+    if request.param == "json":
+        monkeypatch.setattr(serialization, "orjson", None)
+    elif serialization.orjson is None:
+        pytest.skip("orjson not installed")
+    return request.param
+
+
+def test_canonical_dumps__key_order(backend: str) -> None:
+    first = {"id": "item", "properties": {"b": 1, "a": [1.5, "é"]}, "bbox": [0.1, 2, 3, 4]}
+    second = {"bbox": [0.1, 2, 3, 4], "properties": {"a": [1.5, "é"], "b": 1}, "id": "item"}
+
+    assert canonical_dumps(first) == canonical_dumps(second)
+    assert canonical_dumps(first) == b'{"bbox":[0.1,2,3,4],"id":"item","properties":{"a":[1.5,"\xc3\xa9"],"b":1}}'
+
+
+def test_dumps__keeps_order(backend: str) -> None:
+    data = {"b": 1, "a": None}
+
+    assert dumps(data) == b'{"b":1,"a":null}'
+    assert loads(dumps(data)) == data
+
+
+def test_loads(backend: str) -> None:
+    assert loads('{"a": [1, 2]}') == loads(b'{"a": [1, 2]}') == {"a": [1, 2]}
+
+    with pytest.raises(json.JSONDecodeError):
+        loads(b"not json")
+
+
+def test_canonical_dumps__document_format(backend: str) -> None:
+    floats = {"a": 1e16, "b": 2.5e-05}
+
+    assert serialization.document_format() == ("canonical-json-orjson" if backend == "orjson" else "canonical-json")
+    assert canonical_dumps(floats) == canonical_dumps(floats, serialization.document_format())
+    assert canonical_dumps(floats, "canonical-json") == b'{"a":1e+16,"b":2.5e-05}'
+    with pytest.raises(ValueError, match="Unknown document format"):
+        canonical_dumps(floats, "yaml")
+
+
+def test_json_backend(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(serialization, "json_backend", "json")
+
+    assert not serialization._use_orjson()
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import struct
+
+import pytest
+
+from airbus_harvester import state_codec
+from airbus_harvester.state_codec import decode_state, encode_state, resolve_compression
+
+item_prefix = "commercial/catalogs/airbus/collections/airbus_spot_data/items/"
+
+
+@pytest.fixture
+def mock_metadata() -> dict:
+    metadata: dict = {f"{item_prefix}DS_SPOT7_{i:06d}.json": f"{i:016x}" for i in range(1000)}
+    metadata[f"{item_prefix}legacy.json"] = "0123456789abcdef0123456789abcdef"
+    metadata[f"{item_prefix}not-hex.json"] = "hash"
+    metadata[f"{item_prefix}UPPER.json"] = "ABCDEF"
+    metadata["commercial/catalogs/airbus.json"] = "0123456789abcdef"
+    metadata["summary"] = {"bbox": [1, 2, 3, 4], "start_time": "2024-01-01T00:00:00Z", "stop_time": None}
+    metadata["delta_sequence"] = 3
+    return metadata
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_encode_decode(mock_metadata: dict, compression: str) -> None:
+    if compression == "zstd" and state_codec.zstandard is None:
+        pytest.skip("zstandard not installed")
+
+    encoded = encode_state(mock_metadata, item_prefix, compression=compression)
+
+    assert encoded.startswith(b"ABHM")
+    assert len(encoded) < len(json.dumps(mock_metadata)) / 4
+    assert decode_state(io.BytesIO(encoded)) == mock_metadata
+
+
+def test_decode__json(mock_metadata: dict) -> None:
+    assert decode_state(io.BytesIO(json.dumps(mock_metadata).encode())) == mock_metadata
+
+
+def test_decode__truncated(mock_metadata: dict) -> None:
+    encoded = encode_state(mock_metadata, item_prefix, compression="gzip")
+
+    with pytest.raises((ValueError, EOFError)):
+        decode_state(io.BytesIO(encoded[: len(encoded) // 2]))
+
+
+def test_decode__unsupported_version(mock_metadata: dict) -> None:
+    encoded = bytearray(encode_state(mock_metadata, item_prefix, compression="gzip"))
+    encoded[4] = 99
+
+    with pytest.raises(ValueError, match="version"):
+        decode_state(io.BytesIO(bytes(encoded)))
+
+
+def test_resolve_compression(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert resolve_compression("gzip") == "gzip"
+
+    monkeypatch.setattr(state_codec, "zstandard", None)
+
+    assert resolve_compression("auto") == "gzip"
+    assert resolve_compression("zstd") == "gzip"
+    with pytest.raises(ValueError, match="zstandard"):
+        encode_state({}, item_prefix, compression="zstd")
+
+
+def test_encode_decode__fingerprints(mock_metadata: dict) -> None:
+    mock_metadata[f"{item_prefix}fingerprinted.json"] = "0123456789abcdef:fedcba9876543210"
+    mock_metadata[f"{item_prefix}empty-fingerprint.json"] = "0123456789abcdef:"
+
+    encoded = encode_state(mock_metadata, item_prefix, compression="gzip")
+
+    assert decode_state(io.BytesIO(encoded)) == mock_metadata
+
+
+def test_decode__version_1() -> None:
+    header = json.dumps({"item_prefix": item_prefix, "item_suffix": ".json", "blocks": 1, "other": {"a": 1}}).encode()
+    block = struct.pack("<IBI", 2, 2, 3) + b"a\nb" + bytes.fromhex("00ff0102")
+    payload = struct.pack("<I", len(header)) + header + block
+
+    decoded = decode_state(io.BytesIO(b"ABHM\x01\x01" + gzip.compress(payload)))
+
+    assert decoded == {"a": 1, f"{item_prefix}a.json": "00ff", f"{item_prefix}b.json": "0102"}
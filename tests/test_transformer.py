@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from airbus_harvester.__main__ import generate_stac_item, load_config
+from airbus_harvester.transformer import ExternalUrl, ItemTransformer
+
+
+@pytest.fixture
+def mock_feature() -> dict:
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Polygon", "coordinates": [[[0, 1], [2, 3], [1, 5], [0, 1]]]},
+        "properties": {
+            "acquisitionIdentifier": "DS_PNEO3_202401221042448",
+            "acquisitionId": "DS_PNEO3_202401221042448",
+            "acquisitionDate": "2024-01-22T10:42:44.800Z",
+            "lastUpdateDate": "2024-02-01T08:00:00.123Z",
+            "cloudCover": 2.5,
+            "geometryCentroid": [1, 2],
+            "processingLevel": "",
+            "productType": None,
+        },
+        "_links": {
+            "quicklook": {"href": "https://test-url.co.uk/quicklook.jpg"},
+            "thumbnail": {"href": "https://test-url.co.uk/thumbnail.png"},
+        },
+    }
+
+
+def test_item_transformer(mock_feature: dict) -> None:
+    config = load_config("airbus_harvester/config.json")["PNEO"]
+    transformer = ItemTransformer(config, "https://proxy.co.uk", "commercial")
+
+    item = transformer.transform(mock_feature)
+
+    assert item["id"] == "DS_PNEO3_202401221042448"
+    assert item["bbox"] == [0, 1, 2, 5]
+    assert item["properties"]["geometry_centroid"] == {"lat": 2, "lon": 1}
+    assert item["properties"]["eo:cloud_cover"] == 2.5
+    assert item["properties"]["updated"] == "2024-02-01T08:00:00.123Z"
+    assert "processing_level" not in item["properties"]
+    assert "product_type" not in item["properties"]
+
+
+def test_item_transformer__proxy(mock_feature: dict) -> None:
+    config = load_config("airbus_harvester/config.json")["PNEO"]
+    transformer = ItemTransformer(config, "https://proxy.co.uk", "commercial")
+
+    assets = transformer.transform(mock_feature)["assets"]
+
+    proxied = [url_config["name"] for url_config in config["external_urls"] if url_config.get("proxy")]
+    for name in proxied:
+        assert assets[name]["href"] == (
+            "https://proxy.co.uk/api/catalogue/stac/commercial/catalogs/airbus/collections/"
+            f"{config['collection_name']}/items/DS_PNEO3_202401221042448/{name}"
+        )
+        assert assets[f"external_{name}"]["href"].startswith("https://test-url.co.uk/")
+
+
+@pytest.mark.parametrize("config_key", ["SAR", "SPOT", "PHR", "PNEO"])
+def test_item_transformer__matches_generate_stac_item(mock_feature: dict, config_key: str) -> None:
+    config = load_config("airbus_harvester/config.json")[config_key]
+    transformer = ItemTransformer(config, "", "commercial")
+
+    # Reusing a transformer must give exactly the same output as a new one, including key order
+    for _ in range(2):
+        assert json.dumps(transformer.transform(mock_feature)) == json.dumps(generate_stac_item(mock_feature, config))
+
+
+def test_item_transformer__does_not_modify_config(mock_feature: dict) -> None:
+    config = load_config("airbus_harvester/config.json")["SPOT"]
+    original = json.dumps(config)
+    transformer = ItemTransformer(config, "", "commercial")
+
+    transformer.transform(mock_feature)
+    transformer.transform(mock_feature)
+
+    assert json.dumps(config) == original
+
+
+@pytest.mark.parametrize(
+    ("data", "expected"),
+    [
+        pytest.param({"a": {"b": "https://x.co.uk/file.TIF"}}, "image/tiff", id="present"),
+        pytest.param({"a": {"b": ""}}, None, id="empty"),
+        pytest.param({"a": {}}, None, id="missing"),
+        pytest.param({"a": {"b": {"href": "x"}}}, None, id="not_a_string"),
+    ],
+)
+def test_external_url(data: dict, expected: str | None) -> None:
+    assets: dict = {}
+    mapped_keys: set = set()
+
+    ExternalUrl("thumbnail", "a.b").add_asset(data, assets, mapped_keys)
+
+    if expected:
+        assert assets["thumbnail"]["type"].startswith(expected)
+        assert mapped_keys == {"b"}
+    else:
+        assert assets == {}
+        assert mapped_keys == set()
+
+
+@pytest.mark.parametrize("config_key", ["SAR", "SPOT", "PHR", "PNEO"])
+def test_item_transformer__item_times(mock_feature: dict, config_key: str) -> None:
+    config = load_config("airbus_harvester/config.json")[config_key]
+    mock_feature["properties"]["startTime"] = "2024-01-22T10:42:44.800Z"
+    mock_feature["properties"]["stopTime"] = "2024-01-22T10:42:46.800Z"
+    transformer = ItemTransformer(config, "", "commercial")
+
+    properties = transformer.transform(mock_feature)["properties"]
+
+    assert transformer.item_times(mock_feature)["properties"] == {
+        key: properties[key] for key in ("datetime", "start_datetime", "end_datetime") if key in properties
+    }
+
+
+def test_item_transformer__signature() -> None:
+    config = load_config("airbus_harvester/config.json")["SPOT"]
+
+    assert (
+        ItemTransformer(config, "", "commercial").signature() == ItemTransformer(config, "", "commercial").signature()
+    )
+    assert (
+        ItemTransformer(config, "", "commercial").signature() != ItemTransformer(config, "x", "commercial").signature()
+    )